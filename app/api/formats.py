@@ -0,0 +1,135 @@
+"""
+Response encodings for the curve endpoints (?format=).
+
+  rows      -- "points": [{field: value, ...}, ...]        (default)
+  columnar  -- "columns": {field: [v_0, ..., v_n-1]}, "length": n
+
+Row payloads repeat ~20 key names per point; the struct-of-arrays form
+names every field once and maps 1:1 onto a DataFrame
+(pd.DataFrame(result["columns"])). The nested per-point DDI warnings stay
+a list per point.
+
+Optional delta-encoded time axis (?time=delta): the ISO "timestamp"
+column is replaced by
+
+  "time_axis": {"start": t_0, "deltas_s": [0, t_1 - t_0, ..., t_n-1 - t_n-2]}
+
+so t_i = start + cumsum(deltas_s)[i]. On a regular grid every delta is
+the interval, which compresses to almost nothing on the wire.
+
+Arrow IPC (Accept: application/vnd.apache.arrow.stream) -- curve, range,
+intake, log and health endpoints answer with an Arrow IPC stream built
+from the same columns (DB tables straight from the cursor, see
+database.query_columns): "timestamp" becomes timestamp[us], the nested
+curve "warnings" a JSON string per point, and the non-tabular parts of a
+response (date, bands, ...) travel as JSON in the schema metadata under
+b"bio". /bio-score/range writes one record batch per day while
+streaming. pyarrow is optional; without it Arrow requests get 406.
+"""
+
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only needed for Arrow output
+    pa = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+FORMAT_PATTERN = "^(rows|columnar)$"
+TIME_PATTERN = "^(iso|delta)$"
+
+
+def time_axis(timestamps: list[str]) -> dict:
+    """Delta-encoded time axis of ISO timestamps (see module docstring)."""
+    if not timestamps:
+        return {"start": None, "deltas_s": []}
+    times = [datetime.fromisoformat(ts) for ts in timestamps]
+    deltas = [0] + [round((b - a).total_seconds()) for a, b in zip(times, times[1:])]
+    return {"start": timestamps[0], "deltas_s": deltas}
+
+
+def columnar(points: list[dict], delta_time: bool = False) -> dict:
+    """{"length", "columns"[, "time_axis"]} for a list of curve points."""
+    fields = list(points[0]) if points else []
+    columns = {field: [p[field] for p in points] for field in fields}
+    result = {"length": len(points)}
+    if delta_time and "timestamp" in columns:
+        result["time_axis"] = time_axis(columns.pop("timestamp"))
+    result["columns"] = columns
+    return result
+
+
+def encode_points(result: dict, fmt: str, time: str = "iso") -> dict:
+    """Re-encode result["points"] in place for ?format= / ?time= and return result."""
+    if fmt == "columnar":
+        result.update(columnar(result.pop("points"), time == "delta"))
+        result["format"] = "columnar"
+    return result
+
+
+# ── Arrow IPC ────────────────────────────────────────────────────────
+
+def wants_arrow(accept: Optional[str]) -> bool:
+    """True if the Accept header asks for an Arrow IPC stream."""
+    return ARROW_MEDIA_TYPE in (accept or "")
+
+
+def _arrow_values(columns: dict[str, list]) -> dict[str, list]:
+    out = {}
+    for name, values in columns.items():
+        if name == "timestamp":
+            values = [None if v is None else datetime.fromisoformat(v) for v in values]
+        elif name == "warnings":
+            values = [json.dumps(v) for v in values]
+        out[name] = values
+    return out
+
+
+def _ipc_chunks(batches: Iterable[dict[str, list]], metadata: Optional[dict]) -> Iterator[bytes]:
+    """IPC stream bytes; the schema is taken from the first batch, flushed once per batch."""
+    sink = io.BytesIO()
+    writer = schema = None
+    for columns in batches:
+        values = _arrow_values(columns)
+        if writer is None:
+            schema = pa.RecordBatch.from_pydict(values).schema
+            if metadata:
+                schema = schema.with_metadata({"bio": json.dumps(metadata)})
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(pa.RecordBatch.from_pydict(values, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
+
+def _require_arrow() -> None:
+    if pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow")
+
+
+def arrow_response(columns: dict[str, list], metadata: Optional[dict] = None) -> Response:
+    """One-batch Arrow IPC response for a {column: [values]} table."""
+    _require_arrow()
+    return Response(b"".join(_ipc_chunks([columns], metadata)), media_type=ARROW_MEDIA_TYPE)
+
+
+def arrow_stream_response(batches: Iterable[dict[str, list]],
+                          metadata: Optional[dict] = None) -> StreamingResponse:
+    """Arrow IPC stream, one record batch per yielded {column: [values]} table."""
+    _require_arrow()
+    return StreamingResponse(_ipc_chunks(batches, metadata), media_type=ARROW_MEDIA_TYPE)
+
+
+def rows_to_columns(rows: list[dict]) -> dict[str, list]:
+    """{column: [values]} of a list of row dicts (keys of the first row)."""
+    return {name: [r.get(name) for r in rows] for name in (rows[0] if rows else ())}
@@ -6,13 +6,13 @@ import json
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from app.config import (
-    API_KEY, ELVANSE_DEFAULT_DOSE_MG, MATE_CAFFEINE_MG,
-    MEDIKINET_DEFAULT_DOSE_MG, MEDIKINET_RETARD_DEFAULT_DOSE_MG,
-    CO_DAFALGAN_DEFAULT_DOSE_MG,
+    API_KEY, CURVE_ADAPTIVE_TOLERANCE, PK_MC_MAX_SAMPLES,
+    PLAN_MAX_DOSES, PLAN_MAX_OPTION_SPACE, PLAN_SLEEP_CAFFEINE_MAX_NG_ML,
     USER_WEIGHT_KG, USER_HEIGHT_CM, USER_AGE, USER_IS_FASTING,
     WATER_WATCH_TOKEN,
 )
@@ -24,7 +24,9 @@ from app.core.database import (
     query_intakes,
     query_subjective_logs,
     query_health_snapshots,
+    query_columns,
     query_meals,
+    get_intake,
     get_latest_intake,
     get_latest_health_snapshot,
     get_todays_intakes,
@@ -49,11 +51,25 @@ from app.core.database import (
     insert_weight,
     get_latest_weight,
     query_weight_log,
+    # Daily exposure
+    query_daily_exposure,
 )
 from app.core.bio_engine import (
-    compute_bio_score, generate_day_curve,
-    elvanse_effect_curve, check_ddi_warnings,
+    compute_bio_score,
+    check_ddi_warnings,
+    default_dose_mg, intake_lookback_h, lut_mode, resolve_fields,
 )
+from app.core.curve_engine import (
+    day_grid, day_window, generate_adaptive_day_curve, generate_range_curves,
+)
+from app.core.exposure import EXPOSURE_SPECS, compute_exposure, run_exposure_job
+from app.core.forecast import FORECAST_TARGETS, forecast_crossings
+from app.core.pairing import PAIR_MAX_OFFSET_H, pair_logs
+from app.core.pk_fit import fit_summary, personal_load_specs, run_fit_job
+from app.core.pk_uncertainty import concentration_bands
+from app.core.planner import candidate_options, optimize_plan
+from app.core.intake_series import US_PER_HOUR, IntakeSeries, to_epoch_us
+from app.core.score_cache import day_curves, intake_fingerprint, score_memo
 from app.core.water_engine import (
     compute_daily_goal,
     assess_hydration,
@@ -64,6 +80,16 @@ from app.core.water_engine import (
     generate_hydration_curve,
     generate_adaptive_curve,
 )
+from app.api.formats import (
+    FORMAT_PATTERN,
+    TIME_PATTERN,
+    arrow_response,
+    arrow_stream_response,
+    columnar,
+    encode_points,
+    rows_to_columns,
+    wants_arrow,
+)
 
 router = APIRouter(prefix="/api")
 
@@ -134,26 +160,19 @@ def log_intake(req: IntakeRequest):
     # Set default doses
     dose = req.dose_mg
     if dose is None:
-        if req.substance == "elvanse":
-            dose = ELVANSE_DEFAULT_DOSE_MG
-        elif req.substance == "mate":
-            dose = MATE_CAFFEINE_MG
-        elif req.substance == "medikinet":
-            dose = MEDIKINET_DEFAULT_DOSE_MG
-        elif req.substance == "medikinet_retard":
-            dose = MEDIKINET_RETARD_DEFAULT_DOSE_MG
-        elif req.substance == "co_dafalgan":
-            dose = CO_DAFALGAN_DEFAULT_DOSE_MG
+        dose = default_dose_mg(req.substance)
 
     row_id = insert_intake(req.substance, dose, req.notes, req.timestamp)
+    day_curves.add_intake(get_intake(row_id))
+    score_memo.invalidate()
 
     # Check DDI warnings on intake
     ddi_warnings = []
     if req.substance == "co_dafalgan":
         now = datetime.now()
-        today = now.strftime("%Y-%m-%d")
-        intakes = query_intakes(f"{today}T00:00:00", f"{today}T23:59:59")
-        ddi_warnings = check_ddi_warnings(intakes, now, weight_kg=_get_effective_weight())
+        weight = _get_effective_weight()
+        intakes = IntakeSeries.from_rows(query_intakes(*day_window(now, weight)))
+        ddi_warnings = check_ddi_warnings(intakes, now, weight_kg=weight)
 
     result = {"id": row_id, "substance": req.substance, "dose_mg": dose, "status": "ok"}
     if ddi_warnings:
@@ -182,16 +201,42 @@ def log_health(req: HealthSnapshotRequest):
     """Log a health data snapshot manually."""
     data = req.model_dump(exclude={"source", "timestamp"})
     row_id = insert_health_snapshot(data, req.source, req.timestamp)
+    score_memo.invalidate()
     return {"id": row_id, "status": "ok"}
 
 
+def _parse_fields(fields: Optional[str]) -> Optional[tuple[str, ...]]:
+    """Comma-separated ?fields= -> field names (None = all); 400 on unknown names."""
+    if not fields:
+        return None
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    try:
+        resolve_fields(selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return selected
+
+
+def _query_window(start: Optional[str], end: Optional[str], today: Optional[bool]) -> tuple[str, str]:
+    """[start, end] of a history query: today, explicit bounds or the last 24h."""
+    now = datetime.now()
+    if today:
+        return now.strftime("%Y-%m-%dT00:00:00"), now.strftime("%Y-%m-%dT23:59:59")
+    if start and end:
+        return start, end
+    return (now - timedelta(hours=24)).isoformat(), now.isoformat()
+
+
 @router.get("/intake", dependencies=[Depends(verify_api_key)])
 def get_intakes(
     start: Optional[str] = None,
     end: Optional[str] = None,
     today: bool = False,
+    accept: str = Header(default=""),
 ):
-    """Query intake events."""
+    """Query intake events (Arrow IPC with Accept: application/vnd.apache.arrow.stream)."""
+    if wants_arrow(accept):
+        return arrow_response(query_columns("intake_events", *_query_window(start, end, today)))
     if today:
         return get_todays_intakes()
     if start and end:
@@ -218,8 +263,11 @@ def get_logs(
     start: Optional[str] = None,
     end: Optional[str] = None,
     today: bool = False,
+    accept: str = Header(default=""),
 ):
-    """Query subjective logs."""
+    """Query subjective logs (Arrow IPC with Accept: application/vnd.apache.arrow.stream)."""
+    if wants_arrow(accept):
+        return arrow_response(query_columns("subjective_logs", *_query_window(start, end, today)))
     if today:
         return get_todays_logs()
     if start and end:
@@ -237,16 +285,15 @@ def get_health(
     end: Optional[str] = None,
     source: Optional[str] = None,
     today: Optional[bool] = None,
+    accept: str = Header(default=""),
 ):
-    """Query health snapshots. Optional source filter (ha/watch/manual) and today shortcut."""
-    if today:
-        now = datetime.now()
-        start = now.strftime("%Y-%m-%dT00:00:00")
-        end = now.strftime("%Y-%m-%dT23:59:59")
-    elif not (start and end):
-        now = datetime.now()
-        start = (now - timedelta(hours=24)).isoformat()
-        end = now.isoformat()
+    """
+    Query health snapshots. Optional source filter (ha/watch/manual) and today shortcut.
+    Arrow IPC with Accept: application/vnd.apache.arrow.stream.
+    """
+    start, end = _query_window(start, end, today)
+    if wants_arrow(accept):
+        return arrow_response(query_columns("health_snapshots", start, end, source))
     rows = query_health_snapshots(start, end)
     if source:
         rows = [r for r in rows if r.get("source") == source]
@@ -267,39 +314,65 @@ def get_bio_score(
     timestamp: Optional[str] = None,
     sleep_duration_min: Optional[float] = None,
     sleep_confidence: Optional[float] = None,
+    personal: bool = False,
+    fields: Optional[str] = None,
 ):
     """
     Compute Bio-Score for a given timestamp (default: now).
-    Uses today's intake history to calculate substance effects.
+    Uses today's intake history plus every earlier intake that can still
+    contribute (elimination lookback, see curve_engine.day_window).
+    personal=true uses the stored personal PK fit (see /api/model/fit).
+    fields=score,phase returns (and computes) only those fields.
+    Results are memoized per input set (score_cache.ScoreMemo); without a
+    timestamp the levels are those of the current minute, the returned
+    timestamp is the request time.
     """
-    target = datetime.fromisoformat(timestamp) if timestamp else datetime.now()
-
-    # Get today's intakes for curve calculation
-    today = target.strftime("%Y-%m-%d")
-    intakes = query_intakes(f"{today}T00:00:00", f"{today}T23:59:59")
+    selected = _parse_fields(fields)
+    need = resolve_fields(selected)
+    # "now" is bucketed to the minute so repeated polls share one memo entry
+    now = None if timestamp else datetime.now()
+    target = datetime.fromisoformat(timestamp) if timestamp else now.replace(second=0, microsecond=0)
 
     # Dynamic weight from DB / Google Fit
     weight = _get_effective_weight()
 
+    # Today's intakes plus the elimination lookback
+    rows = query_intakes(*day_window(target, weight))
+
     # Get health data (sleep + HRV) from latest snapshot if not provided
     hrv_ms = None
     resting_hr = None
+    snapshot_id = None
     if sleep_duration_min is None:
         latest = get_latest_health_snapshot()
         if latest:
+            snapshot_id = latest.get("id")
             sleep_duration_min = latest.get("sleep_duration")
             if sleep_confidence is None:
                 sleep_confidence = latest.get("sleep_confidence")
             hrv_ms = latest.get("hrv")
             resting_hr = latest.get("resting_hr")
 
-    result = compute_bio_score(
-        target, intakes, sleep_duration_min, sleep_confidence,
+    # The water goal is persisted as a side effect, so it runs on every request (not memoized)
+    water_ml = get_todays_water_total()
+    with_water = need is None or "hydration_modifier" in need
+    water_goal = _compute_today_goal().get("goal_ml") if with_water else None
+    key = (
+        target.isoformat(), intake_fingerprint(rows), weight, snapshot_id,
+        sleep_duration_min, sleep_confidence, hrv_ms, resting_hr, water_ml, water_goal,
+        personal_load_specs() if personal else None, selected,
+    )
+    result = score_memo.get_or_compute(key, lambda: compute_bio_score(
+        target, IntakeSeries.from_rows(rows), sleep_duration_min, sleep_confidence,
         hrv_ms=hrv_ms, resting_hr=resting_hr,
-        water_intake_ml=get_todays_water_total(),
-        water_goal_ml=_compute_today_goal().get("goal_ml"),
+        water_intake_ml=water_ml,
+        water_goal_ml=water_goal,
         weight_kg=weight,
-    )
+        personal_pk=personal,
+        fields=selected,
+    ))
+    if now is not None and "timestamp" in result:
+        result["timestamp"] = now.isoformat()
     return result
 
 
@@ -309,10 +382,27 @@ def get_bio_curve(
     interval: int = Query(default=15, ge=5, le=60),
     sleep_duration_min: Optional[float] = None,
     sleep_confidence: Optional[float] = None,
+    uncertainty: int = Query(default=0, ge=0, le=PK_MC_MAX_SAMPLES),
+    seed: Optional[int] = 0,
+    format: str = Query(default="rows", pattern=FORMAT_PATTERN),
+    time: str = Query(default="iso", pattern=TIME_PATTERN),
+    fields: Optional[str] = None,
+    adaptive: bool = False,
+    tolerance: float = Query(default=CURVE_ADAPTIVE_TOLERANCE, gt=0, le=0.1),
+    accept: str = Header(default=""),
 ):
     """
     Generate Bio-Score curve for a full day.
-    Returns data points at the given interval (minutes).
+    Returns data points at the given interval (minutes); fields=... restricts
+    (and lazily computes) the point fields like /bio-score.
+    adaptive=true returns an irregular grid instead (interval ignored),
+    refined where the levels bend until linear interpolation between the
+    points is within `tolerance` (relative level, curve_engine.adaptive_day_grid).
+    uncertainty=N adds Monte Carlo p5/p50/p95 concentration bands from
+    N sampled population parameter sets.
+    format=columnar returns one array per field instead of point dicts,
+    time=delta a delta-encoded time axis; Accept: application/vnd.apache.arrow.stream
+    an Arrow IPC table of the points (see api/formats.py).
     """
     if date:
         target_date = datetime.fromisoformat(date)
@@ -320,28 +410,132 @@ def get_bio_curve(
         target_date = datetime.now()
 
     day_str = target_date.strftime("%Y-%m-%d")
-    intakes = query_intakes(f"{day_str}T00:00:00", f"{day_str}T23:59:59")
 
     # Dynamic weight from DB / Google Fit
     weight = _get_effective_weight()
 
-    # Health data (sleep + HRV)
-    hrv_ms = None
-    resting_hr = None
+    # Sleep from latest snapshot
     if sleep_duration_min is None:
         latest = get_latest_health_snapshot()
         if latest:
             sleep_duration_min = latest.get("sleep_duration")
             if sleep_confidence is None:
                 sleep_confidence = latest.get("sleep_confidence")
-            hrv_ms = latest.get("hrv")
-            resting_hr = latest.get("resting_hr")
 
-    curve = generate_day_curve(
-        target_date, intakes, sleep_duration_min, sleep_confidence, interval,
-        hrv_ms=hrv_ms, resting_hr=resting_hr, weight_kg=weight,
+    # HRV / resting HR over the day: as-of join of the day's snapshots
+    # (from the previous day on, so the night's last reading carries over)
+    day_start = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    snapshots = query_health_snapshots(
+        (day_start - timedelta(days=1)).isoformat(), f"{day_str}T23:59:59",
     )
-    return {"date": day_str, "interval_minutes": interval, "points": curve}
+
+    if adaptive:
+        intakes = IntakeSeries.from_rows(query_intakes(*day_window(target_date, weight)))
+        times, curve = generate_adaptive_day_curve(
+            target_date, intakes, sleep_duration_min, sleep_confidence, weight,
+            snapshots=snapshots, fields=_parse_fields(fields), tolerance=tolerance,
+        )
+        result = {"date": day_str, "interval_minutes": None, "tolerance": tolerance,
+                  "points": curve}
+    else:
+        # Load arrays are cached per day and delta-updated on intake insert/delete
+        curve = day_curves.points(
+            target_date, interval, weight,
+            sleep_duration_min, sleep_confidence, snapshots=snapshots,
+            fields=_parse_fields(fields),
+        )
+        result = {"date": day_str, "interval_minutes": interval, "points": curve}
+    if uncertainty:
+        if not adaptive:
+            intakes = IntakeSeries.from_rows(query_intakes(*day_window(target_date, weight)))
+            times = day_grid(target_date, interval)
+        result["bands"] = concentration_bands(times, intakes, uncertainty, weight, seed)
+        result["samples"] = uncertainty
+    if wants_arrow(accept):
+        points = result.pop("points")
+        return arrow_response(columnar(points)["columns"], result)
+    return encode_points(result, format, time)
+
+
+@router.get("/bio-score/phases", dependencies=[Depends(verify_api_key)])
+def get_bio_phases(
+    date: Optional[str] = None,
+    interval: int = Query(default=15, ge=5, le=60),
+):
+    """
+    Phase timeline of a day as run-length intervals {start, end, phase}
+    (end exclusive), from the stimulant-level crossings on the cached day
+    curve instead of one phase string per point. `current` is the phase now
+    (today only).
+    """
+    target_date = datetime.fromisoformat(date) if date else datetime.now()
+    weight = _get_effective_weight()
+    segments = day_curves.phases(target_date, interval, weight)
+    now = datetime.now().isoformat()
+    current = next((seg["phase"] for seg in segments if seg["start"] <= now < seg["end"]), None)
+    return {
+        "date": target_date.strftime("%Y-%m-%d"),
+        "interval_minutes": interval,
+        "segments": segments,
+        "current": current,
+    }
+
+
+RANGE_MAX_DAYS = 92
+
+
+@router.get("/bio-score/range", dependencies=[Depends(verify_api_key)])
+def get_bio_range(
+    start: str,
+    end: str,
+    interval: int = Query(default=15, ge=5, le=60),
+    format: str = Query(default="rows", pattern=FORMAT_PATTERN),
+    time: str = Query(default="iso", pattern=TIME_PATTERN),
+    accept: str = Header(default=""),
+):
+    """
+    Bio-Score curves for every day in [start, end] as NDJSON (one line per day,
+    same shape as /bio-score/curve, including format / time). With
+    Accept: application/vnd.apache.arrow.stream an Arrow IPC stream with one
+    record batch per day (extra "date" column) instead. Intakes and health snapshots of the whole
+    window are loaded in one query each; days are computed while streaming.
+    """
+    start_date = datetime.fromisoformat(start)
+    end_date = datetime.fromisoformat(end)
+    n_days = (end_date.date() - start_date.date()).days + 1
+    if n_days < 1:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if n_days > RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range limited to {RANGE_MAX_DAYS} days")
+
+    weight = _get_effective_weight()
+    lo = start_date.strftime("%Y-%m-%dT00:00:00")
+    hi = end_date.strftime("%Y-%m-%dT23:59:59")
+    # Intakes from the first day's lookback on, so day 1 gets its carry-over too
+    intakes = IntakeSeries.from_rows(query_intakes(day_window(start_date, weight)[0], hi))
+    # Previous day too, so HRV / resting HR carry over into the first morning
+    snapshots = query_health_snapshots(
+        (datetime.fromisoformat(lo) - timedelta(days=1)).isoformat(), hi,
+    )
+
+    def _lines():
+        for day_str, points in generate_range_curves(
+            start_date, end_date, intakes, snapshots, interval, weight,
+        ):
+            yield json.dumps(encode_points(
+                {"date": day_str, "interval_minutes": interval, "points": points},
+                format, time,
+            )) + "\n"
+
+    def _batches():
+        for day_str, points in generate_range_curves(
+            start_date, end_date, intakes, snapshots, interval, weight,
+        ):
+            yield {"date": [day_str] * len(points), **columnar(points)["columns"]}
+
+    if wants_arrow(accept):
+        return arrow_stream_response(_batches(), {"interval_minutes": interval})
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
 
 @router.post("/webhook/ha/intake", dependencies=[Depends(verify_api_key)])
@@ -352,18 +546,11 @@ def ha_intake_webhook(req: IntakeRequest):
     """
     dose = req.dose_mg
     if dose is None:
-        if req.substance == "elvanse":
-            dose = ELVANSE_DEFAULT_DOSE_MG
-        elif req.substance == "mate":
-            dose = MATE_CAFFEINE_MG
-        elif req.substance == "medikinet":
-            dose = MEDIKINET_DEFAULT_DOSE_MG
-        elif req.substance == "medikinet_retard":
-            dose = MEDIKINET_RETARD_DEFAULT_DOSE_MG
-        elif req.substance == "co_dafalgan":
-            dose = CO_DAFALGAN_DEFAULT_DOSE_MG
+        dose = default_dose_mg(req.substance)
 
     row_id = insert_intake(req.substance, dose, req.notes, req.timestamp)
+    day_curves.add_intake(get_intake(row_id))
+    score_memo.invalidate()
     print(
         f"[bio-api] HA webhook: {req.substance} {dose}mg logged (#{row_id})",
         flush=True,
@@ -374,9 +561,12 @@ def ha_intake_webhook(req: IntakeRequest):
 @router.delete("/intake/{intake_id}", dependencies=[Depends(verify_api_key)])
 def delete_intake_route(intake_id: int):
     """Delete an intake event by ID."""
+    row = get_intake(intake_id)
     deleted = delete_intake(intake_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Intake not found")
+    day_curves.remove_intake(row)
+    score_memo.invalidate()
     return {"deleted": intake_id, "status": "ok"}
 
 
@@ -438,6 +628,9 @@ def status():
             "fasting": USER_IS_FASTING,
         },
         "model": "allometric-cascade-v2+hydration",
+        "pk_lut_mode": lut_mode(),
+        "curve_cache": day_curves.stats(),
+        "score_memo": score_memo.stats(),
     }
 
 
@@ -919,6 +1112,7 @@ class WeightRequest(BaseModel):
 def log_weight(req: WeightRequest):
     """Log a weight measurement."""
     row_id = insert_weight(req.weight_kg, req.source, req.timestamp)
+    score_memo.invalidate()
     return {"id": row_id, "weight_kg": req.weight_kg, "status": "ok"}
 
 
@@ -945,20 +1139,67 @@ def get_weight_latest():
 
 
 @router.get("/ddi-check", dependencies=[Depends(verify_api_key)])
-def ddi_check():
+def ddi_check(
+    timeline: bool = False,
+    date: Optional[str] = None,
+    interval: int = Query(default=15, ge=5, le=60),
+):
     """
-    Check current drug-drug interactions based on today's intakes.
-    Returns active DDI warnings.
+    Check current drug-drug interactions based on today's intakes
+    (plus the elimination lookback). Returns active DDI warnings.
+    timeline=true adds the warning intervals of the whole day (`date`,
+    default today) on the curve grid, and the ones not yet over
+    (end > now: running or ahead).
     """
     now = datetime.now()
-    today = now.strftime("%Y-%m-%d")
-    intakes = query_intakes(f"{today}T00:00:00", f"{today}T23:59:59")
-    warnings = check_ddi_warnings(intakes, now, weight_kg=_get_effective_weight())
-    return {
+    weight = _get_effective_weight()
+    intakes = IntakeSeries.from_rows(query_intakes(*day_window(now, weight)))
+    warnings = check_ddi_warnings(intakes, now, weight_kg=weight)
+    result = {
         "timestamp": now.isoformat(),
         "warnings": warnings,
         "warning_count": len(warnings),
     }
+    if timeline:
+        target_date = datetime.fromisoformat(date) if date else now
+        intervals = day_curves.ddi_timeline(target_date, interval, weight)
+        result["timeline"] = {
+            "date": target_date.strftime("%Y-%m-%d"),
+            "interval_minutes": interval,
+            "intervals": intervals,
+            "upcoming": [w for w in intervals if w["end"] > now.isoformat()],
+        }
+    return result
+
+
+EXPOSURE_MAX_WINDOW_H = 24 * 31
+
+
+@router.get("/exposure", dependencies=[Depends(verify_api_key)])
+def get_exposure(
+    substance: str = Query(..., pattern="^(elvanse|mate|medikinet|medikinet_retard|co_dafalgan)$"),
+    window: float = Query(default=24.0, gt=0, le=EXPOSURE_MAX_WINDOW_H),
+    at: Optional[str] = None,
+):
+    """
+    Cumulative logged dose of one substance over the trailing `window`
+    hours before `at` (default: now), from the cumulative-dose index
+    (IntakeSeries.window_dose: prefix sums, two binary searches), the same
+    lookup as the curves' paracetamol_24h_mg. co_dafalgan doses are mg paracetamol.
+    """
+    end = datetime.fromisoformat(at) if at else datetime.now()
+    window_us = round(window * US_PER_HOUR)
+    start = end - timedelta(microseconds=window_us)
+    series = IntakeSeries.from_rows(query_intakes(start.isoformat(), end.isoformat()))
+    count, total = series.window_dose(substance, to_epoch_us(end), window_us)
+    return {
+        "substance": substance,
+        "window_h": window,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "intake_count": int(count),
+        "total_mg": round(float(total), 1),
+    }
 
 
 @router.get("/log-reminder", dependencies=[Depends(verify_api_key)])
@@ -1042,9 +1283,12 @@ def get_model_fit():
     Analyze Elvanse intake + focus rating pairs to estimate
     personal pharmacokinetic response curve.
     Requires at least 15 pairs for meaningful results.
+    `personal_fit` is the latest stored PK fit (nightly job, never refit here).
     """
     import statistics
 
+    personal_fit = fit_summary()
+
     now = datetime.now()
     start = (now - timedelta(days=90)).isoformat()
     end = now.isoformat()
@@ -1052,42 +1296,31 @@ def get_model_fit():
     intakes = query_intakes(start, end)
     logs = query_subjective_logs(start, end)
 
-    elvanse_intakes = [i for i in intakes if i.get("substance") == "elvanse"]
-
-    if not elvanse_intakes or not logs:
+    if not any(i.get("substance") == "elvanse" for i in intakes) or not logs:
         return {
             "status": "insufficient_data",
             "pairs": 0,
             "required": 15,
             "message": "Noch nicht genug Daten. Bitte regelmassig loggen.",
+            "personal_fit": personal_fit,
         }
 
-    # Build pairs: for each focus log, find nearest preceding Elvanse intake
-    pairs = []
-    for log in logs:
-        focus = log.get("focus")
-        if focus is None:
-            continue
-        log_time = datetime.fromisoformat(log["timestamp"])
-
-        best_intake = None
-        best_offset = None
-        for ei in elvanse_intakes:
-            ei_time = datetime.fromisoformat(ei["timestamp"])
-            offset_h = (log_time - ei_time).total_seconds() / 3600
-            if 0 <= offset_h <= 16:
-                if best_offset is None or offset_h < best_offset:
-                    best_intake = ei
-                    best_offset = offset_h
-
-        if best_intake is not None:
-            predicted_level = elvanse_effect_curve(best_offset, best_intake.get("dose_mg") or 40)
-            pairs.append({
-                "offset_h": round(best_offset, 2),
-                "focus": focus,
-                "predicted_level": round(predicted_level, 3),
-                "dose_mg": best_intake.get("dose_mg"),
-            })
+    # Pairs: each focus log as-of joined onto the latest preceding Elvanse intake (<= 16h)
+    # dose_mg is reported as logged (None stays None); the level uses the standard dose
+    cols = pair_logs(logs, IntakeSeries.from_rows(intakes), "elvanse", "focus")
+    logged_dose = {i.get("id"): i.get("dose_mg") for i in intakes}
+    pairs = [
+        {
+            "offset_h": round(offset, 2),
+            "focus": int(focus),
+            "predicted_level": round(level, 3),
+            "dose_mg": logged_dose.get(intake_id),
+        }
+        for offset, focus, level, intake_id in zip(
+            cols["offset_h"].tolist(), cols["value"].tolist(),
+            cols["level"].tolist(), cols["intake_id"].tolist(),
+        )
+    ]
 
     if len(pairs) < 15:
         return {
@@ -1096,6 +1329,7 @@ def get_model_fit():
             "required": 15,
             "message": f"Noch {15 - len(pairs)} Paare noetig. Bitte 5x taeglich loggen.",
             "collected_pairs": pairs,
+            "personal_fit": personal_fit,
         }
 
     # Pearson correlation
@@ -1161,4 +1395,230 @@ def get_model_fit():
         "high_focus_count": len(high_focus_levels),
         "recommendation": " | ".join(rec_parts),
         "collected_pairs": pairs,
+        "personal_fit": personal_fit,
     }
+
+
+@router.get("/model/pairs", dependencies=[Depends(verify_api_key)])
+def get_model_pairs(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    substance: str = Query("elvanse", pattern="^(elvanse|mate|medikinet|medikinet_retard|co_dafalgan)$"),
+    field: str = Query("focus", pattern="^(focus|mood|energy|appetite|inner_unrest)$"),
+    max_offset_h: float = Query(PAIR_MAX_OFFSET_H, gt=0, le=72),
+):
+    """
+    Log <-> intake pairs as columns: every log with `field` set, joined onto
+    the latest preceding intake of `substance` (default: last 30 days).
+    """
+    now = datetime.now()
+    end = end or now.isoformat()
+    start = start or (now - timedelta(days=30)).isoformat()
+    lookback = (datetime.fromisoformat(start) - timedelta(hours=max_offset_h)).isoformat()
+    cols = pair_logs(
+        query_subjective_logs(start, end),
+        IntakeSeries.from_rows(query_intakes(lookback, end)),
+        substance, field, max_offset_h,
+    )
+    return {
+        "substance": substance,
+        "field": field,
+        "count": len(cols["offset_h"]),
+        "offset_h": [round(v, 3) for v in cols["offset_h"].tolist()],
+        field: cols["value"].tolist(),
+        "dose_mg": cols["dose_mg"].tolist(),
+        "level": [round(v, 4) for v in cols["level"].tolist()],
+    }
+
+
+@router.post("/model/fit", dependencies=[Depends(verify_api_key)])
+def refit_model(background_tasks: BackgroundTasks):
+    """Run the personal PK fit now (in the background) instead of waiting for the nightly job."""
+    background_tasks.add_task(run_fit_job, True)
+    return {"status": "scheduled", "current": fit_summary()}
+
+
+# --- Daily Exposure ---
+
+EXPOSURE_SUBSTANCE_PATTERN = "^(" + "|".join(spec.name for spec in EXPOSURE_SPECS) + ")$"
+
+
+@router.get("/exposure/daily", dependencies=[Depends(verify_api_key)])
+def get_daily_exposure(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    substance: Optional[str] = Query(None, pattern=EXPOSURE_SUBSTANCE_PATTERN),
+    live: bool = False,
+    accept: str = Header(default=""),
+):
+    """
+    Daily AUC / Cmax / Tmax / time above threshold per substance (default:
+    last 30 days). Stored rows from the nightly job; live=true computes the
+    window now instead (includes today, max RANGE_MAX_DAYS days).
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end_date = datetime.fromisoformat(end) if end else today
+    start_date = datetime.fromisoformat(start) if start else end_date - timedelta(days=29)
+    n_days = (end_date.date() - start_date.date()).days + 1
+    if n_days < 1:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if live:
+        if n_days > RANGE_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"Live range limited to {RANGE_MAX_DAYS} days")
+        rows = [r for r in compute_exposure(start_date, end_date, _get_effective_weight())
+                if substance is None or r["substance"] == substance]
+    else:
+        rows = query_daily_exposure(start_date.strftime("%Y-%m-%d"),
+                                    end_date.strftime("%Y-%m-%d"), substance)
+    if wants_arrow(accept):
+        return arrow_response(rows_to_columns(rows))
+    return rows
+
+
+@router.post("/exposure/daily/refresh", dependencies=[Depends(verify_api_key)])
+def refresh_daily_exposure(background_tasks: BackgroundTasks, full: bool = False):
+    """Run the daily exposure job now (in the background); full=true recomputes the whole backfill."""
+    background_tasks.add_task(run_exposure_job, None, full)
+    return {"status": "scheduled", "full": full}
+
+
+# --- Forecast ---
+
+@router.get("/forecast/crossings", dependencies=[Depends(verify_api_key)])
+def get_forecast_crossings(
+    target: str = Query(..., pattern="^(" + "|".join(FORECAST_TARGETS) + ")$"),
+    threshold: float = Query(..., ge=0),
+    unit: str = Query("ng_ml", pattern="^(ng_ml|level)$"),
+    start: Optional[str] = None,
+    hours: float = Query(24.0, gt=0, le=72),
+    direction: str = Query("any", pattern="^(any|up|down)$"),
+):
+    """
+    Exact times at which a substance (ng/ml, or unit=level) or the Bio-Score
+    (target=score) crosses `threshold` in [start, start + hours] (default:
+    from now), e.g. target=caffeine&threshold=400&direction=down. Brent's
+    method on the closed-form superposed curve, no curve sampling.
+    The score uses sleep / HRV from the latest health snapshot.
+    """
+    begin = datetime.fromisoformat(start) if start else datetime.now().replace(microsecond=0)
+    weight = _get_effective_weight()
+    lookback = timedelta(hours=intake_lookback_h(weight))
+    rows = query_intakes((begin - lookback).isoformat(),
+                         (begin + timedelta(hours=hours)).isoformat())
+    vitals = {}
+    if target == "score":
+        latest = get_latest_health_snapshot() or {}
+        vitals = {
+            "sleep_duration_min": latest.get("sleep_duration"),
+            "sleep_confidence": latest.get("sleep_confidence"),
+            "hrv_ms": latest.get("hrv"),
+            "resting_hr": latest.get("resting_hr"),
+        }
+    result = forecast_crossings(target, threshold, begin, hours, IntakeSeries.from_rows(rows),
+                                weight, unit, **vitals)
+    if direction != "any":
+        result["crossings"] = [c for c in result["crossings"] if c["direction"] == direction]
+    result["next"] = result["crossings"][0]["time"] if result["crossings"] else None
+    return result
+
+
+# --- Dose-Timing Optimizer ---
+
+class PlanCandidateRequest(BaseModel):
+    substance: str = Field(..., pattern="^(elvanse|mate|medikinet|medikinet_retard)$")
+    min_dose_mg: float = Field(..., gt=0, le=1000)
+    max_dose_mg: float = Field(..., gt=0, le=1000)
+    dose_step_mg: float = Field(default=10.0, ge=0.5, le=1000)
+    earliest: str = Field(..., pattern=r"^\d{2}:\d{2}$")
+    latest: str = Field(..., pattern=r"^\d{2}:\d{2}$")
+    optional: bool = True
+
+
+class PlanRequest(BaseModel):
+    date: Optional[str] = None
+    window_start: str = Field(default="09:00", pattern=r"^\d{2}:\d{2}$")
+    window_end: str = Field(default="17:00", pattern=r"^\d{2}:\d{2}$")
+    sleep_time: str = Field(default="23:00", pattern=r"^\d{2}:\d{2}$")
+    candidates: list[PlanCandidateRequest] = Field(..., min_length=1, max_length=4)
+    max_caffeine_at_sleep_ng_ml: float = Field(default=PLAN_SLEEP_CAFFEINE_MAX_NG_ML, ge=0)
+    step_minutes: int = Field(default=30, ge=5, le=120)
+    interval_minutes: int = Field(default=15, ge=5, le=60)
+    seed: int = 0
+
+
+def _at(day: datetime, hhmm: str, not_before: Optional[datetime] = None) -> datetime:
+    """HH:MM on `day`; rolls over to the next day if earlier than not_before."""
+    h, m = (int(x) for x in hhmm.split(":"))
+    if h > 23 or m > 59:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {hhmm}")
+    t = day.replace(hour=h, minute=m)
+    if not_before is not None and t <= not_before:
+        t += timedelta(days=1)
+    return t
+
+
+@router.post("/plan/optimize", dependencies=[Depends(verify_api_key)])
+def optimize_dose_plan(req: PlanRequest):
+    """
+    Search intake times and doses (one intake per candidate substance)
+    that maximize the mean Bio-Score over the focus window. Plans that add
+    a DDI warning or leave more caffeine than the limit at sleep time are
+    rejected. Already logged intakes of the day are kept fixed.
+    """
+    target = datetime.fromisoformat(req.date) if req.date else datetime.now()
+    day = target.replace(hour=0, minute=0, second=0, microsecond=0)
+    window_start = _at(day, req.window_start)
+    window_end = _at(day, req.window_end, window_start)
+    sleep_at = _at(day, req.sleep_time, window_end)
+
+    # Validate the size of the option space before enumerating anything
+    specs = []
+    total = 1
+    for c in req.candidates:
+        if c.max_dose_mg < c.min_dose_mg:
+            raise HTTPException(status_code=400, detail=f"{c.substance}: max_dose_mg < min_dose_mg")
+        earliest = _at(day, c.earliest)
+        latest = _at(day, c.latest)
+        if latest < earliest or latest >= sleep_at:
+            raise HTTPException(status_code=400, detail=f"{c.substance}: invalid time range")
+        n_doses = int((c.max_dose_mg - c.min_dose_mg) / c.dose_step_mg + 1e-9) + 1
+        if n_doses > PLAN_MAX_DOSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{c.substance}: {n_doses} dose levels (max {PLAN_MAX_DOSES}), increase dose_step_mg",
+            )
+        n_times = int((latest - earliest).total_seconds() // (60 * req.step_minutes)) + 1
+        total *= n_times * n_doses + (1 if c.optional else 0)
+        specs.append((c, n_doses, earliest, latest))
+    if total > PLAN_MAX_OPTION_SPACE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Option space too large ({total:.3g} schedules, max {PLAN_MAX_OPTION_SPACE:.3g})",
+        )
+
+    candidates = []
+    for c, n_doses, earliest, latest in specs:
+        doses = [round(c.min_dose_mg + i * c.dose_step_mg, 2) for i in range(n_doses)]
+        candidates.append(candidate_options(
+            c.substance, doses, earliest, latest, req.step_minutes, c.optional,
+        ))
+
+    weight = _get_effective_weight()
+    sleep_duration_min = sleep_confidence = hrv_ms = resting_hr = None
+    latest_snapshot = get_latest_health_snapshot()
+    if latest_snapshot:
+        sleep_duration_min = latest_snapshot.get("sleep_duration")
+        sleep_confidence = latest_snapshot.get("sleep_confidence")
+        hrv_ms = latest_snapshot.get("hrv")
+        resting_hr = latest_snapshot.get("resting_hr")
+
+    # Logged intakes from the elimination lookback up to sleep time
+    base_intakes = query_intakes(day_window(day, weight)[0], sleep_at.isoformat())
+
+    result = optimize_plan(
+        window_start, window_end, sleep_at, candidates, base_intakes,
+        req.max_caffeine_at_sleep_ng_ml,
+        sleep_duration_min, sleep_confidence, hrv_ms, resting_hr,
+        weight_kg=weight, interval_minutes=req.interval_minutes, seed=req.seed,
+    )
+    return {"date": day.strftime("%Y-%m-%d"), **result}
@@ -79,6 +79,10 @@ MEDIKINET_F = float(os.getenv("MEDIKINET_F", "0.30"))           # Bioavailabilit
 MEDIKINET_RETARD_DEFAULT_DOSE_MG = int(os.getenv("MEDIKINET_RETARD_DEFAULT_DOSE_MG", "30"))
 MEDIKINET_RETARD_KA = float(os.getenv("MEDIKINET_RETARD_KA", "1.2"))   # h^-1, collapsed uniform absorption
 MEDIKINET_RETARD_KE = float(os.getenv("MEDIKINET_RETARD_KE", "0.28"))  # h^-1, same elimination
+# Fed state: biphasic release (IR fraction + enteric-coated MR fraction via 2 transit compartments)
+MEDIKINET_RETARD_FED: bool = os.getenv("MEDIKINET_RETARD_FED", "false").lower() == "true"
+MEDIKINET_RETARD_FED_IR_FRACTION = float(os.getenv("MEDIKINET_RETARD_FED_IR_FRACTION", "0.5"))
+MEDIKINET_RETARD_FED_K_TR = float(os.getenv("MEDIKINET_RETARD_FED_K_TR", "0.8"))  # h^-1, MR transit
 
 # --- Caffeine (Lamate / Mate) ---
 # Kamimori et al. 2002, Seng et al. 2009
@@ -107,6 +111,49 @@ CMAX_REF = {
     "paracetamol": 10000.0,     # 500mg paracetamol (F ~90%)
 }
 
+# --- PK evaluation ---
+# Optional lookup-table mode for normalized PK shapes: off | linear | cubic
+# Tables are built once per parameter set (startup / config change).
+PK_LUT_MODE: str = os.getenv("PK_LUT_MODE", "off").lower()
+PK_LUT_STEP_H: float = float(os.getenv("PK_LUT_STEP_H", "0.01"))      # table resolution (h)
+PK_LUT_HORIZON_H: float = float(os.getenv("PK_LUT_HORIZON_H", "96"))  # beyond: analytic tail
+# Intake lookback: contribution horizons are solved for doses up to this
+# multiple of the reference dose (larger doses lose only their far tail)
+PK_HORIZON_DOSE_FACTOR: float = float(os.getenv("PK_HORIZON_DOSE_FACTOR", "3"))
+# Monte Carlo population variability (curve uncertainty bands)
+# Log-normal around the config values; CV = between-subject coefficient of variation
+PK_MC_CV_KA: float = float(os.getenv("PK_MC_CV_KA", "0.35"))    # absorption / hydrolysis rates
+PK_MC_CV_KE: float = float(os.getenv("PK_MC_CV_KE", "0.25"))    # elimination rate
+PK_MC_CV_VD: float = float(os.getenv("PK_MC_CV_VD", "0.20"))    # volume of distribution (Cmax ~ 1/Vd)
+PK_MC_MAX_SAMPLES: int = int(os.getenv("PK_MC_MAX_SAMPLES", "20000"))
+PK_MC_POOL_MIN_SAMPLES: int = int(os.getenv("PK_MC_POOL_MIN_SAMPLES", "1000"))  # below: in-process
+PK_MC_WORKERS: int = int(os.getenv("PK_MC_WORKERS", str(os.cpu_count() or 1)))
+# Personal PK fit (focus logs vs. predicted level, nightly background job)
+PK_FIT_DAYS: int = int(os.getenv("PK_FIT_DAYS", "90"))               # fit window (days of logs)
+PK_FIT_MIN_PAIRS: int = int(os.getenv("PK_FIT_MIN_PAIRS", "15"))     # focus logs with exposure per substance
+PK_FIT_MAX_LAG_H: float = float(os.getenv("PK_FIT_MAX_LAG_H", "2.0"))  # |time offset| bound (h)
+PK_FIT_HOUR: int = int(os.getenv("PK_FIT_HOUR", "3"))                # nightly run (local hour)
+# Daily exposure metrics (analytic AUC / Cmax / time above threshold, nightly job)
+EXPOSURE_THRESHOLD_FRACTION: float = float(os.getenv("EXPOSURE_THRESHOLD_FRACTION", "0.5"))  # x standard-dose Cmax
+EXPOSURE_SCAN_STEP_H: float = float(os.getenv("EXPOSURE_SCAN_STEP_H", "0.25"))  # root bracketing grid (h)
+EXPOSURE_BACKFILL_DAYS: int = int(os.getenv("EXPOSURE_BACKFILL_DAYS", "365"))   # first run (empty table)
+EXPOSURE_RECOMPUTE_DAYS: int = int(os.getenv("EXPOSURE_RECOMPUTE_DAYS", "3"))   # trailing days refreshed nightly
+EXPOSURE_JOB_HOUR: int = int(os.getenv("EXPOSURE_JOB_HOUR", "3"))               # nightly run (local hour)
+# Dose-timing optimizer (/api/plan/optimize)
+PLAN_MAX_CANDIDATES: int = int(os.getenv("PLAN_MAX_CANDIDATES", "200000"))        # above: random sample + refine
+PLAN_POOL_MIN_CANDIDATES: int = int(os.getenv("PLAN_POOL_MIN_CANDIDATES", "20000"))  # below: in-process
+PLAN_MAX_DOSES: int = int(os.getenv("PLAN_MAX_DOSES", "100"))                     # dose levels per candidate
+PLAN_MAX_OPTION_SPACE: int = int(os.getenv("PLAN_MAX_OPTION_SPACE", str(10**12)))  # product of all option counts
+PLAN_SLEEP_CAFFEINE_MAX_NG_ML: float = float(os.getenv("PLAN_SLEEP_CAFFEINE_MAX_NG_ML", "400"))
+# Per-day curve cache in the API process (delta-updated on intake insert/delete)
+CURVE_CACHE_DAYS: int = int(os.getenv("CURVE_CACHE_DAYS", "32"))          # cached (day, interval, weight) entries
+CURVE_CACHE_MAX_DELTAS: int = int(os.getenv("CURVE_CACHE_MAX_DELTAS", "256"))  # rebuild after n deltas (fp drift)
+SCORE_MEMO_SIZE: int = int(os.getenv("SCORE_MEMO_SIZE", "256"))             # memoized /bio-score results (LRU)
+# Adaptive curve sampling (/api/bio-score/curve?adaptive=true)
+CURVE_ADAPTIVE_TOLERANCE: float = float(os.getenv("CURVE_ADAPTIVE_TOLERANCE", "0.005"))  # max interpolation error (level)
+CURVE_ADAPTIVE_MIN_MINUTES: int = int(os.getenv("CURVE_ADAPTIVE_MIN_MINUTES", "1"))      # finest spacing
+CURVE_ADAPTIVE_MAX_MINUTES: int = int(os.getenv("CURVE_ADAPTIVE_MAX_MINUTES", "60"))     # coarse start grid
+
 # --- HA Sensor entity IDs ---
 # Note: all health sensors use the "_2" suffix (HealthSync via second device entry)
 HA_SENSORS = {
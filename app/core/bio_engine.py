@@ -9,6 +9,7 @@ Substances modeled:
 
   - Medikinet IR (Methylphenidate immediate release): Bateman function
   - Medikinet retard (Methylphenidate MR, FASTED): Collapsed single-peak Bateman
+      (MEDIKINET_RETARD_FED: biphasic IR + delayed MR fraction, linear compartment model)
   - Caffeine (Mate): Bateman with linear superposition (Heaviside)
   - Co-Dafalgan (Paracetamol 500mg + Codein 30mg): Bateman + DDI logic
 
@@ -32,9 +33,13 @@ Sources:
   - Kamimori et al., 2002, Seng et al., 2009 (Caffeine)
 """
 
+import functools
+import logging
 import math
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime
+from typing import Callable, Collection, Iterable, Optional, Union
+
+import numpy as np
 
 from app.config import (
     ELVANSE_DEFAULT_DOSE_MG,
@@ -47,10 +52,12 @@ from app.config import (
     MEDIKINET_RETARD_DEFAULT_DOSE_MG,
     MEDIKINET_RETARD_KA,
     MEDIKINET_RETARD_KE,
+    MEDIKINET_RETARD_FED,
+    MEDIKINET_RETARD_FED_IR_FRACTION,
+    MEDIKINET_RETARD_FED_K_TR,
     MATE_CAFFEINE_MG,
     CAFFEINE_KA,
     CAFFEINE_KE,
-    CO_DAFALGAN_DEFAULT_DOSE_MG,
     CO_DAFALGAN_CODEIN_KA,
     CO_DAFALGAN_CODEIN_KE,
     CO_DAFALGAN_PARACETAMOL_KA,
@@ -61,7 +68,26 @@ from app.config import (
     REFERENCE_WEIGHT_KG,
     USER_WEIGHT_KG,
     USER_IS_FASTING,
+    PK_LUT_MODE,
+    PK_LUT_STEP_H,
+    PK_LUT_HORIZON_H,
+    PK_HORIZON_DOSE_FACTOR,
+)
+from app.core.intake_series import (
+    DEFAULT_DOSE_MG,
+    IntakeLike,
+    IntakeSeries,
+    N_SUBSTANCES,
+    SUBSTANCE_CODES,
+    US_PER_HOUR,
+    as_intake_series,
+    to_epoch_us,
+    us_to_hours,
 )
+from app.core.compartment import CompartmentModel
+from app.core.pk_lut import LUT_MODES, ShapeTable
+
+log = logging.getLogger("bio.engine")
 
 
 # ── Allometric scaling ───────────────────────────────────────────────
@@ -83,14 +109,19 @@ def _bateman_raw(t: float, ka: float, ke: float) -> float:
     """
     Un-normalized Bateman function.
     C(t) = (ka / (ka - ke)) * (exp(-ke*t) - exp(-ka*t))
+    ka == ke (0/0 above) is evaluated by the compartment engine: ka*t*e^(-ka*t).
     """
-    if t <= 0 or ka == ke:
+    if t <= 0:
         return 0.0
+    if ka == ke:
+        return float(CompartmentModel.chain((ka, ke)).raw(np.array([t]))[0])
     return (ka / (ka - ke)) * (math.exp(-ke * t) - math.exp(-ka * t))
 
 
 def _bateman_tmax(ka: float, ke: float) -> float:
-    """Time of peak: tmax = ln(ka/ke) / (ka - ke)."""
+    """Time of peak: tmax = ln(ka/ke) / (ka - ke); 1/ka for ka == ke."""
+    if ka == ke and ka > 0:
+        return 1.0 / ka
     if ka <= ke or ka <= 0 or ke <= 0:
         return 1.0
     return math.log(ka / ke) / (ka - ke)
@@ -100,6 +131,10 @@ def _bateman_normalized(t: float, ka: float, ke: float) -> float:
     """Bateman function normalized so peak = 1.0."""
     if t <= 0:
         return 0.0
+    if _LUT_MODE != "off" and ka != ke:
+        table = shape_table("bateman", (ka, ke))
+        if table is not None:
+            return table(t)
     tmax = _bateman_tmax(ka, ke)
     c_max = _bateman_raw(tmax, ka, ke)
     if c_max <= 0:
@@ -120,12 +155,30 @@ def _bateman_normalized(t: float, ka: float, ke: float) -> float:
 def _cascade_raw(t: float, k_abs: float, k_hyd: float, k_e: float) -> float:
     """
     Three-compartment cascade analytical solution (un-normalized).
-    Returns the shape function value at time t.
+    Returns the shape function value at time t. Coincident rates (a zero
+    partial-fraction denominator) are evaluated by the compartment engine.
     """
     if t <= 0:
         return 0.0
+    terms = _cascade_terms(k_abs, k_hyd, k_e)
+    if len(terms) < 3:
+        return float(_cascade_chain(k_abs, k_hyd, k_e).raw(np.array([t]))[0])
+    return k_abs * k_hyd * sum(c * math.exp(-r * t) for r, c in terms)
+
+
+def _cascade_coincident(k_abs: float, k_hyd: float, k_e: float) -> bool:
+    """True if two rates (nearly) coincide, so the partial fractions do not exist."""
+    return len(_cascade_terms(k_abs, k_hyd, k_e)) < 3
+
+
+@functools.lru_cache(maxsize=None)
+def _cascade_terms(k_abs: float, k_hyd: float, k_e: float) -> tuple[tuple[float, float], ...]:
+    """
+    (r_i, 1 / PROD_{j!=i}(r_j - r_i)) pairs; coincident rates are skipped.
+    Cached per rate triple, so the scalar paths decide the dispatch once.
+    """
     rates = [k_abs, k_hyd, k_e]
-    result = 0.0
+    terms = []
     for i in range(3):
         ri = rates[i]
         denom = 1.0
@@ -134,8 +187,59 @@ def _cascade_raw(t: float, k_abs: float, k_hyd: float, k_e: float) -> float:
                 denom *= (rates[j] - ri)
         if abs(denom) < 1e-12:
             continue
-        result += math.exp(-ri * t) / denom
-    return k_abs * k_hyd * result
+        terms.append((ri, 1.0 / denom))
+    return tuple(terms)
+
+
+@functools.lru_cache(maxsize=None)
+def _cascade_chain(k_abs: float, k_hyd: float, k_e: float) -> CompartmentModel:
+    """Compartment chain for coincident cascade rates (cached per rate triple)."""
+    return CompartmentModel.chain((k_abs, k_hyd, k_e))
+
+
+def _cascade_tmax(k_abs: float, k_hyd: float, k_e: float) -> float:
+    """
+    Time of the cascade peak: root of dA/dt on (0, inf).
+
+    dA/dt   = -k_abs*k_hyd * SUM_i r_i   * e^(-r_i*t) / PROD_{j!=i}(r_j - r_i)
+    d2A/dt2 =  k_abs*k_hyd * SUM_i r_i^2 * e^(-r_i*t) / PROD_{j!=i}(r_j - r_i)
+
+    A(t) ~ k_abs*k_hyd*t^2/2 near 0, so dA/dt > 0 before the (single) peak
+    and < 0 after it. The root is bracketed by doubling, then refined with
+    Newton steps that fall back to bisection whenever a step leaves the
+    bracket. Converges in ~10 iterations (microseconds).
+    """
+    terms = _cascade_terms(k_abs, k_hyd, k_e)
+    if len(terms) < 3:
+        return _cascade_chain(k_abs, k_hyd, k_e).tmax
+
+    def slope(t: float) -> float:
+        return -sum(r * c * math.exp(-r * t) for r, c in terms)
+
+    def curvature(t: float) -> float:
+        return sum(r * r * c * math.exp(-r * t) for r, c in terms)
+
+    lo, hi = 0.0, 1.0
+    while slope(hi) > 0:
+        lo, hi = hi, hi * 2.0
+        if hi > 1e4:  # no interior peak (degenerate rates)
+            return hi
+
+    t = 0.5 * (lo + hi)
+    for _ in range(100):
+        f = slope(t)
+        if f > 0:
+            lo = t
+        else:
+            hi = t
+        fp = curvature(t)
+        t_new = t - f / fp if fp != 0 else 0.5 * (lo + hi)
+        if not (lo < t_new < hi):
+            t_new = 0.5 * (lo + hi)
+        if abs(t_new - t) <= 1e-12 * max(1.0, t):
+            return t_new
+        t = t_new
+    return t
 
 
 # Cache for cascade peak values (computed once per rate constant set)
@@ -143,16 +247,11 @@ _CASCADE_PEAK_CACHE: dict[tuple, float] = {}
 
 
 def _cascade_peak(k_abs: float, k_hyd: float, k_e: float) -> float:
-    """Find peak of cascade function numerically. Cached."""
+    """Peak value of the cascade function, A(tmax) with tmax from _cascade_tmax. Cached."""
     key = (round(k_abs, 6), round(k_hyd, 6), round(k_e, 6))
     if key in _CASCADE_PEAK_CACHE:
         return _CASCADE_PEAK_CACHE[key]
-    peak = 0.0
-    for i in range(1, 3001):  # 0.01h to 30h
-        t = i * 0.01
-        val = _cascade_raw(t, k_abs, k_hyd, k_e)
-        if val > peak:
-            peak = val
+    peak = max(0.0, _cascade_raw(_cascade_tmax(k_abs, k_hyd, k_e), k_abs, k_hyd, k_e))
     _CASCADE_PEAK_CACHE[key] = peak
     return peak
 
@@ -161,12 +260,343 @@ def _cascade_normalized(t: float, k_abs: float, k_hyd: float, k_e: float) -> flo
     """Cascade function normalized so peak = 1.0."""
     if t <= 0:
         return 0.0
+    if _LUT_MODE != "off" and not _cascade_coincident(k_abs, k_hyd, k_e):
+        table = shape_table("cascade", (k_abs, k_hyd, k_e))
+        if table is not None:
+            return table(t)
     peak = _cascade_peak(k_abs, k_hyd, k_e)
     if peak <= 0:
         return 0.0
     return max(0.0, _cascade_raw(t, k_abs, k_hyd, k_e) / peak)
 
 
+# ── Lookup-table mode for normalized shapes (PK_LUT_MODE) ────────────
+#
+# The normalized shapes are sums of exponentials, so a table is fully
+# described by (coeffs, rates). Tables are keyed by model + rate constants:
+# a config change (new rates) simply builds a new table. Linear compartment
+# models are keyed by the model itself; a defective one (coincident rates)
+# has no exponential-sum form and is always evaluated directly, as is a
+# shape whose table fails its build-time self-check.
+
+if PK_LUT_MODE not in LUT_MODES:
+    raise ValueError(f"PK_LUT_MODE must be one of {LUT_MODES}, got {PK_LUT_MODE!r}")
+_LUT_MODE = PK_LUT_MODE
+_SHAPE_TABLES: dict[tuple, Optional[ShapeTable]] = {}
+
+
+def _normalized_exp_terms(kind: str, params: tuple) -> tuple[list[float], list[float]]:
+    """(coeffs, rates) with normalized shape = SUM c_i e^(-r_i t)."""
+    if kind == "linear":
+        model, = params
+        return model.exp_terms() or ([], [])
+    if kind == "bateman":
+        ka, ke = params
+        if ka == ke:
+            return [], []
+        c_max = _bateman_raw(_bateman_tmax(ka, ke), ka, ke)
+        if c_max <= 0:
+            return [], []
+        k = ka / (ka - ke) / c_max
+        return [k, -k], [ke, ka]
+    k_abs, k_hyd, k_e = params
+    peak = _cascade_peak(k_abs, k_hyd, k_e)
+    if peak <= 0:
+        return [], []
+    terms = _cascade_terms(k_abs, k_hyd, k_e)
+    return [k_abs * k_hyd * c / peak for _, c in terms], [r for r, _ in terms]
+
+
+def shape_table(kind: str, params: tuple) -> Optional[ShapeTable]:
+    """
+    Cached ShapeTable for ("bateman", (ka, ke)), ("cascade", (k_abs, k_hyd, k_e))
+    or ("linear", (CompartmentModel,)). None (cached as well) if the table
+    fails its self-check; callers then evaluate the analytic shape.
+    """
+    key = (kind, *params)
+    if key in _SHAPE_TABLES:
+        return _SHAPE_TABLES[key]
+    coeffs, rates = _normalized_exp_terms(kind, params)
+    try:
+        table = ShapeTable(coeffs, rates, PK_LUT_STEP_H, PK_LUT_HORIZON_H,
+                           _LUT_MODE if _LUT_MODE != "off" else "cubic")
+    except ValueError as exc:
+        log.warning("PK LUT %s %s rejected, using the analytic shape: %s", kind, params, exc)
+        table = None
+    _SHAPE_TABLES[key] = table
+    return table
+
+
+def set_lut_mode(mode: str) -> None:
+    """Switch LUT mode at runtime (off | linear | cubic) and drop stale tables."""
+    global _LUT_MODE
+    if mode not in LUT_MODES:
+        raise ValueError(f"LUT mode must be one of {LUT_MODES}")
+    _LUT_MODE = mode
+    _SHAPE_TABLES.clear()
+
+
+def lut_mode() -> str:
+    return _LUT_MODE
+
+
+# ── Substance registry ───────────────────────────────────────────────
+#
+# One SubstanceSpec per modeled compound. Model type, rate constants, Cmax,
+# reference/default dose and the normalization peak are resolved once at
+# import; hot paths look specs up by integer intake code (SPECS_BY_CODE)
+# instead of branching on substance strings.
+#
+#   dose_factor   = dose_mg * dose_scale / ref_dose_mg
+#   level(t)      = shape(t) * dose_factor                  (0-1 at ref dose peak)
+#   conc(t)       = Cmax_user * dose_factor * shape(t)      (ng/ml)
+#
+# lag_h is an absorption lag (shape(t - lag_h)); 0 for the population
+# specs, set by the personal PK fit (pk_fit.personal_load_specs).
+#
+# model is "bateman" / "cascade" (analytic fast paths) or "linear": any
+# CompartmentModel, rates = one constant per flow. Every spec carries its
+# compartment form (Bateman and cascade are chains); analytic specs with
+# coincident rates are switched to "linear", where the engine stays exact.
+#
+# dose_scale maps the logged dose to the compound dose (Co-Dafalgan is
+# logged as mg paracetamol; codein = paracetamol * CODEIN_RATIO).
+
+class SubstanceSpec:
+    """PK constants of one modeled compound (see registry comment above)."""
+
+    __slots__ = ("name", "intake", "code", "model", "rates", "cmax_ref",
+                 "ref_dose_mg", "dose_scale", "default_dose_mg", "tmax_h",
+                 "peak", "cmax_user", "lag_h", "compartments")
+
+    def __init__(self, name: str, intake: str, model: str, rates: tuple,
+                 ref_dose_mg: float, dose_scale: float = 1.0, lag_h: float = 0.0,
+                 compartments: Optional[CompartmentModel] = None):
+        if model not in ("bateman", "cascade", "linear"):
+            raise ValueError(f"Unknown PK model: {model}")
+        if model == "linear" and compartments is None:
+            raise ValueError("Linear PK model needs a CompartmentModel")
+        self.name = name
+        self.intake = intake
+        self.code = SUBSTANCE_CODES[intake]
+        self.rates = tuple(rates)
+        self.compartments = (compartments or CompartmentModel.chain(self.rates)).with_rates(self.rates)
+        if (model == "bateman" and self.rates[0] == self.rates[1]) or (
+                model == "cascade" and _cascade_coincident(*self.rates)):
+            model = "linear"
+        self.model = model
+        self.cmax_ref = CMAX_REF[name]
+        self.ref_dose_mg = ref_dose_mg
+        self.dose_scale = dose_scale
+        self.default_dose_mg = DEFAULT_DOSE_MG[intake]
+        if model == "cascade":
+            self.tmax_h = _cascade_tmax(*self.rates)
+            self.peak = _cascade_peak(*self.rates)
+        elif model == "linear":
+            self.tmax_h = self.compartments.tmax
+            self.peak = self.compartments.peak
+        else:
+            self.tmax_h = _bateman_tmax(*self.rates)
+            self.peak = _bateman_raw(self.tmax_h, *self.rates)
+        self.cmax_user = allometric_cmax(self.cmax_ref, USER_WEIGHT_KG)
+        self.lag_h = lag_h
+
+    def __repr__(self) -> str:
+        return f"SubstanceSpec({self.name!r}, {self.model}, rates={self.rates})"
+
+    def cmax(self, weight_kg: float = USER_WEIGHT_KG) -> float:
+        """Allometric Cmax (ng/ml at ref dose); precomputed for the configured weight."""
+        if weight_kg == USER_WEIGHT_KG:
+            return self.cmax_user
+        return allometric_cmax(self.cmax_ref, weight_kg)
+
+    def dose_factor(self, dose_mg: float) -> float:
+        return dose_mg * self.dose_scale / self.ref_dose_mg
+
+    def normalized(self, t: float) -> float:
+        """Analytic shape normalized so peak = 1.0 (peak precomputed)."""
+        if t <= 0 or self.peak <= 0:
+            return 0.0
+        if self.model == "cascade":
+            return max(0.0, _cascade_raw(t, *self.rates) / self.peak)
+        if self.model == "linear":
+            return self.compartments.normalized_scalar(t)
+        return max(0.0, _bateman_raw(t, *self.rates) / self.peak)
+
+    def table(self) -> Optional[ShapeTable]:
+        """Lookup table for the active LUT mode; None if off or the shape has no exponential-sum form."""
+        if _LUT_MODE == "off":
+            return None
+        if self.model == "linear":
+            if self.compartments.exp_terms() is None:
+                return None
+            return shape_table("linear", (self.compartments,))
+        return shape_table(self.model, self.rates)
+
+    def shape_terms(self) -> Optional[tuple[list[float], list[int], list[float]]]:
+        """
+        (coeffs, powers, decay rates) with normalized shape = SUM c_i t^p_i e^(-r_i t):
+        the analytic Bateman / cascade terms (p = 0), the compartment terms for
+        "linear" specs. None if the model has no such form.
+        """
+        if self.model == "linear":
+            return self.compartments.shape_terms()
+        coeffs, rates = _normalized_exp_terms(self.model, self.rates)
+        return coeffs, [0] * len(coeffs), rates
+
+    def shape_fn(self) -> Callable[[float], float]:
+        """Scalar t -> normalized shape for the active LUT mode (resolve once per loop)."""
+        return self.table() or self.normalized
+
+    def level(self, hours: float, dose_mg: float) -> float:
+        return self.shape_fn()(hours - self.lag_h) * self.dose_factor(dose_mg)
+
+    def concentration(self, hours: float, dose_mg: float,
+                      weight_kg: float = USER_WEIGHT_KG) -> float:
+        return (self.cmax(weight_kg) * self.dose_factor(dose_mg)
+                * self.shape_fn()(hours - self.lag_h))
+
+
+def _medikinet_retard_spec() -> SubstanceSpec:
+    """
+    Fasted (default): collapsed single-peak Bateman. Fed (MEDIKINET_RETARD_FED):
+    biphasic linear model, the IR fraction absorbed directly and the
+    enteric-coated MR fraction through two transit compartments first:
+
+      0 IR gut --ka--> 3 central --ke--> out
+      1 MR pellets --k_tr--> 2 MR gut --k_tr--> 3 central
+    """
+    if not MEDIKINET_RETARD_FED:
+        return SubstanceSpec("medikinet_retard", "medikinet_retard", "bateman",
+                             (MEDIKINET_RETARD_KA, MEDIKINET_RETARD_KE),
+                             MEDIKINET_RETARD_DEFAULT_DOSE_MG)
+    f_ir = MEDIKINET_RETARD_FED_IR_FRACTION
+    model = CompartmentModel(
+        4, [(0, 3), (1, 2), (2, 3), (3, None)],
+        (MEDIKINET_RETARD_KA, MEDIKINET_RETARD_FED_K_TR, MEDIKINET_RETARD_FED_K_TR,
+         MEDIKINET_RETARD_KE),
+        (f_ir, 1.0 - f_ir, 0.0, 0.0), observe=3,
+    )
+    return SubstanceSpec("medikinet_retard", "medikinet_retard", "linear", model.rates,
+                         MEDIKINET_RETARD_DEFAULT_DOSE_MG, compartments=model)
+
+
+SUBSTANCES: dict[str, SubstanceSpec] = {spec.name: spec for spec in (
+    SubstanceSpec("elvanse", "elvanse", "cascade",
+                  (ELVANSE_KA_ABS, ELVANSE_KA, ELVANSE_KE), ELVANSE_DEFAULT_DOSE_MG),
+    SubstanceSpec("medikinet_ir", "medikinet", "bateman",
+                  (MEDIKINET_IR_KA, MEDIKINET_IR_KE), MEDIKINET_DEFAULT_DOSE_MG),
+    _medikinet_retard_spec(),
+    SubstanceSpec("caffeine", "mate", "bateman",
+                  (CAFFEINE_KA, CAFFEINE_KE), MATE_CAFFEINE_MG),
+    SubstanceSpec("codein", "co_dafalgan", "bateman",
+                  (CO_DAFALGAN_CODEIN_KA, CO_DAFALGAN_CODEIN_KE), 30.0,  # ref: 30mg codein
+                  dose_scale=CODEIN_RATIO),
+    SubstanceSpec("paracetamol", "co_dafalgan", "bateman",
+                  (CO_DAFALGAN_PARACETAMOL_KA, CO_DAFALGAN_PARACETAMOL_KE), 500.0),
+)}
+
+# Compounds released by each intake code (co_dafalgan -> codein + paracetamol)
+SPECS_BY_CODE: tuple[tuple[SubstanceSpec, ...], ...] = tuple(
+    tuple(spec for spec in SUBSTANCES.values() if spec.code == code)
+    for code in range(N_SUBSTANCES)
+)
+
+# Superposed by the kernels: (spec, also sum the relative level?)
+LOAD_SPECS: tuple[tuple[SubstanceSpec, bool], ...] = (
+    (SUBSTANCES["elvanse"], True),
+    (SUBSTANCES["medikinet_ir"], True),
+    (SUBSTANCES["medikinet_retard"], True),
+    (SUBSTANCES["caffeine"], True),
+    (SUBSTANCES["codein"], False),
+)
+
+
+# ── Contribution horizon (intake lookback) ───────────────────────────
+#
+# Past its peak every shape decays monotonically, and the kernels drop an
+# intake once level <= LEVEL_CUTOFF or ng/ml <= NGML_CUTOFF. Solving
+#
+#   df * shape(t) = LEVEL_CUTOFF   and   Cmax_user * df * shape(t) = NGML_CUTOFF
+#
+# for t > tmax (df = PK_HORIZON_DOSE_FACTOR, the largest dose multiple we
+# account for) gives the time after which an intake no longer contributes.
+# The longest horizon (at least the 24h paracetamol window) is the lookback
+# the intake loaders need before the start of a day.
+
+LEVEL_CUTOFF = 0.005
+NGML_CUTOFF = 0.01
+PARACETAMOL_WINDOW_H = 24.0
+
+_LOOKBACK_CACHE: dict[float, float] = {}
+
+
+def _decay_time(spec: SubstanceSpec, threshold: float) -> float:
+    """First t > tmax with normalized shape <= threshold (doubling + bisection)."""
+    if spec.peak <= 0 or threshold >= 1.0:
+        return 0.0
+    lo = spec.tmax_h
+    hi = max(2.0 * lo, 1.0)
+    while spec.normalized(hi) > threshold:
+        lo, hi = hi, hi * 2.0
+        if hi > 1e4:
+            return hi
+    while hi - lo > 1e-6:
+        mid = 0.5 * (lo + hi)
+        if spec.normalized(mid) > threshold:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def contribution_horizon_h(spec: SubstanceSpec, with_level: bool = True,
+                           weight_kg: float = USER_WEIGHT_KG) -> float:
+    """Hours after intake beyond which the kernels ignore this spec's contribution."""
+    df = PK_HORIZON_DOSE_FACTOR * spec.dose_factor(spec.default_dose_mg)
+    threshold = NGML_CUTOFF / (spec.cmax(weight_kg) * df)
+    if with_level:
+        threshold = min(threshold, LEVEL_CUTOFF / df)
+    return _decay_time(spec, threshold)
+
+
+def intake_lookback_h(weight_kg: float = USER_WEIGHT_KG) -> float:
+    """Longest contribution horizon over all superposed substances (cached per weight)."""
+    lookback = _LOOKBACK_CACHE.get(weight_kg)
+    if lookback is None:
+        lookback = max(
+            [PARACETAMOL_WINDOW_H]
+            + [contribution_horizon_h(spec, with_level, weight_kg)
+               for spec, with_level in LOAD_SPECS]
+        )
+        _LOOKBACK_CACHE[weight_kg] = lookback
+    return lookback
+
+
+def default_dose_mg(substance: str) -> Optional[float]:
+    """Standard dose for an intake substance, None if it has no PK model ('other')."""
+    code = SUBSTANCE_CODES.get(substance)
+    if code is None or not SPECS_BY_CODE[code]:
+        return None
+    return SPECS_BY_CODE[code][0].default_dose_mg
+
+
+def warm_shape_tables() -> dict[str, dict]:
+    """
+    Build the tables for all registered substances (called at startup).
+    Returns per-substance error bound and measured max error vs. analytic.
+    """
+    if _LUT_MODE == "off":
+        return {}
+    report = {}
+    for name, spec in SUBSTANCES.items():
+        table = spec.table()
+        if table is None:
+            continue
+        report[name] = {"error_bound": table.error_bound, "max_error": table.max_error}
+    return report
+
+
 # ── Concentration calculators (absolute ng/ml) ───────────────────────
 
 def elvanse_concentration(hours: float, dose_mg: float = 40.0,
@@ -175,56 +605,37 @@ def elvanse_concentration(hours: float, dose_mg: float = 40.0,
     d-Amphetamine plasma concentration from Elvanse (ng/ml).
     Three-stage cascade model with allometric Cmax scaling.
     """
-    cmax = allometric_cmax(CMAX_REF["elvanse"], weight_kg)
-    dose_factor = dose_mg / ELVANSE_DEFAULT_DOSE_MG
-    level = _cascade_normalized(hours, ELVANSE_KA_ABS, ELVANSE_KA, ELVANSE_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["elvanse"].concentration(hours, dose_mg, weight_kg)
 
 
 def medikinet_ir_concentration(hours: float, dose_mg: float = 10.0,
                                weight_kg: float = USER_WEIGHT_KG) -> float:
     """Methylphenidate IR plasma concentration (ng/ml)."""
-    cmax = allometric_cmax(CMAX_REF["medikinet_ir"], weight_kg)
-    dose_factor = dose_mg / MEDIKINET_DEFAULT_DOSE_MG
-    level = _bateman_normalized(hours, MEDIKINET_IR_KA, MEDIKINET_IR_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["medikinet_ir"].concentration(hours, dose_mg, weight_kg)
 
 
 def medikinet_retard_concentration(hours: float, dose_mg: float = 30.0,
                                    weight_kg: float = USER_WEIGHT_KG) -> float:
     """Methylphenidate MR concentration (ng/ml). FASTED: collapsed single peak."""
-    cmax = allometric_cmax(CMAX_REF["medikinet_retard"], weight_kg)
-    dose_factor = dose_mg / MEDIKINET_RETARD_DEFAULT_DOSE_MG
-    level = _bateman_normalized(hours, MEDIKINET_RETARD_KA, MEDIKINET_RETARD_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["medikinet_retard"].concentration(hours, dose_mg, weight_kg)
 
 
 def caffeine_concentration(hours: float, dose_mg: float = 76.0,
                            weight_kg: float = USER_WEIGHT_KG) -> float:
     """Caffeine plasma concentration (ng/ml)."""
-    cmax = allometric_cmax(CMAX_REF["caffeine"], weight_kg)
-    dose_factor = dose_mg / MATE_CAFFEINE_MG
-    level = _bateman_normalized(hours, CAFFEINE_KA, CAFFEINE_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["caffeine"].concentration(hours, dose_mg, weight_kg)
 
 
 def codein_concentration(hours: float, dose_paracetamol_mg: float = 500.0,
                          weight_kg: float = USER_WEIGHT_KG) -> float:
     """Codein plasma concentration from Co-Dafalgan (ng/ml)."""
-    codein_dose = dose_paracetamol_mg * CODEIN_RATIO
-    cmax = allometric_cmax(CMAX_REF["codein"], weight_kg)
-    dose_factor = codein_dose / 30.0  # reference: 30mg codein
-    level = _bateman_normalized(hours, CO_DAFALGAN_CODEIN_KA, CO_DAFALGAN_CODEIN_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["codein"].concentration(hours, dose_paracetamol_mg, weight_kg)
 
 
 def paracetamol_concentration(hours: float, dose_mg: float = 500.0,
                               weight_kg: float = USER_WEIGHT_KG) -> float:
     """Paracetamol plasma concentration from Co-Dafalgan (ng/ml)."""
-    cmax = allometric_cmax(CMAX_REF["paracetamol"], weight_kg)
-    dose_factor = dose_mg / 500.0  # reference: 500mg paracetamol
-    level = _bateman_normalized(hours, CO_DAFALGAN_PARACETAMOL_KA, CO_DAFALGAN_PARACETAMOL_KE)
-    return cmax * dose_factor * level
+    return SUBSTANCES["paracetamol"].concentration(hours, dose_mg, weight_kg)
 
 
 # ── Relative level calculators (0-1 at standard dose peak) ───────────
@@ -232,33 +643,27 @@ def paracetamol_concentration(hours: float, dose_mg: float = 500.0,
 
 def elvanse_level(hours: float, dose_mg: float = 40.0) -> float:
     """Relative d-Amph level (0-1 at standard dose peak). Three-stage cascade shape."""
-    dose_factor = dose_mg / ELVANSE_DEFAULT_DOSE_MG
-    return _cascade_normalized(hours, ELVANSE_KA_ABS, ELVANSE_KA, ELVANSE_KE) * dose_factor
+    return SUBSTANCES["elvanse"].level(hours, dose_mg)
 
 
 def medikinet_ir_level(hours: float, dose_mg: float = 10.0) -> float:
     """Relative MPH IR level (0-1 at standard dose peak)."""
-    dose_factor = dose_mg / MEDIKINET_DEFAULT_DOSE_MG
-    return _bateman_normalized(hours, MEDIKINET_IR_KA, MEDIKINET_IR_KE) * dose_factor
+    return SUBSTANCES["medikinet_ir"].level(hours, dose_mg)
 
 
 def medikinet_retard_level(hours: float, dose_mg: float = 30.0) -> float:
     """Relative MPH retard level (0-1, FASTED collapsed profile)."""
-    dose_factor = dose_mg / MEDIKINET_RETARD_DEFAULT_DOSE_MG
-    return _bateman_normalized(hours, MEDIKINET_RETARD_KA, MEDIKINET_RETARD_KE) * dose_factor
+    return SUBSTANCES["medikinet_retard"].level(hours, dose_mg)
 
 
 def caffeine_level(hours: float, dose_mg: float = 76.0) -> float:
     """Relative caffeine level (0-1 at standard dose peak)."""
-    dose_factor = dose_mg / MATE_CAFFEINE_MG
-    return _bateman_normalized(hours, CAFFEINE_KA, CAFFEINE_KE) * dose_factor
+    return SUBSTANCES["caffeine"].level(hours, dose_mg)
 
 
 def codein_level(hours: float, dose_paracetamol_mg: float = 500.0) -> float:
     """Relative codein level (0-1 at standard dose peak)."""
-    codein_dose = dose_paracetamol_mg * CODEIN_RATIO
-    dose_factor = codein_dose / 30.0
-    return _bateman_normalized(hours, CO_DAFALGAN_CODEIN_KA, CO_DAFALGAN_CODEIN_KE) * dose_factor
+    return SUBSTANCES["codein"].level(hours, dose_paracetamol_mg)
 
 
 # ── Legacy-compatible effect curves (for model/fit backward compat) ──
@@ -315,8 +720,19 @@ def circadian_base_score(hour: float) -> float:
 
 # ── Substance load aggregation (Heaviside superposition) ─────────────
 
+def _active_intakes(series: IntakeSeries, substance: Union[str, int],
+                    t_us: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Intakes of one substance with tau <= t (Heaviside), via binary search
+    on the per-substance time order. Returns (hours_since, dose_mg).
+    """
+    epoch, dose = series.substance(substance)
+    n = int(np.searchsorted(epoch, t_us, side="right"))
+    return us_to_hours(t_us - epoch[:n]), dose[:n]
+
+
 def compute_substance_load_ngml(
-    intakes: list[dict],
+    intakes: IntakeLike,
     target_time: datetime,
     substance: str,
     conc_fn,
@@ -327,24 +743,22 @@ def compute_substance_load_ngml(
     Sum absolute concentration (ng/ml) of all intakes via linear superposition.
     Heaviside: H(t - tau_i) ensures future intakes don't contribute.
     C_total(t) = SUM_i C_i(t - tau_i) * H(t - tau_i)
+
+    Missing doses are resolved to the substance default when the
+    IntakeSeries is built; `default_dose` is kept for call compatibility.
     """
+    series = as_intake_series(intakes)
+    hours, doses = _active_intakes(series, substance, to_epoch_us(target_time))
     total = 0.0
-    for intake in intakes:
-        if intake.get("substance") != substance:
-            continue
-        intake_time = datetime.fromisoformat(intake["timestamp"])
-        hours_since = (target_time - intake_time).total_seconds() / 3600.0
-        if hours_since < 0:  # Heaviside: future intakes contribute 0
-            continue
-        dose = intake.get("dose_mg") or default_dose
+    for hours_since, dose in zip(hours.tolist(), doses.tolist()):
         conc = conc_fn(hours_since, dose, weight_kg)
-        if conc > 0.01:
+        if conc > NGML_CUTOFF:
             total += conc
     return total
 
 
 def compute_substance_level(
-    intakes: list[dict],
+    intakes: IntakeLike,
     target_time: datetime,
     substance: str,
     level_fn,
@@ -353,62 +767,153 @@ def compute_substance_level(
     """
     Sum relative level (0-1+) of all intakes via superposition.
     """
+    series = as_intake_series(intakes)
+    hours, doses = _active_intakes(series, substance, to_epoch_us(target_time))
     total = 0.0
-    for intake in intakes:
-        if intake.get("substance") != substance:
-            continue
-        intake_time = datetime.fromisoformat(intake["timestamp"])
-        hours_since = (target_time - intake_time).total_seconds() / 3600.0
-        if hours_since < 0:
-            continue
-        dose = intake.get("dose_mg") or default_dose
+    for hours_since, dose in zip(hours.tolist(), doses.tolist()):
         effect = level_fn(hours_since, dose)
-        if effect > 0.005:
+        if effect > LEVEL_CUTOFF:
             total += effect
     return total
 
 
+def compute_substance_loads(
+    intakes: IntakeLike,
+    target_time: datetime,
+    weight_kg: float = USER_WEIGHT_KG,
+    load_specs: Optional[tuple[tuple[SubstanceSpec, bool], ...]] = None,
+    substances: Optional[Collection[str]] = None,
+) -> dict[str, float]:
+    """
+    Fused superposition kernel: one pass over the (pre-parsed) intakes and
+    one normalized-shape evaluation per intake that feeds both the relative
+    level and the ng/ml concentration.
+
+    Equivalent to calling compute_substance_level / compute_substance_load_ngml
+    for every substance (same per-intake cut-offs: level > 0.005, ng/ml > 0.01).
+    Also returns the trailing-24h paracetamol total used by the DDI check.
+    `load_specs` replaces LOAD_SPECS (e.g. personally fitted parameters).
+    `substances` limits the pass to these spec names ("paracetamol" for the
+    24h window); the other loads stay 0.0.
+    """
+    series = as_intake_series(intakes)
+    t_us = to_epoch_us(target_time)
+
+    loads = {
+        "elvanse_level": 0.0,
+        "medikinet_ir_level": 0.0,
+        "medikinet_retard_level": 0.0,
+        "caffeine_level": 0.0,
+        "elvanse_ng_ml": 0.0,
+        "medikinet_ir_ng_ml": 0.0,
+        "medikinet_retard_ng_ml": 0.0,
+        "caffeine_ng_ml": 0.0,
+        "codein_ng_ml": 0.0,
+        "paracetamol_24h_mg": 0.0,
+    }
+
+    for spec, with_level in load_specs or LOAD_SPECS:
+        if substances is not None and spec.name not in substances:
+            continue
+        hours, doses = _active_intakes(series, spec.code, t_us)
+        if not len(hours):
+            continue
+        if spec.lag_h:
+            hours = hours - spec.lag_h
+        shape_at = spec.shape_fn()
+        cmax = spec.cmax(weight_kg)
+        level_sum = conc_sum = 0.0
+        for hours_since, dose in zip(hours.tolist(), doses.tolist()):
+            shape = shape_at(hours_since)
+            dose_factor = dose * spec.dose_scale / spec.ref_dose_mg
+            level = shape * dose_factor
+            if level > LEVEL_CUTOFF:
+                level_sum += level
+            conc = cmax * dose_factor * shape
+            if conc > NGML_CUTOFF:
+                conc_sum += conc
+        if with_level:
+            loads[f"{spec.name}_level"] = level_sum
+        loads[f"{spec.name}_ng_ml"] = conc_sum
+
+    # Trailing-24h paracetamol total (2 binary searches on the prefix sums)
+    if substances is not None and "paracetamol" not in substances:
+        return loads
+    _, para_mg = series.window_dose(SUBSTANCES["paracetamol"].code, t_us,
+                                    int(PARACETAMOL_WINDOW_H * US_PER_HOUR))
+    loads["paracetamol_24h_mg"] = float(para_mg)
+
+    return loads
+
+
 # ── DDI Warning System ───────────────────────────────────────────────
 
-def check_ddi_warnings(intakes: list[dict], target_time: datetime,
-                       weight_kg: float = USER_WEIGHT_KG) -> list[dict]:
+# Severity and title per rule type, in evaluation order
+DDI_RULES: dict[str, tuple[str, str]] = {
+    "cyp2d6_blockade": ("critical", "CYP2D6-Blockade: Analgetisches Versagen"),
+    "serotonin_syndrome": ("critical", "Serotonin-Syndrom-Risiko"),
+    "paracetamol_toxicity": ("critical", "Paracetamol-Hepatotoxizitaet (Fasten!)"),
+    "paracetamol_caution": ("warning", "Paracetamol-Vorsicht (Fasten)"),
+    "cns_overload": ("warning", "Extreme ZNS-Last"),
+}
+
+
+def _ddi_warning(rule: str, message: str) -> dict:
+    severity, title = DDI_RULES[rule]
+    return {"severity": severity, "type": rule, "title": title, "message": message}
+
+
+def check_ddi_warnings(intakes: IntakeLike, target_time: datetime,
+                       weight_kg: float = USER_WEIGHT_KG,
+                       loads: Optional[dict[str, float]] = None) -> list[dict]:
     """
     Check drug-drug interactions at the given time.
     Returns list of warning dicts: {severity, type, title, message}.
 
+    `loads` may be passed in from compute_substance_loads when the caller
+    already superposed the intakes for this instant (e.g. compute_bio_score).
+
     Checks:
     1. CYP2D6 Phaenokonversion (Codein + D-Amphetamin)
     2. Serotonin-Syndrom-Risiko (Opioid + Triple-Stimulanz-Stack)
     3. Paracetamol-Hepatotoxizitaet (kumulative Dosis + Fasten)
     4. Extreme ZNS-Stimulanzien-Last
     """
-    warnings = []
-
-    # Current concentrations (ng/ml)
-    elv_conc = compute_substance_load_ngml(
-        intakes, target_time, "elvanse",
-        elvanse_concentration, ELVANSE_DEFAULT_DOSE_MG, weight_kg,
-    )
-    med_ir_conc = compute_substance_load_ngml(
-        intakes, target_time, "medikinet",
-        medikinet_ir_concentration, MEDIKINET_DEFAULT_DOSE_MG, weight_kg,
-    )
-    med_ret_conc = compute_substance_load_ngml(
-        intakes, target_time, "medikinet_retard",
-        medikinet_retard_concentration, MEDIKINET_RETARD_DEFAULT_DOSE_MG, weight_kg,
-    )
-    caff_conc = compute_substance_load_ngml(
-        intakes, target_time, "mate",
-        caffeine_concentration, MATE_CAFFEINE_MG, weight_kg,
-    )
-    cod_conc = compute_substance_load_ngml(
-        intakes, target_time, "co_dafalgan",
-        codein_concentration, CO_DAFALGAN_DEFAULT_DOSE_MG, weight_kg,
+    if loads is None:
+        loads = compute_substance_loads(intakes, target_time, weight_kg)
+
+    return evaluate_ddi_rules(
+        loads["elvanse_ng_ml"],
+        loads["medikinet_ir_ng_ml"],
+        loads["medikinet_retard_ng_ml"],
+        loads["caffeine_ng_ml"],
+        loads["codein_ng_ml"],
+        loads["paracetamol_24h_mg"],
+        weight_kg,
     )
 
+
+def evaluate_ddi_rules(
+    elv_conc: float,
+    med_ir_conc: float,
+    med_ret_conc: float,
+    caff_conc: float,
+    cod_conc: float,
+    para_total: float,
+    weight_kg: float = USER_WEIGHT_KG,
+) -> list[dict]:
+    """
+    Apply the DDI rules to already-superposed concentrations (ng/ml)
+    and the trailing-24h paracetamol total (mg).
+    Shared by check_ddi_warnings and the vectorized curve engine.
+    """
+    warnings = []
+
     # Thresholds (20% of user Cmax = clinically meaningful)
-    d_amph_thresh = allometric_cmax(CMAX_REF["elvanse"], weight_kg) * 0.2
-    mph_thresh = allometric_cmax(CMAX_REF["medikinet_ir"], weight_kg) * 0.2
+    cmax_elv = SUBSTANCES["elvanse"].cmax(weight_kg)
+    cmax_mph = SUBSTANCES["medikinet_ir"].cmax(weight_kg)
+    d_amph_thresh = cmax_elv * 0.2
+    mph_thresh = cmax_mph * 0.2
 
     stimulant_active = (
         elv_conc > d_amph_thresh
@@ -418,18 +923,16 @@ def check_ddi_warnings(intakes: list[dict], target_time: datetime,
 
     # --- 1. CYP2D6-Blockade: analgetisches Versagen ---
     if cod_conc > 1.0 and stimulant_active:
-        warnings.append({
-            "severity": "critical",
-            "type": "cyp2d6_blockade",
-            "title": "CYP2D6-Blockade: Analgetisches Versagen",
-            "message": (
+        warnings.append(_ddi_warning(
+            "cyp2d6_blockade",
+            (
                 "D-Amphetamin blockiert CYP2D6 kompetitiv. "
                 "Codein wird NICHT zu Morphin konvertiert -- "
                 "kaum Schmerzlinderung. "
                 "NICHT die Co-Dafalgan-Dosis erhoehen! "
                 "Risiko: Paracetamol-Ueberdosis bei Glutathion-Depletion (Fasten)."
             ),
-        })
+        ))
 
     # --- 2. Serotonin-Syndrom-Risiko ---
     total_stim_norm = (
@@ -438,69 +941,48 @@ def check_ddi_warnings(intakes: list[dict], target_time: datetime,
         + caff_conc / 1500.0
     )
     if cod_conc > 1.0 and total_stim_norm > 0.3:
-        warnings.append({
-            "severity": "critical",
-            "type": "serotonin_syndrome",
-            "title": "Serotonin-Syndrom-Risiko",
-            "message": (
+        warnings.append(_ddi_warning(
+            "serotonin_syndrome",
+            (
                 "Opioid (Codein) + Stimulanzien-Stack: "
                 "serotonerge Exzitotoxizitaet moeglich. "
                 "Symptome: Klonus, Hyperreflexie, Diaphorese, Tremor, Agitation. "
                 "Bei Symptomen sofort aerztliche Hilfe!"
             ),
-        })
+        ))
 
     # --- 3. Paracetamol-Kumulation bei Fasten ---
     if USER_IS_FASTING:
-        start_24h = target_time - timedelta(hours=24)
-        para_total = 0.0
-        for intake in intakes:
-            if intake.get("substance") != "co_dafalgan":
-                continue
-            it = datetime.fromisoformat(intake["timestamp"])
-            if start_24h <= it <= target_time:
-                dose = intake.get("dose_mg") or CO_DAFALGAN_DEFAULT_DOSE_MG
-                para_total += dose
-
         if para_total > PARACETAMOL_MAX_DAILY_FASTING_MG:
-            warnings.append({
-                "severity": "critical",
-                "type": "paracetamol_toxicity",
-                "title": "Paracetamol-Hepatotoxizitaet (Fasten!)",
-                "message": (
+            warnings.append(_ddi_warning(
+                "paracetamol_toxicity",
+                (
                     f"Kumul. Paracetamol: {para_total:.0f}mg/24h. "
                     f"Max. bei Fasten: {PARACETAMOL_MAX_DAILY_FASTING_MG}mg. "
                     "Glutathion depletiert -- NAPQI-Neutralisierung stark eingeschraenkt."
                 ),
-            })
+            ))
         elif para_total > 1000:
-            warnings.append({
-                "severity": "warning",
-                "type": "paracetamol_caution",
-                "title": "Paracetamol-Vorsicht (Fasten)",
-                "message": (
+            warnings.append(_ddi_warning(
+                "paracetamol_caution",
+                (
                     f"Kumul. Paracetamol: {para_total:.0f}mg/24h. "
                     "Glutathion im Fastenzustand reduziert. Weitere Einnahme abwaegen."
                 ),
-            })
+            ))
 
     # --- 4. ZNS-Ueberlastung ---
     cns_total = elv_conc + med_ir_conc + med_ret_conc
-    cmax_stim_sum = (
-        allometric_cmax(CMAX_REF["elvanse"], weight_kg)
-        + allometric_cmax(CMAX_REF["medikinet_ir"], weight_kg)
-    )
+    cmax_stim_sum = cmax_elv + cmax_mph
     if cns_total > cmax_stim_sum * 0.8 and caff_conc > 800:
-        warnings.append({
-            "severity": "warning",
-            "type": "cns_overload",
-            "title": "Extreme ZNS-Last",
-            "message": (
+        warnings.append(_ddi_warning(
+            "cns_overload",
+            (
                 f"Stimulanzien: {cns_total:.1f} ng/ml + "
                 f"Koffein: {caff_conc:.0f} ng/ml. "
                 "Kardiovaskulaere Belastung sehr hoch. HRV und Ruhepuls beobachten."
             ),
-        })
+        ))
 
     return warnings
 
@@ -570,11 +1052,69 @@ def sleep_quality_modifier(sleep_duration_min: Optional[float],
     return base
 
 
+# ── Field dependency graph (?fields=) ────────────────────────────────
+
+# Output fields of compute_bio_score / curve points, in response order
+SCORE_FIELDS = (
+    "score", "circadian", "elvanse_boost", "medikinet_boost", "caffeine_boost",
+    "sleep_modifier", "hrv_penalty",
+    "elvanse_level", "medikinet_level", "caffeine_level", "codein_level",
+    "elvanse_ng_ml", "medikinet_ng_ml", "caffeine_ng_ml", "codein_ng_ml",
+    "cns_load", "hydration_modifier", "phase", "timestamp", "warnings",
+)
+
+# Node -> nodes it reads. Leaves are the per-substance superposition loads
+# (spec names, "paracetamol" = trailing 24h window) and the non-PK inputs.
+FIELD_DEPS: dict[str, tuple[str, ...]] = {
+    "score": ("circadian", "elvanse_boost", "medikinet_boost", "caffeine_boost",
+              "sleep_modifier", "hrv_penalty", "hydration_modifier"),
+    "elvanse_boost": ("elvanse",),
+    "medikinet_boost": ("medikinet_ir", "medikinet_retard"),
+    "caffeine_boost": ("caffeine",),
+    "hrv_penalty": ("stim_peak",),
+    "stim_peak": ("elvanse", "medikinet_ir", "medikinet_retard"),
+    "elvanse_level": ("elvanse",),
+    "medikinet_level": ("medikinet_ir", "medikinet_retard"),
+    "caffeine_level": ("caffeine",),
+    "codein_level": ("codein",),
+    "elvanse_ng_ml": ("elvanse",),
+    "medikinet_ng_ml": ("medikinet_ir", "medikinet_retard"),
+    "caffeine_ng_ml": ("caffeine",),
+    "codein_ng_ml": ("codein",),
+    "cns_load": ("elvanse", "medikinet_ir", "medikinet_retard", "caffeine"),
+    "phase": ("stim_peak", "caffeine"),
+    "warnings": ("elvanse", "medikinet_ir", "medikinet_retard", "caffeine",
+                 "codein", "paracetamol"),
+}
+
+
+def resolve_fields(fields: Optional[Iterable[str]]) -> Optional[frozenset[str]]:
+    """
+    Transitive closure of the requested output fields over FIELD_DEPS
+    (requested fields included). None means all fields.
+    Raises ValueError for names outside SCORE_FIELDS.
+    """
+    if fields is None:
+        return None
+    requested = [f for f in fields if f]
+    unknown = sorted(set(requested) - set(SCORE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    needed: set[str] = set()
+    stack = list(requested)
+    while stack:
+        node = stack.pop()
+        if node not in needed:
+            needed.add(node)
+            stack.extend(FIELD_DEPS.get(node, ()))
+    return frozenset(needed)
+
+
 # ── Bio-Score composite ──────────────────────────────────────────────
 
 def compute_bio_score(
     target_time: datetime,
-    intakes: list[dict],
+    intakes: IntakeLike,
     sleep_duration_min: Optional[float] = None,
     sleep_confidence: Optional[float] = None,
     hrv_ms: Optional[float] = None,
@@ -582,54 +1122,67 @@ def compute_bio_score(
     water_intake_ml: Optional[int] = None,
     water_goal_ml: Optional[int] = None,
     weight_kg: float = USER_WEIGHT_KG,
+    personal_pk: bool = False,
+    fields: Optional[Iterable[str]] = None,
 ) -> dict:
     """
     Compute composite Bio-Score with allometric PK, DDI warnings,
     HRV autonomic monitoring, and hydration status.
 
+    personal_pk=True uses the stored personal PK fit (ka, ke, lag) for every
+    substance with an accepted fit, population parameters otherwise.
+
+    `fields` restricts the result to these SCORE_FIELDS; only the components
+    they depend on (FIELD_DEPS) are evaluated, e.g. ("score", "phase")
+    skips the codein superposition, the paracetamol window and the DDI
+    check. None returns every field.
+
     Returns dict with score, components, absolute ng/ml, warnings.
     """
+    fields = None if fields is None else tuple(fields)
+    need = resolve_fields(fields)
+
+    def wanted(node: str) -> bool:
+        return need is None or node in need
+
     hour = target_time.hour + target_time.minute / 60.0
 
     # 1. Circadian base (0-60)
-    circadian = circadian_base_score(hour)
+    circadian = circadian_base_score(hour) if wanted("circadian") else 0.0
+
+    # Single superposition pass: relative levels + ng/ml for the needed substances
+    intakes = as_intake_series(intakes)
+    load_specs = None
+    if personal_pk:
+        from app.core.pk_fit import personal_load_specs
+        load_specs = personal_load_specs()
+    loads = compute_substance_loads(intakes, target_time, weight_kg, load_specs, need)
 
     # 2. Elvanse boost (0-30): three-stage cascade
-    elv_lv = compute_substance_level(
-        intakes, target_time, "elvanse",
-        elvanse_level, ELVANSE_DEFAULT_DOSE_MG,
-    )
+    elv_lv = loads["elvanse_level"]
     elvanse_boost = min(30.0, elv_lv * 30.0)
 
     # 3. Medikinet boost: IR + retard (0-25)
-    med_ir_lv = compute_substance_level(
-        intakes, target_time, "medikinet",
-        medikinet_ir_level, MEDIKINET_DEFAULT_DOSE_MG,
-    )
-    med_ret_lv = compute_substance_level(
-        intakes, target_time, "medikinet_retard",
-        medikinet_retard_level, MEDIKINET_RETARD_DEFAULT_DOSE_MG,
-    )
-    med_combined = med_ir_lv + med_ret_lv
+    med_combined = loads["medikinet_ir_level"] + loads["medikinet_retard_level"]
     medikinet_boost = min(25.0, med_combined * 25.0)
 
     # 4. Caffeine boost (0-15)
-    caff_lv = compute_substance_level(
-        intakes, target_time, "mate",
-        caffeine_level, MATE_CAFFEINE_MG,
-    )
+    caff_lv = loads["caffeine_level"]
     caffeine_boost = min(15.0, caff_lv * 15.0)
 
     # 5. Sleep modifier (-20 to +10)
-    sleep_mod = sleep_quality_modifier(sleep_duration_min, sleep_confidence)
+    sleep_mod = 0.0
+    if wanted("sleep_modifier"):
+        sleep_mod = sleep_quality_modifier(sleep_duration_min, sleep_confidence)
 
     # 6. HRV penalty (0 to -15)
     stim_peak = max(elv_lv, med_combined)
-    hrv_pen = hrv_penalty(hrv_ms, resting_hr, stim_peak)
+    hrv_pen = hrv_penalty(hrv_ms, resting_hr, stim_peak) if wanted("hrv_penalty") else 0.0
 
     # 7. Hydration modifier (-10 to +5)
     hydration_mod = 0.0
-    if water_intake_ml is not None and water_goal_ml is not None and water_goal_ml > 0:
+    if (wanted("hydration_modifier") and water_intake_ml is not None
+            and water_goal_ml is not None and water_goal_ml > 0):
         from app.core.water_engine import hydration_bio_score_modifier
         hydration_mod = hydration_bio_score_modifier(
             water_intake_ml, water_goal_ml, hour,
@@ -641,37 +1194,24 @@ def compute_bio_score(
     score = max(0.0, min(100.0, raw_score))
 
     # Absolute concentrations (ng/ml) — allometrically scaled to user weight
-    elv_conc = compute_substance_load_ngml(
-        intakes, target_time, "elvanse",
-        elvanse_concentration, ELVANSE_DEFAULT_DOSE_MG, weight_kg,
-    )
-    med_ir_conc = compute_substance_load_ngml(
-        intakes, target_time, "medikinet",
-        medikinet_ir_concentration, MEDIKINET_DEFAULT_DOSE_MG, weight_kg,
-    )
-    med_ret_conc = compute_substance_load_ngml(
-        intakes, target_time, "medikinet_retard",
-        medikinet_retard_concentration, MEDIKINET_RETARD_DEFAULT_DOSE_MG, weight_kg,
-    )
-    caff_conc = compute_substance_load_ngml(
-        intakes, target_time, "mate",
-        caffeine_concentration, MATE_CAFFEINE_MG, weight_kg,
-    )
-    cod_conc = compute_substance_load_ngml(
-        intakes, target_time, "co_dafalgan",
-        codein_concentration, CO_DAFALGAN_DEFAULT_DOSE_MG, weight_kg,
-    )
+    elv_conc = loads["elvanse_ng_ml"]
+    med_ir_conc = loads["medikinet_ir_ng_ml"]
+    med_ret_conc = loads["medikinet_retard_ng_ml"]
+    caff_conc = loads["caffeine_ng_ml"]
+    cod_conc = loads["codein_ng_ml"]
 
     # CNS load (relative sum)
     cns_load = elv_lv + med_combined + caff_lv
 
     # DDI warnings
-    ddi_warnings = check_ddi_warnings(intakes, target_time, weight_kg)
+    ddi_warnings = []
+    if wanted("warnings"):
+        ddi_warnings = check_ddi_warnings(intakes, target_time, weight_kg, loads=loads)
 
     # Phase
-    phase = _determine_phase(stim_peak, caff_lv, hour)
+    phase = _determine_phase(stim_peak, caff_lv, hour) if wanted("phase") else None
 
-    return {
+    result = {
         "score": round(score, 1),
         "circadian": round(circadian, 1),
         "elvanse_boost": round(elvanse_boost, 1),
@@ -684,7 +1224,7 @@ def compute_bio_score(
         "medikinet_level": round(med_combined, 3),
         "caffeine_level": round(caff_lv, 3),
         "codein_level": round(
-            cod_conc / max(allometric_cmax(CMAX_REF.get("codein", 100), weight_kg), 1),
+            cod_conc / max(SUBSTANCES["codein"].cmax(weight_kg), 1),
             3,
         ),
         # Absolute concentrations (ng/ml)
@@ -699,6 +1239,23 @@ def compute_bio_score(
         "timestamp": target_time.isoformat(),
         "warnings": ddi_warnings,
     }
+    if fields is not None:
+        result = {k: v for k, v in result.items() if k in fields}
+    if personal_pk:
+        result["personal_pk"] = [spec.name for spec, _ in load_specs
+                                 if spec is not SUBSTANCES.get(spec.name)]
+    return result
+
+
+# Stimulant-level bands of _determine_phase (highest first) and the clock
+# hours at which its time-based phases change (curve_engine.phase_segments)
+PHASE_STIM_LEVELS: tuple[tuple[float, str], ...] = (
+    (0.85, "peak-focus"),
+    (0.5, "active-focus"),
+    (0.2, "declining"),
+    (0.05, "low-residual"),
+)
+PHASE_HOURS: tuple[float, ...] = (6.0, 7.0, 12.5, 14.5, 20.0)
 
 
 def _determine_phase(stim_level: float, caffeine_lv: float, hour: float) -> str:
@@ -708,14 +1265,9 @@ def _determine_phase(stim_level: float, caffeine_lv: float, hour: float) -> str:
     if hour < 7:
         return "waking"
 
-    if stim_level >= 0.85:
-        return "peak-focus"
-    elif stim_level >= 0.5:
-        return "active-focus"
-    elif stim_level >= 0.2:
-        return "declining"
-    elif stim_level >= 0.05:
-        return "low-residual"
+    for level, phase in PHASE_STIM_LEVELS:
+        if stim_level >= level:
+            return phase
 
     if 12.5 <= hour <= 14.5:
         return "midday-dip"
@@ -727,7 +1279,7 @@ def _determine_phase(stim_level: float, caffeine_lv: float, hour: float) -> str:
 
 def generate_day_curve(
     date: datetime,
-    intakes: list[dict],
+    intakes: IntakeLike,
     sleep_duration_min: Optional[float] = None,
     sleep_confidence: Optional[float] = None,
     interval_minutes: int = 15,
@@ -737,16 +1289,10 @@ def generate_day_curve(
 ) -> list[dict]:
     """
     Generate Bio-Score data points for a full day at given interval.
+    Delegates to the vectorized curve engine (same fields as compute_bio_score).
     """
-    points = []
-    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    for i in range(0, 24 * 60, interval_minutes):
-        t = start + timedelta(minutes=i)
-        point = compute_bio_score(
-            t, intakes, sleep_duration_min, sleep_confidence,
-            hrv_ms, resting_hr, weight_kg=weight_kg,
-        )
-        points.append(point)
-
-    return points
+    from app.core.curve_engine import generate_day_curve as _vectorized_day_curve
+    return _vectorized_day_curve(
+        date, intakes, sleep_duration_min, sleep_confidence, interval_minutes,
+        hrv_ms=hrv_ms, resting_hr=resting_hr, weight_kg=weight_kg,
+    )
@@ -0,0 +1,393 @@
+"""
+Generic linear compartment models (matrix-exponential engine).
+
+A model is a set of compartments with first-order flows between them and
+out of the system. Amounts follow
+
+  dA/dt = K A,    A(0) = b                 (b = dose fractions per compartment)
+  K[j, i] =  k_(i->j)                      i != j
+  K[i, i] = -SUM_j k_(i->j) - k_(i->out)
+  y(t)    = A_obs(t) = e_obs^T expm(K t) b
+
+If K is diagonalizable (K = V diag(lambda) V^-1), the observed amount is a
+sum of exponentials:
+
+  y(t) = SUM_i c_i e^(lambda_i t),    c_i = V[obs, i] * (V^-1 b)_i
+
+One eigendecomposition per parameter set (cached) then turns every
+evaluation into a broadcast sum over all time points. Coincident rates
+(Bateman ka == ke, cascade k_abs == k_hyd) make K defective: V becomes
+(near-)singular and the partial-fraction form breaks down. Grouping the
+eigenvalues into clusters of multiplicity m gives the confluent form
+
+  y(t) = SUM_clusters SUM_(p<m) c_(lambda,p) t^p e^(lambda t)
+
+whose coefficients are fitted by least squares to expm(K t) b samples
+(the basis is exact, so the residual is at rounding level). expm itself is
+the fallback when that fit does not reproduce the samples, batched over t
+(scaling and squaring with a [7/7] Pade approximant, Higham 2005).
+
+tmax and the peak are located numerically (dense scan + golden section),
+so any model can be normalized to peak = 1.0 like the analytic shapes.
+
+Bateman and the Elvanse cascade are chains (gut -> ... -> central -> out).
+A biphasic release is two dose fractions entering the chain at different
+depths, e.g. Medikinet retard fed:
+
+  IR pellets  --ka-->  central --ke--> out
+  MR pellets  --k_tr--> gut --ka--> central
+
+By convention the first flow is the absorption and the last flow the
+elimination rate (used by the Monte Carlo sampler and the personal fit).
+"""
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Eigenbasis accepted while cond(V) stays below this (error ~ cond * eps)
+_COND_MAX = 1e8
+# [7/7] Pade is accurate to double precision for ||K t||_1 <= theta_7
+_PADE_THETA = 0.9504178996162932
+_PADE_B = (17297280.0, 8648640.0, 1995840.0, 277200.0, 25200.0, 1512.0, 56.0, 1.0)
+# Peak search: scan points and horizon cap (h)
+_PEAK_SCAN = 4000
+_PEAK_HORIZON_MAX_H = 500.0
+# Cached parameter sets (the personal fit evaluates many candidate rates)
+_BASES_MAX = 4096
+# Confluent form: eigenvalue cluster tolerance (relative), samples per compartment,
+# accepted relative residual against expm
+_CLUSTER_RTOL = 1e-4
+_CONFLUENT_SAMPLES = 12
+_CONFLUENT_RTOL = 1e-10
+
+
+class _Basis:
+    """
+    Cached decomposition of one parameter set: terms c t^p e^(lambda t)
+    (coeffs None -> expm only), plain-Python (c, p, decay) triples for
+    real terms, tmax, peak.
+    """
+
+    __slots__ = ("coeffs", "lam", "powers", "terms", "tmax", "peak")
+
+    def __init__(self, coeffs: Optional[np.ndarray], lam: np.ndarray,
+                 powers: Optional[np.ndarray] = None):
+        self.coeffs = coeffs
+        self.lam = lam
+        self.powers = np.zeros(len(lam), dtype=int) if powers is None else powers
+        self.terms: Optional[list[tuple[float, int, float]]] = None
+        if coeffs is not None and not np.iscomplexobj(coeffs):
+            self.terms = list(zip(coeffs.tolist(), self.powers.tolist(), (-lam).tolist()))
+        self.tmax = 0.0
+        self.peak = 0.0
+
+
+_BASES: dict[tuple, _Basis] = {}
+
+
+class CompartmentModel:
+    """Linear compartment model (see module docstring); immutable, hashable by structure + rates."""
+
+    __slots__ = ("n", "flows", "rates", "dose", "observe", "_key", "_cached")
+
+    def __init__(self, n: int, flows: Sequence[tuple[int, Optional[int]]],
+                 rates: Sequence[float], dose: Sequence[float], observe: int):
+        if len(flows) != len(rates):
+            raise ValueError("One rate per flow required")
+        if len(dose) != n or not 0 <= observe < n:
+            raise ValueError("dose needs one fraction per compartment, observe a valid index")
+        for src, dst in flows:
+            if not 0 <= src < n or (dst is not None and not 0 <= dst < n) or src == dst:
+                raise ValueError(f"Invalid flow {src} -> {dst}")
+        self.n = n
+        self.flows = tuple((int(s), None if d is None else int(d)) for s, d in flows)
+        self.rates = tuple(float(r) for r in rates)
+        self.dose = tuple(float(x) for x in dose)
+        self.observe = int(observe)
+        self._key = (self.n, self.flows, self.rates, self.dose, self.observe)
+        self._cached: Optional[_Basis] = None
+
+    @classmethod
+    def chain(cls, rates: Sequence[float], dose: Optional[Sequence[float]] = None) -> "CompartmentModel":
+        """Catenary gut -> ... -> central -> out; observes the last compartment."""
+        n = len(rates)
+        flows = [(i, i + 1) for i in range(n - 1)] + [(n - 1, None)]
+        return cls(n, flows, rates, dose or (1.0,) + (0.0,) * (n - 1), n - 1)
+
+    def with_rates(self, rates: Sequence[float]) -> "CompartmentModel":
+        return CompartmentModel(self.n, self.flows, rates, self.dose, self.observe)
+
+    def __repr__(self) -> str:
+        return f"CompartmentModel(n={self.n}, rates={self.rates})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompartmentModel) and self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    # ── Rate matrices ────────────────────────────────────────────────
+
+    def rate_matrices(self, rates: np.ndarray) -> np.ndarray:
+        """(m, P) rate rows -> (m, n, n) rate matrices K."""
+        rates = np.atleast_2d(np.asarray(rates, dtype=float))
+        k = np.zeros((len(rates), self.n, self.n))
+        for p, (src, dst) in enumerate(self.flows):
+            k[:, src, src] -= rates[:, p]
+            if dst is not None:
+                k[:, dst, src] += rates[:, p]
+        return k
+
+    def matrix(self) -> np.ndarray:
+        return self.rate_matrices(np.array(self.rates))[0]
+
+    # ── Decomposition ────────────────────────────────────────────────
+
+    def _decompose(self, k: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Batched eigen terms of (m, n, n) matrices: (coeffs (m, n), lambda (m, n), ok (m,)).
+        Rows with an ill-conditioned eigenbasis (defective K) have ok=False.
+        """
+        lam, vec = np.linalg.eig(k)
+        sv = np.linalg.svd(vec, compute_uv=False)
+        ok = np.isfinite(sv).all(axis=1) & (sv[:, -1] > sv[:, 0] / _COND_MAX)
+        b = np.array(self.dose)
+        coeffs = np.zeros(lam.shape, dtype=vec.dtype)
+        if ok.any():
+            w = np.linalg.solve(vec[ok], np.broadcast_to(b, (int(ok.sum()), self.n))[..., None])
+            coeffs[ok] = vec[ok][:, self.observe, :] * w[..., 0]
+        if np.iscomplexobj(lam) and not np.any(lam.imag[ok]):
+            lam, coeffs = lam.real, coeffs.real
+        return coeffs, lam, ok
+
+    def _basis(self) -> _Basis:
+        if self._cached is not None:
+            return self._cached
+        basis = _BASES.get(self._key)
+        if basis is None:
+            if len(_BASES) >= _BASES_MAX:
+                _BASES.clear()
+            k = self.rate_matrices(np.array(self.rates))
+            coeffs, lam, ok = self._decompose(k)
+            if ok[0]:
+                basis = _Basis(coeffs[0], lam[0])
+            else:
+                confluent = _confluent_terms(k[0], np.array(self.dose), self.observe, lam[0])
+                basis = _Basis(*confluent) if confluent else _Basis(None, lam[0])
+            _BASES[self._key] = basis
+            basis.tmax, basis.peak = self._locate_peak(basis)
+        self._cached = basis
+        return basis
+
+    # ── Evaluation ───────────────────────────────────────────────────
+
+    def raw(self, t) -> np.ndarray:
+        """Observed amount y(t) per unit dose on an array of hours (0 for t <= 0)."""
+        t = np.asarray(t, dtype=float)
+        basis = self._basis()
+        if basis.coeffs is None:
+            out = _expm_observe(self.matrix(), np.array(self.dose), self.observe, t.ravel())
+            return out.reshape(t.shape)
+        return _term_sum(basis.coeffs, basis.lam, basis.powers, t)
+
+    def raw_batch(self, rates: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """
+        y(t) for m rate rows at once: rates (m, P), t broadcastable against a
+        leading axis of m (e.g. (1, T, K) or (m, N, K)) -> (m, ...).
+        One batched eigendecomposition; defective rows use the confluent
+        form (expm if that fit fails).
+        """
+        rates = np.atleast_2d(np.asarray(rates, dtype=float))
+        m = len(rates)
+        k = self.rate_matrices(rates)
+        coeffs, lam, ok = self._decompose(k)
+        shape = np.broadcast_shapes((m,) + (1,) * (t.ndim - 1), t.shape)
+        tp = np.maximum(t, 0.0)
+        out = np.zeros(shape)
+        for i in range(self.n):
+            c = coeffs[:, i].reshape((m,) + (1,) * (t.ndim - 1))
+            r = lam[:, i].reshape((m,) + (1,) * (t.ndim - 1))
+            out += np.real(c * np.exp(r * tp))
+        if not ok.all():
+            b = np.array(self.dose)
+            t_full = np.broadcast_to(np.asarray(t, dtype=float), shape)
+            for row in np.flatnonzero(~ok):
+                confluent = _confluent_terms(k[row], b, self.observe, lam[row])
+                if confluent:
+                    out[row] = _term_sum(*confluent, t_full[row])
+                else:
+                    out[row] = _expm_observe(k[row], b, self.observe,
+                                             t_full[row].ravel()).reshape(shape[1:])
+        return np.where(t > 0, out, 0.0)
+
+    @property
+    def tmax(self) -> float:
+        return self._basis().tmax
+
+    @property
+    def peak(self) -> float:
+        return self._basis().peak
+
+    def exp_terms(self) -> Optional[tuple[list[float], list[float]]]:
+        """(coeffs, decay rates) of the peak-normalized shape SUM c_i e^(-r_i t); None if defective/complex."""
+        terms = self.shape_terms()
+        if terms is None or any(terms[1]):
+            return None
+        return terms[0], terms[2]
+
+    def shape_terms(self) -> Optional[tuple[list[float], list[int], list[float]]]:
+        """(coeffs, powers, decay rates) of the peak-normalized shape SUM c_i t^p_i e^(-r_i t); None if complex/expm-only."""
+        basis = self._basis()
+        if basis.terms is None or basis.peak <= 0:
+            return None
+        return ([c / basis.peak for c, _, _ in basis.terms],
+                [p for _, p, _ in basis.terms], [r for _, _, r in basis.terms])
+
+    def normalized(self, t) -> np.ndarray:
+        """Shape normalized to peak = 1.0 on an array of hours."""
+        peak = self.peak
+        t = np.asarray(t, dtype=float)
+        if peak <= 0:
+            return np.zeros_like(t)
+        return np.maximum(0.0, self.raw(t) / peak)
+
+    def normalized_scalar(self, t: float) -> float:
+        """Scalar normalized shape (plain-Python sum on the cached terms)."""
+        basis = self._basis()
+        if t <= 0 or basis.peak <= 0:
+            return 0.0
+        if basis.terms is not None:
+            return max(0.0, sum(c * t ** p * math.exp(-r * t)
+                                for c, p, r in basis.terms) / basis.peak)
+        return float(self.normalized(np.array([t]))[0])
+
+    def _locate_peak(self, basis: _Basis) -> tuple[float, float]:
+        """(tmax, peak): dense scan over the decay horizon, then golden-section refinement."""
+        grid = np.linspace(0.0, _horizon(basis.lam), _PEAK_SCAN + 1)
+        values = self.raw(grid)
+        i = int(np.argmax(values))
+        if values[i] <= 0:
+            return 0.0, 0.0
+        lo, hi = grid[max(i - 1, 0)], grid[min(i + 1, _PEAK_SCAN)]
+        inv_phi = (math.sqrt(5.0) - 1.0) / 2.0
+        for _ in range(100):
+            if hi - lo <= 1e-12 * max(1.0, hi):
+                break
+            a = hi - inv_phi * (hi - lo)
+            b = lo + inv_phi * (hi - lo)
+            fa, fb = self.raw(np.array([a, b]))
+            if fa < fb:
+                lo = a
+            else:
+                hi = b
+        tmax = 0.5 * (lo + hi)
+        return tmax, float(self.raw(np.array([tmax]))[0])
+
+
+# ── Batched analytic chains (sample axis first) ──────────────────────
+#
+# Closed forms of the two- and three-compartment chains for many rate sets
+# at once (Monte Carlo samples, personal-fit candidates). Rates must be
+# distinct; coincident rates go through CompartmentModel.raw_batch.
+
+def bateman_raw_batch(t: np.ndarray, ka: np.ndarray, ke: np.ndarray) -> np.ndarray:
+    """t: (1, T, K); ka, ke: (n, 1, 1) -> (n, T, K). Zero for t <= 0."""
+    tp = np.maximum(t, 0.0)
+    raw = (ka / (ka - ke)) * (np.exp(-ke * tp) - np.exp(-ka * tp))
+    return np.where(t > 0, raw, 0.0)
+
+
+def cascade_raw_batch(t: np.ndarray, k_abs: np.ndarray, k_hyd: np.ndarray,
+                      k_e: np.ndarray) -> np.ndarray:
+    """Three-stage cascade amount, same broadcasting as bateman_raw_batch."""
+    tp = np.maximum(t, 0.0)
+    rates = (k_abs, k_hyd, k_e)
+    raw = np.zeros(np.broadcast_shapes(t.shape, k_abs.shape))
+    for i, ri in enumerate(rates):
+        denom = np.ones_like(ri)
+        for j, rj in enumerate(rates):
+            if j != i:
+                denom = denom * (rj - ri)
+        raw += np.exp(-ri * tp) / denom
+    return np.where(t > 0, k_abs * k_hyd * raw, 0.0)
+
+
+# ── Kernels ──────────────────────────────────────────────────────────
+
+def _horizon(lam: np.ndarray) -> float:
+    """Hours until the slowest mode has decayed by e^-40 (capped)."""
+    slowest = float(np.min(np.abs(np.real(lam)))) if len(lam) else 0.0
+    return min(_PEAK_HORIZON_MAX_H, 40.0 / slowest) if slowest > 0 else _PEAK_HORIZON_MAX_H
+
+
+def _term_sum(coeffs: np.ndarray, lam: np.ndarray, powers: np.ndarray,
+              t: np.ndarray) -> np.ndarray:
+    """SUM_i c_i t^p_i e^(lambda_i t) on any array shape, 0 for t <= 0."""
+    tp = np.maximum(t, 0.0)
+    out = np.zeros(t.shape)
+    for c, r, p in zip(coeffs, lam, powers.tolist()):
+        term = c * np.exp(r * tp)
+        out += np.real(term * tp ** p if p else term)
+    return np.where(t > 0, out, 0.0)
+
+
+def _confluent_terms(k: np.ndarray, b: np.ndarray, observe: int,
+                     lam: np.ndarray) -> Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    (coeffs, lambda, powers) of the confluent form for a defective K, or None.
+    Eigenvalues within _CLUSTER_RTOL form one cluster (mean = the repeated
+    root); the coefficients are a least-squares fit to expm samples.
+    """
+    if np.iscomplexobj(lam) and np.any(lam.imag):
+        return None
+    values = np.sort(np.real(lam))
+    scale = max(1.0, float(np.max(np.abs(values))))
+    clusters = [[values[0]]]
+    for v in values[1:]:
+        if v - clusters[-1][-1] <= _CLUSTER_RTOL * scale:
+            clusters[-1].append(v)
+        else:
+            clusters.append([v])
+    roots = np.array([float(np.mean(c)) for c in clusters for _ in c])
+    powers = np.array([p for c in clusters for p in range(len(c))])
+
+    t = _horizon(roots) * np.linspace(0.0, 1.0, _CONFLUENT_SAMPLES * len(roots)) ** 2
+    y = _expm_observe(k, b, observe, t)
+    y[0] = b[observe]
+    design = t[:, None] ** powers[None, :] * np.exp(roots[None, :] * t[:, None])
+    coeffs = np.linalg.lstsq(design, y, rcond=None)[0]
+    if np.max(np.abs(design @ coeffs - y)) > _CONFLUENT_RTOL * max(float(np.max(np.abs(y))), 1e-300):
+        return None
+    return coeffs, roots, powers
+
+
+def _pade7(x: np.ndarray) -> np.ndarray:
+    """[7/7] Pade approximant of expm for a batch (k, n, n) with ||x||_1 <= theta_7."""
+    b = _PADE_B
+    eye = np.broadcast_to(np.eye(x.shape[-1]), x.shape)
+    x2 = x @ x
+    x4 = x2 @ x2
+    x6 = x4 @ x2
+    u = x @ (b[7] * x6 + b[5] * x4 + b[3] * x2 + b[1] * eye)
+    v = b[6] * x6 + b[4] * x4 + b[2] * x2 + b[0] * eye
+    return np.linalg.solve(v - u, v + u)
+
+
+def _expm_observe(k: np.ndarray, b: np.ndarray, observe: int, t: np.ndarray) -> np.ndarray:
+    """e_obs^T expm(K t) b for a flat array of t (scaling and squaring, batched per scale)."""
+    out = np.zeros(len(t))
+    pos = np.flatnonzero(t > 0)
+    if not len(pos):
+        return out
+    norm = float(np.abs(k).sum(axis=0).max())
+    scaled = norm * t[pos] / _PADE_THETA
+    squarings = np.where(scaled > 1.0, np.ceil(np.log2(np.maximum(scaled, 1.0))), 0).astype(int)
+    for s in np.unique(squarings).tolist():
+        idx = pos[squarings == s]
+        e = _pade7(k[None, :, :] * (t[idx] / 2.0 ** s)[:, None, None])
+        for _ in range(s):
+            e = e @ e
+        out[idx] = e[:, observe, :] @ b
+    return out
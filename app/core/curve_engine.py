@@ -0,0 +1,687 @@
+"""
+Vectorized Bio-Score curve engine (NumPy).
+
+generate_day_curve used to call compute_bio_score once per grid point, and
+every call re-scanned all intakes ~14 times with scalar math.exp. This engine
+evaluates the whole grid in one broadcast pass instead:
+
+  t        -- time grid as a vector (T,)
+  tau, D   -- intake times and doses per substance as vectors (K,)
+  h        = t[:, None] - tau[None, :]                     (T, K)
+  C(t)     = SUM_k  shape(h_tk) * scale * D_k * H(h_tk)    (T,)
+
+The per-intake cut-offs of the scalar path (level > 0.005, ng/ml > 0.01) are
+applied element-wise before the sum, so the result matches compute_bio_score
+point for point. Only the cheap O(1) finalisation (score clamping, phase,
+DDI rule evaluation) runs per point.
+"""
+
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from app.config import (
+    CURVE_ADAPTIVE_MAX_MINUTES,
+    CURVE_ADAPTIVE_MIN_MINUTES,
+    CURVE_ADAPTIVE_TOLERANCE,
+    EXPOSURE_SCAN_STEP_H,
+    PARACETAMOL_MAX_DAILY_FASTING_MG,
+    USER_IS_FASTING,
+    USER_WEIGHT_KG,
+)
+from app.core.bio_engine import (
+    DDI_RULES,
+    LEVEL_CUTOFF,
+    LOAD_SPECS,
+    NGML_CUTOFF,
+    PARACETAMOL_WINDOW_H,
+    PHASE_HOURS,
+    PHASE_STIM_LEVELS,
+    SUBSTANCES,
+    SubstanceSpec,
+    evaluate_ddi_rules,
+    hrv_penalty,
+    intake_lookback_h,
+    resolve_fields,
+    sleep_quality_modifier,
+    _determine_phase,
+)
+from app.core.exposure import ExposureCurve
+from app.core.roots import find_crossings
+from app.core.intake_series import (
+    IntakeLike,
+    US_PER_HOUR,
+    as_intake_series,
+    to_epoch_us,
+    us_to_hours,
+)
+
+# Knots of circadian_base_score (continuous piecewise-linear on 0-24h)
+_CIRCADIAN_KNOTS_H = np.array([0.0, 6.0, 7.0, 9.0, 12.0, 13.0, 14.5, 15.0, 17.0, 20.0, 22.0, 24.0])
+_CIRCADIAN_KNOTS_PTS = np.array([15.0, 15.0, 35.0, 60.0, 60.0, 50.0, 35.0, 50.0, 50.0, 26.0, 16.0, 15.0])
+
+
+# A vital sign per grid point, or one value for the whole grid
+VitalsLike = Union[Optional[float], Sequence[Optional[float]]]
+
+
+# ── Normalized PK shapes on arrays ───────────────────────────────────
+
+def normalized_shape_array(spec: SubstanceSpec, t: np.ndarray) -> np.ndarray:
+    """
+    Array version of SubstanceSpec.normalized (peak = 1.0, precomputed).
+    Bateman / cascade use the spec's own exponential terms (shape_terms),
+    so the scalar and vectorized paths share one set of coefficients.
+    """
+    table = spec.table()
+    if table is not None:
+        return table.evaluate(t)
+    if spec.model == "linear":
+        return spec.compartments.normalized(t)
+    coeffs, _, rates = spec.shape_terms()
+    out = np.zeros_like(t, dtype=float)
+    pos = t > 0
+    raw = np.exp(-np.multiply.outer(t[pos], np.asarray(rates, dtype=float))) @ np.asarray(coeffs, dtype=float)
+    out[pos] = np.maximum(0.0, raw)
+    return out
+
+
+def circadian_base_score_array(hours: np.ndarray) -> np.ndarray:
+    """Vectorized circadian_base_score (same knots, linear in between)."""
+    return np.interp(hours, _CIRCADIAN_KNOTS_H, _CIRCADIAN_KNOTS_PTS)
+
+
+# ── Superposition over the time grid ─────────────────────────────────
+
+def _superpose(hours_since: np.ndarray, dose_factors: np.ndarray,
+               shape: np.ndarray, scale: float, cutoff: float) -> np.ndarray:
+    """
+    Sum per-intake contributions over the intake axis.
+    hours_since, shape: (T, K); dose_factors: (K,).
+    Heaviside and per-intake cut-off are applied before summing.
+    """
+    contrib = shape * (scale * dose_factors)[None, :]
+    contrib = np.where((hours_since >= 0) & (contrib > cutoff), contrib, 0.0)
+    return contrib.sum(axis=1)
+
+
+def compute_curve_arrays(
+    times: list[datetime],
+    intakes: IntakeLike,
+    weight_kg: float = USER_WEIGHT_KG,
+) -> dict[str, np.ndarray]:
+    """
+    Evaluate all substance levels and concentrations on a time grid.
+
+    Returns arrays (T,) keyed by:
+      elvanse_level, medikinet_ir_level, medikinet_retard_level, caffeine_level,
+      elvanse_ng_ml, medikinet_ir_ng_ml, medikinet_retard_ng_ml, caffeine_ng_ml,
+      codein_ng_ml, paracetamol_24h_mg
+    """
+    series = as_intake_series(intakes)
+    grid_us = np.array([to_epoch_us(t) for t in times], dtype=np.int64)
+
+    def _prepare(spec: SubstanceSpec):
+        # Time since onset = intake + absorption lag, as in SubstanceSpec.level
+        tau_us, dose = series.substance(spec.code)
+        delta_us = grid_us[:, None] - tau_us[None, :] - round(spec.lag_h * US_PER_HOUR)
+        return delta_us, us_to_hours(delta_us), dose
+
+    out: dict[str, np.ndarray] = {}
+
+    for spec, with_level in LOAD_SPECS:
+        d_us, h, dose = _prepare(spec)
+        shape = normalized_shape_array(spec, h)
+        f = dose * spec.dose_scale / spec.ref_dose_mg
+        if with_level:
+            out[f"{spec.name}_level"] = _superpose(d_us, f, shape, 1.0, LEVEL_CUTOFF)
+        out[f"{spec.name}_ng_ml"] = _superpose(d_us, f, shape, spec.cmax(weight_kg), NGML_CUTOFF)
+
+    # Trailing-24h paracetamol total (prefix sums, O(T log K))
+    _, out["paracetamol_24h_mg"] = series.window_dose(
+        SUBSTANCES["paracetamol"].code, grid_us, int(PARACETAMOL_WINDOW_H * US_PER_HOUR),
+    )
+
+    return out
+
+
+# ── Bio-Score over a grid ────────────────────────────────────────────
+
+def compute_bio_score_curve(
+    times: list[datetime],
+    intakes: IntakeLike,
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    hrv_ms: VitalsLike = None,
+    resting_hr: VitalsLike = None,
+    weight_kg: float = USER_WEIGHT_KG,
+) -> list[dict]:
+    """
+    Vectorized equivalent of [compute_bio_score(t, intakes, ...) for t in times].
+    Returns the same dict per point (hydration modifier fixed at 0).
+    hrv_ms / resting_hr may be per-point sequences (see vitals_asof).
+    """
+    if not times:
+        return []
+    return curve_points(
+        times, compute_curve_arrays(times, intakes, weight_kg),
+        sleep_duration_min, sleep_confidence, hrv_ms, resting_hr, weight_kg,
+    )
+
+
+def curve_points(
+    times: list[datetime],
+    a: dict[str, np.ndarray],
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    hrv_ms: VitalsLike = None,
+    resting_hr: VitalsLike = None,
+    weight_kg: float = USER_WEIGHT_KG,
+    fields: Optional[Iterable[str]] = None,
+) -> list[dict]:
+    """
+    Per-point finalisation (score, phase, DDI) of precomputed load arrays
+    from compute_curve_arrays. Cheap compared to the superposition itself.
+    `fields` (bio_engine.SCORE_FIELDS) restricts the points; the DDI check,
+    HRV penalty and phase only run when a requested field depends on them.
+    """
+    fields = None if fields is None else frozenset(fields)
+    need = resolve_fields(fields)
+
+    def wanted(node: str) -> bool:
+        return need is None or node in need
+
+    hours = np.array([t.hour + t.minute / 60.0 for t in times])
+    hrv = _per_point(hrv_ms, len(times))
+    rhr = _per_point(resting_hr, len(times))
+
+    circadian = circadian_base_score_array(hours)
+    elv_lv = a["elvanse_level"]
+    med_combined = a["medikinet_ir_level"] + a["medikinet_retard_level"]
+    caff_lv = a["caffeine_level"]
+    elvanse_boost = np.minimum(30.0, elv_lv * 30.0)
+    medikinet_boost = np.minimum(25.0, med_combined * 25.0)
+    caffeine_boost = np.minimum(15.0, caff_lv * 15.0)
+    stim_peak = np.maximum(elv_lv, med_combined)
+    cns_load = elv_lv + med_combined + caff_lv
+    med_conc = a["medikinet_ir_ng_ml"] + a["medikinet_retard_ng_ml"]
+    codein_cmax = max(SUBSTANCES["codein"].cmax(weight_kg), 1)
+
+    sleep_mod = sleep_quality_modifier(sleep_duration_min, sleep_confidence)
+    para = a["paracetamol_24h_mg"] if USER_IS_FASTING else np.zeros(len(times))
+    # Messages (with values) are only built where a rule fires
+    if wanted("warnings"):
+        any_ddi = np.any(list(ddi_flag_arrays(a, weight_kg).values()), axis=0)
+    else:
+        any_ddi = np.zeros(len(times), dtype=bool)
+    with_hrv = wanted("hrv_penalty")
+    with_phase = wanted("phase")
+
+    points = []
+    for i, t in enumerate(times):
+        hrv_pen = hrv_penalty(hrv[i], rhr[i], float(stim_peak[i])) if with_hrv else 0.0
+        raw_score = (circadian[i] + elvanse_boost[i] + medikinet_boost[i]
+                     + caffeine_boost[i] + sleep_mod + hrv_pen + 0.0)
+        score = max(0.0, min(100.0, float(raw_score)))
+        warnings = [] if not any_ddi[i] else evaluate_ddi_rules(
+            float(a["elvanse_ng_ml"][i]),
+            float(a["medikinet_ir_ng_ml"][i]),
+            float(a["medikinet_retard_ng_ml"][i]),
+            float(a["caffeine_ng_ml"][i]),
+            float(a["codein_ng_ml"][i]),
+            float(para[i]),
+            weight_kg,
+        )
+        points.append({
+            "score": round(score, 1),
+            "circadian": round(float(circadian[i]), 1),
+            "elvanse_boost": round(float(elvanse_boost[i]), 1),
+            "medikinet_boost": round(float(medikinet_boost[i]), 1),
+            "caffeine_boost": round(float(caffeine_boost[i]), 1),
+            "sleep_modifier": round(sleep_mod, 1),
+            "hrv_penalty": round(hrv_pen, 1),
+            # Relative levels (0-1+)
+            "elvanse_level": round(float(elv_lv[i]), 3),
+            "medikinet_level": round(float(med_combined[i]), 3),
+            "caffeine_level": round(float(caff_lv[i]), 3),
+            "codein_level": round(float(a["codein_ng_ml"][i]) / codein_cmax, 3),
+            # Absolute concentrations (ng/ml)
+            "elvanse_ng_ml": round(float(a["elvanse_ng_ml"][i]), 1),
+            "medikinet_ng_ml": round(float(med_conc[i]), 1),
+            "caffeine_ng_ml": round(float(a["caffeine_ng_ml"][i]), 0),
+            "codein_ng_ml": round(float(a["codein_ng_ml"][i]), 1),
+            # Composite
+            "cns_load": round(float(cns_load[i]), 3),
+            "hydration_modifier": 0.0,
+            "phase": _determine_phase(float(stim_peak[i]), float(caff_lv[i]), float(hours[i]))
+            if with_phase else None,
+            "timestamp": t.isoformat(),
+            "warnings": warnings,
+        })
+    if fields is not None:
+        points = [{k: v for k, v in p.items() if k in fields} for p in points]
+    return points
+
+
+# ── DDI timeline ─────────────────────────────────────────────────────
+
+def ddi_flag_arrays(a: dict[str, np.ndarray], weight_kg: float = USER_WEIGHT_KG) -> dict[str, np.ndarray]:
+    """
+    evaluate_ddi_rules on whole load arrays: rule type -> bool (T,), same
+    thresholds and comparison order as the scalar rules, all rules in one
+    broadcast pass. Paracetamol rules only apply when fasting.
+    """
+    cmax_elv = SUBSTANCES["elvanse"].cmax(weight_kg)
+    cmax_mph = SUBSTANCES["medikinet_ir"].cmax(weight_kg)
+    d_amph_thresh = cmax_elv * 0.2
+    mph_thresh = cmax_mph * 0.2
+    elv, ir, ret = a["elvanse_ng_ml"], a["medikinet_ir_ng_ml"], a["medikinet_retard_ng_ml"]
+    caff, cod = a["caffeine_ng_ml"], a["codein_ng_ml"]
+
+    stimulant_active = (elv > d_amph_thresh) | (ir > mph_thresh) | (ret > mph_thresh)
+    total_stim_norm = (
+        elv / max(d_amph_thresh * 5, 1)
+        + (ir + ret) / max(mph_thresh * 5, 1)
+        + caff / 1500.0
+    )
+    para = a["paracetamol_24h_mg"]
+    para_toxic = (para > PARACETAMOL_MAX_DAILY_FASTING_MG) & USER_IS_FASTING
+    return {
+        "cyp2d6_blockade": (cod > 1.0) & stimulant_active,
+        "serotonin_syndrome": (cod > 1.0) & (total_stim_norm > 0.3),
+        "paracetamol_toxicity": para_toxic,
+        "paracetamol_caution": (para > 1000) & ~para_toxic & USER_IS_FASTING,
+        "cns_overload": (elv + ir + ret > (cmax_elv + cmax_mph) * 0.8) & (caff > 800),
+    }
+
+
+def ddi_intervals(
+    times: list[datetime],
+    a: dict[str, np.ndarray],
+    weight_kg: float = USER_WEIGHT_KG,
+) -> list[dict]:
+    """
+    Run-length encode the DDI flags into warning intervals, sorted by start:
+    {type, severity, title, start, end}, end exclusive like phase_segments.
+    start is the first grid point at which the rule fires, end the grid
+    point after the last one (resolution = grid interval).
+    """
+    if not times:
+        return []
+    step = times[1] - times[0] if len(times) > 1 else timedelta(0)
+    stops = times[1:] + [times[-1] + step]
+    intervals = []
+    for rule, flags in ddi_flag_arrays(a, weight_kg).items():
+        if not flags.any():
+            continue
+        edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        severity, title = DDI_RULES[rule]
+        intervals.extend(
+            {"type": rule, "severity": severity, "title": title,
+             "start": times[i].isoformat(), "end": stops[j].isoformat()}
+            for i, j in zip(starts.tolist(), ends.tolist())
+        )
+    intervals.sort(key=lambda w: w["start"])
+    return intervals
+
+
+# ── Phase timeline ───────────────────────────────────────────────────
+
+def phase_segments(
+    times: list[datetime],
+    a: dict[str, np.ndarray],
+    intakes: Optional[IntakeLike] = None,
+    weight_kg: float = USER_WEIGHT_KG,
+) -> list[dict]:
+    """
+    The day as run-length phase intervals {start, end, phase}, end exclusive.
+
+    _determine_phase only changes where the stimulant level max(Elvanse,
+    Medikinet IR + retard) crosses a PHASE_STIM_LEVELS band or the clock
+    passes one of PHASE_HOURS; between two breakpoints the phase is
+    constant and classified once, at the segment midpoint.
+
+    With `intakes` (day plus lookback) the level is the closed-form sum
+    (exposure.ExposureCurve) with the same per-intake LEVEL_CUTOFF as the
+    grid arrays, so segments agree with curve_points' per-point phase,
+    and the band crossings are exact, independent of the grid interval
+    (_stim_level).
+    Without, they are located on the linear interpolant of the grid
+    arrays, which misses excursions between two samples and is only as
+    precise as the grid.
+    """
+    if not times:
+        return []
+    day = times[0].replace(hour=0, minute=0, second=0, microsecond=0)
+
+    breaks = [np.array([0.0, 24.0]), np.array(PHASE_HOURS)]
+    if intakes is None:
+        t = np.array([(ts - day).total_seconds() / 3600.0 for ts in times])
+        stim = np.maximum(a["elvanse_level"], a["medikinet_ir_level"] + a["medikinet_retard_level"])
+        for level, _ in PHASE_STIM_LEVELS:
+            above = stim >= level
+            i = np.flatnonzero(above[:-1] != above[1:])
+            frac = (level - stim[i]) / (stim[i + 1] - stim[i])
+            breaks.append(t[i] + frac * (t[i + 1] - t[i]))
+        bounds = np.unique(np.concatenate(breaks))
+        mids = 0.5 * (bounds[:-1] + bounds[1:])
+        stim_mid = np.interp(mids, t, stim)
+    else:
+        stim_at, crossings = _stim_level(intakes, day, weight_kg)
+        breaks.extend(crossings)
+        bounds = np.unique(np.concatenate(breaks))
+        mids = 0.5 * (bounds[:-1] + bounds[1:])
+        stim_mid = stim_at(mids)
+
+    segments: list[dict] = []
+    for lo, hi, h, s in zip(bounds[:-1], bounds[1:], mids.tolist(), stim_mid.tolist()):
+        phase = _determine_phase(s, 0.0, h)
+        end = (day + timedelta(seconds=round(hi * 3600))).isoformat()
+        if segments and segments[-1]["phase"] == phase:
+            segments[-1]["end"] = end
+        else:
+            segments.append({
+                "start": (day + timedelta(seconds=round(lo * 3600))).isoformat(),
+                "end": end,
+                "phase": phase,
+            })
+    return segments
+
+
+def _stim_level(
+    intakes: IntakeLike, day: datetime, weight_kg: float,
+) -> tuple[Callable[[np.ndarray], np.ndarray], list[np.ndarray]]:
+    """
+    Closed-form stimulant level S(h) = max(E(h), M(h)) on hours since `day`
+    (E = Elvanse, M = Medikinet IR + retard), each intake contribution
+    dropped at or below LEVEL_CUTOFF like _superpose, and its
+    PHASE_STIM_LEVELS crossings on [0, 24]:
+
+      1. S is monotone between the onsets (slope jumps), the cut-off
+         crossings of single intakes (level jumps), the extrema of E and M
+         (roots of E', M') and the switch points (roots of E - M).
+         Those roots are bracketed on the onsets + an EXPOSURE_SCAN_STEP_H
+         scan, like the exposure metrics,
+      2. so every band crossing is bracketed once between neighbouring
+         breakpoints, also a dip shorter than the scan step, and refined
+         with Brent (roots.find_crossings).
+    """
+    series = as_intake_series(intakes)
+    day_us = to_epoch_us(day)
+    curves, jumps = [], []
+    for name in ("elvanse", "medikinet_ir", "medikinet_retard"):
+        spec = SUBSTANCES[name]
+        tau_us, dose = series.substance(spec.code)
+        intake_h, cmax = us_to_hours(tau_us - day_us), spec.cmax(weight_kg)
+        curves.append((ExposureCurve(spec, intake_h, dose, weight_kg), cmax, LEVEL_CUTOFF * cmax))
+        jumps.append((spec, intake_h, dose, LEVEL_CUTOFF * cmax))
+    elv, med = curves[:1], curves[1:]
+
+    def branch(parts, h: np.ndarray, slope: bool = False) -> np.ndarray:
+        return sum((c.derivative(h, cut) if slope else c.value(h, cut)) / cmax
+                   for c, cmax, cut in parts)
+
+    def stim_at(h: np.ndarray) -> np.ndarray:
+        return np.maximum(branch(elv, h), branch(med, h))
+
+    onsets = np.concatenate([c.onsets for c, _, _ in curves])
+    scan = np.linspace(0.0, 24.0, max(1, math.ceil(24.0 / EXPOSURE_SCAN_STEP_H)) + 1)
+    grid = np.unique(np.concatenate([scan, onsets[(onsets > 0.0) & (onsets < 24.0)]]))
+    # Where one intake's contribution passes its cut-off, the branch jumps
+    grid = np.unique(np.concatenate([grid] + [
+        _cutoff_crossings(ExposureCurve(spec, intake_h[k:k + 1], dose[k:k + 1], weight_kg), cut, grid)
+        for spec, intake_h, dose, cut in jumps for k in range(len(dose))
+    ]))
+    turns = [h for f in (lambda h: branch(elv, h, slope=True),
+                         lambda h: branch(med, h, slope=True),
+                         lambda h: branch(elv, h) - branch(med, h))
+             for h, _ in find_crossings(f, grid)]
+    grid = np.unique(np.concatenate([grid, turns]))
+    crossings = [np.array([h for h, _ in find_crossings(lambda h, lv=level: stim_at(h) - lv, grid)])
+                 for level, _ in PHASE_STIM_LEVELS]
+    return stim_at, crossings
+
+
+def _cutoff_crossings(single: ExposureCurve, cut: float, grid: np.ndarray) -> np.ndarray:
+    """Hours at which a single-intake curve crosses `cut` ng/ml on the grid."""
+    return np.array([h for h, _ in find_crossings(lambda h: single.value(h) - cut, grid)])
+
+
+# ── Vitals over the grid ─────────────────────────────────────────────
+
+def _per_point(value: VitalsLike, n: int) -> Sequence[Optional[float]]:
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return value
+    return [value] * n
+
+
+def vitals_series(
+    snapshots: list[dict],
+    fields: tuple[str, ...] = ("hrv", "resting_hr"),
+) -> dict[str, tuple[np.ndarray, list[float]]]:
+    """
+    Parse and sort health_snapshots once: per field the (epoch_us, values)
+    of its non-null readings, ready for vitals_asof.
+    """
+    parsed = sorted(
+        ((to_epoch_us(datetime.fromisoformat(r["timestamp"])), r) for r in snapshots),
+        key=lambda pair: pair[0],
+    )
+    out = {}
+    for field in fields:
+        obs = [(t_us, float(r[field])) for t_us, r in parsed if r.get(field) is not None]
+        out[field] = (np.array([t_us for t_us, _ in obs], dtype=np.int64),
+                      [v for _, v in obs])
+    return out
+
+
+def vitals_asof(
+    times: list[datetime],
+    series: dict[str, tuple[np.ndarray, list[float]]],
+) -> dict[str, list[Optional[float]]]:
+    """
+    As-of join (last observation carried forward) of vitals_series onto
+    the time grid: one np.searchsorted merge per field, no per-point lookups.
+    Null readings were dropped by vitals_series, so a snapshot without HRV
+    keeps the carried HRV value. Points before the first observation get None.
+    """
+    grid_us = np.array([to_epoch_us(t) for t in times], dtype=np.int64)
+    out: dict[str, list[Optional[float]]] = {}
+    for field, (obs_us, values) in series.items():
+        idx = np.searchsorted(obs_us, grid_us, side="right") - 1
+        out[field] = [values[i] if i >= 0 else None for i in idx.tolist()]
+    return out
+
+
+def day_grid(date: datetime, interval_minutes: int = 15) -> list[datetime]:
+    """Time grid 00:00 .. 24:00 (exclusive) of the given date."""
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [start + timedelta(minutes=i) for i in range(0, 24 * 60, interval_minutes)]
+
+
+def day_window(date: datetime, weight_kg: float = USER_WEIGHT_KG) -> tuple[str, str]:
+    """
+    Intake query bounds (ISO strings) for one curve day: the day itself plus
+    the lookback in which an earlier intake can still contribute
+    (bio_engine.intake_lookback_h), so evening doses carry over midnight.
+    """
+    day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    lookback = timedelta(hours=math.ceil(intake_lookback_h(weight_kg)))
+    return (day - lookback).isoformat(), day.strftime("%Y-%m-%dT23:59:59")
+
+
+def generate_day_curve(
+    date: datetime,
+    intakes: IntakeLike,
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    interval_minutes: int = 15,
+    hrv_ms: VitalsLike = None,
+    resting_hr: VitalsLike = None,
+    weight_kg: float = USER_WEIGHT_KG,
+    snapshots: Optional[list[dict]] = None,
+) -> list[dict]:
+    """
+    Bio-Score data points for a full day, evaluated in one vectorized pass.
+    With `snapshots` (the day's health_snapshots), HRV and resting HR are
+    as-of joined onto the grid instead of using one value for the whole day.
+    """
+    times = day_grid(date, interval_minutes)
+    if snapshots is not None:
+        joined = vitals_asof(times, vitals_series(snapshots))
+        hrv_ms, resting_hr = joined["hrv"], joined["resting_hr"]
+    return compute_bio_score_curve(
+        times, intakes, sleep_duration_min, sleep_confidence, hrv_ms, resting_hr, weight_kg,
+    )
+
+
+# ── Adaptive sampling ────────────────────────────────────────────────
+#
+# A fixed grid spends most points on flat night segments and still cuts
+# the absorption edges of Medikinet IR / caffeine. The adaptive grid starts
+# from a coarse grid plus every kink (intake onsets, circadian knots) and
+# bisects an interval while the midpoint deviates from the straight line
+# between its ends by more than `tolerance`:
+#
+#   err = max_s | L_s(t_mid) - (L_s(t_lo) + L_s(t_hi)) / 2 |
+#
+# over the plotted relative levels s (Elvanse, Medikinet IR + retard,
+# caffeine, codein / Cmax). Score boosts are <= 30 x level and the
+# circadian part is linear between its knots, so the score's interpolation
+# error stays below 30 x tolerance points. Only the midpoints of open
+# intervals are evaluated per round.
+
+def _adaptive_metric(a: dict[str, np.ndarray], codein_cmax: float) -> np.ndarray:
+    return np.stack([
+        a["elvanse_level"],
+        a["medikinet_ir_level"] + a["medikinet_retard_level"],
+        a["caffeine_level"],
+        a["codein_ng_ml"] / codein_cmax,
+    ])
+
+
+def adaptive_day_grid(
+    date: datetime,
+    intakes: IntakeLike,
+    weight_kg: float = USER_WEIGHT_KG,
+    tolerance: float = CURVE_ADAPTIVE_TOLERANCE,
+    min_minutes: int = CURVE_ADAPTIVE_MIN_MINUTES,
+    max_minutes: int = CURVE_ADAPTIVE_MAX_MINUTES,
+) -> tuple[list[datetime], dict[str, np.ndarray]]:
+    """
+    Irregular time grid 00:00 .. 23:59 (whole seconds) of the given date and
+    the compute_curve_arrays loads on it (see the section comment).
+    """
+    series = as_intake_series(intakes)
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_us = to_epoch_us(start)
+    day_s = 24 * 3600 - 60
+    min_s = 60 * min_minutes
+
+    kinks = [np.arange(0, day_s, 60 * max_minutes), [day_s], _CIRCADIAN_KNOTS_H[:-1] * 3600]
+    for spec, _ in LOAD_SPECS:
+        tau_us, _ = series.substance(spec.code)
+        onsets = (tau_us - start_us) // 1_000_000 + round(spec.lag_h * 3600)
+        kinks.append(onsets[(onsets > 0) & (onsets < day_s)])
+    t = np.unique(np.concatenate(kinks).astype(np.int64))
+
+    def evaluate(seconds: np.ndarray) -> dict[str, np.ndarray]:
+        times = [start + timedelta(seconds=int(s)) for s in seconds]
+        return compute_curve_arrays(times, series, weight_kg)
+
+    codein_cmax = max(SUBSTANCES["codein"].cmax(weight_kg), 1)
+    arrays = evaluate(t)
+    is_new = np.ones(len(t), dtype=bool)
+    while True:
+        open_ = (is_new[:-1] | is_new[1:]) & (np.diff(t) >= 2 * min_s)
+        idx = np.flatnonzero(open_)
+        if not len(idx):
+            break
+        mid = (t[idx] + t[idx + 1]) // 2
+        mid_arrays = evaluate(mid)
+        m = _adaptive_metric(arrays, codein_cmax)
+        err = np.max(np.abs(_adaptive_metric(mid_arrays, codein_cmax)
+                            - 0.5 * (m[:, idx] + m[:, idx + 1])), axis=0)
+        split = err > tolerance
+        if not split.any():
+            break
+        pos = idx[split] + 1
+        t = np.insert(t, pos, mid[split])
+        arrays = {k: np.insert(v, pos, mid_arrays[k][split]) for k, v in arrays.items()}
+        is_new = np.zeros(len(t), dtype=bool)
+        is_new[pos + np.arange(len(pos))] = True
+    return [start + timedelta(seconds=int(s)) for s in t], arrays
+
+
+def generate_adaptive_day_curve(
+    date: datetime,
+    intakes: IntakeLike,
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    weight_kg: float = USER_WEIGHT_KG,
+    snapshots: Optional[list[dict]] = None,
+    fields: Optional[Iterable[str]] = None,
+    tolerance: float = CURVE_ADAPTIVE_TOLERANCE,
+) -> tuple[list[datetime], list[dict]]:
+    """
+    generate_day_curve on adaptive_day_grid: (times, points) with the same
+    point fields, irregularly spaced. Not cached (the grid depends on the intakes).
+    """
+    times, arrays = adaptive_day_grid(date, intakes, weight_kg, tolerance)
+    hrv_ms = resting_hr = None
+    if snapshots is not None:
+        joined = vitals_asof(times, vitals_series(snapshots))
+        hrv_ms, resting_hr = joined["hrv"], joined["resting_hr"]
+    return times, curve_points(
+        times, arrays, sleep_duration_min, sleep_confidence, hrv_ms, resting_hr, weight_kg, fields,
+    )
+
+
+def generate_range_curves(
+    start: datetime,
+    end: datetime,
+    intakes: IntakeLike,
+    snapshots: Optional[list[dict]] = None,
+    interval_minutes: int = 15,
+    weight_kg: float = USER_WEIGHT_KG,
+) -> Iterator[tuple[str, list[dict]]]:
+    """
+    Day curves for every date in start..end (inclusive), lazily.
+
+    Intakes (from day_window(start)[0] on) and health snapshots are loaded
+    once by the caller for the whole window. Each day superposes the intakes
+    of its own day_window, as /bio-score/curve does. HRV and resting HR are
+    as-of joined onto the grid over the whole snapshot series, so values carry
+    over midnight. Sleep comes from the last snapshot at or before the end of
+    the day. Yields (YYYY-MM-DD, points) so the first day can be sent before
+    the last one is computed.
+    """
+    series = as_intake_series(intakes)
+    snaps = sorted(snapshots or [], key=lambda r: r["timestamp"])
+    snap_ts = [r["timestamp"] for r in snaps]
+
+    vitals_obs = vitals_series(snaps)
+
+    lookback = timedelta(hours=math.ceil(intake_lookback_h(weight_kg)))
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    last = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= last:
+        day_str = day.strftime("%Y-%m-%d")
+        # ISO strings compare like the DB's BETWEEN
+        i = bisect_right(snap_ts, f"{day_str}T23:59:59") - 1
+        snap = snaps[i] if i >= 0 else {}
+        day_series = series.window(day - lookback, day.replace(hour=23, minute=59, second=59))
+        times = day_grid(day, interval_minutes)
+        vitals = vitals_asof(times, vitals_obs)
+        points = compute_bio_score_curve(
+            times, day_series,
+            snap.get("sleep_duration"), snap.get("sleep_confidence"),
+            vitals["hrv"], vitals["resting_hr"], weight_kg,
+        )
+        yield day_str, points
+        day += timedelta(days=1)
@@ -1,6 +1,7 @@
 """
 SQLite database setup and access layer.
-Schema: intake_events, subjective_logs, health_snapshots, water_events, weight_log.
+Schema: intake_events, subjective_logs, health_snapshots, water_events, weight_log,
+pk_fit_params, daily_exposure.
 """
 
 import sqlite3
@@ -98,6 +99,43 @@ CREATE TABLE IF NOT EXISTS weight_log (
 );
 
 CREATE INDEX IF NOT EXISTS idx_weight_ts ON weight_log(timestamp);
+
+CREATE TABLE IF NOT EXISTS pk_fit_params (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    fitted_at   TEXT    NOT NULL,
+    version     INTEGER NOT NULL,
+    data_stamp  TEXT    NOT NULL,
+    substance   TEXT    NOT NULL,
+    status      TEXT    NOT NULL CHECK(status IN ('ok','insufficient_data','rejected')),
+    ka          REAL,
+    ke          REAL,
+    lag_h       REAL    DEFAULT 0,
+    pop_ka      REAL,
+    pop_ke      REAL,
+    baseline    REAL,
+    gain        REAL,
+    r2          REAL,
+    r2_pop      REAL,
+    n_pairs     INTEGER DEFAULT 0,
+    iterations  INTEGER DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_pk_fit_at ON pk_fit_params(fitted_at);
+
+CREATE TABLE IF NOT EXISTS daily_exposure (
+    date            TEXT    NOT NULL,
+    substance       TEXT    NOT NULL,
+    intake_count    INTEGER NOT NULL,
+    dose_mg         REAL    NOT NULL,
+    auc_ng_h_ml     REAL    NOT NULL,
+    cmax_ng_ml      REAL    NOT NULL,
+    tmax            TEXT,
+    threshold_ng_ml REAL    NOT NULL,
+    time_above_h    REAL    NOT NULL,
+    weight_kg       REAL    NOT NULL,
+    computed_at     TEXT    NOT NULL,
+    PRIMARY KEY (date, substance)
+);
 """
 
 
@@ -354,6 +392,38 @@ def query_health_snapshots(start: str, end: str) -> list[dict]:
         return [dict(r) for r in cur.fetchall()]
 
 
+# Timestamped tables readable column-major (Arrow output)
+_COLUMN_TABLES = ("intake_events", "subjective_logs", "health_snapshots")
+
+
+def query_columns(table: str, start: str, end: str,
+                  source: Optional[str] = None) -> dict[str, list]:
+    """
+    Rows of a timestamped table in [start, end] as {column: [values]},
+    straight from the cursor (no per-row dicts). Optional source filter.
+    """
+    if table not in _COLUMN_TABLES:
+        raise ValueError(f"Unknown table {table}")
+    sql = f"SELECT * FROM {table} WHERE timestamp BETWEEN ? AND ?"
+    params: tuple = (start, end)
+    if source is not None:
+        sql += " AND source = ?"
+        params += (source,)
+    with db_cursor() as cur:
+        cur.execute(sql + " ORDER BY timestamp", params)
+        names = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+    values = list(zip(*rows)) if rows else [()] * len(names)
+    return {name: list(col) for name, col in zip(names, values)}
+
+
+def get_intake(intake_id: int) -> Optional[dict]:
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM intake_events WHERE id=?", (intake_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
 def get_latest_intake(substance: str) -> Optional[dict]:
     with db_cursor() as cur:
         cur.execute(
@@ -572,3 +642,68 @@ def query_weight_log(start: str, end: str) -> list[dict]:
             (start, end),
         )
         return [dict(r) for r in cur.fetchall()]
+
+
+# --- Personal PK fit ---
+
+_PK_FIT_COLUMNS = ("fitted_at", "version", "data_stamp", "substance", "status",
+                   "ka", "ke", "lag_h", "pop_ka", "pop_ke", "baseline", "gain",
+                   "r2", "r2_pop", "n_pairs", "iterations")
+
+
+def insert_pk_fits(rows: list[dict]) -> None:
+    """Store one fit run (one row per substance) in a single transaction."""
+    placeholders = ",".join("?" * len(_PK_FIT_COLUMNS))
+    with db_cursor() as cur:
+        cur.executemany(
+            f"INSERT INTO pk_fit_params ({','.join(_PK_FIT_COLUMNS)}) VALUES ({placeholders})",
+            [tuple(r.get(c) for c in _PK_FIT_COLUMNS) for r in rows],
+        )
+
+
+def get_latest_pk_fits() -> list[dict]:
+    """All rows of the most recent fit run (empty if never fitted)."""
+    with db_cursor() as cur:
+        cur.execute(
+            """SELECT * FROM pk_fit_params
+               WHERE fitted_at = (SELECT MAX(fitted_at) FROM pk_fit_params)
+               ORDER BY substance"""
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+# --- Daily exposure ---
+
+_EXPOSURE_COLUMNS = ("date", "substance", "intake_count", "dose_mg", "auc_ng_h_ml",
+                     "cmax_ng_ml", "tmax", "threshold_ng_ml", "time_above_h",
+                     "weight_kg", "computed_at")
+
+
+def upsert_daily_exposure(rows: list[dict]) -> None:
+    """Insert or replace (date, substance) exposure rows in a single transaction."""
+    placeholders = ",".join("?" * len(_EXPOSURE_COLUMNS))
+    with db_cursor() as cur:
+        cur.executemany(
+            f"INSERT OR REPLACE INTO daily_exposure ({','.join(_EXPOSURE_COLUMNS)}) "
+            f"VALUES ({placeholders})",
+            [tuple(r.get(c) for c in _EXPOSURE_COLUMNS) for r in rows],
+        )
+
+
+def query_daily_exposure(start_date: str, end_date: str,
+                         substance: Optional[str] = None) -> list[dict]:
+    sql = "SELECT * FROM daily_exposure WHERE date BETWEEN ? AND ?"
+    params: tuple = (start_date, end_date)
+    if substance is not None:
+        sql += " AND substance = ?"
+        params += (substance,)
+    with db_cursor() as cur:
+        cur.execute(sql + " ORDER BY date, substance", params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+def get_latest_exposure_date() -> Optional[str]:
+    with db_cursor() as cur:
+        cur.execute("SELECT MAX(date) FROM daily_exposure")
+        row = cur.fetchone()
+        return row[0] if row else None
@@ -0,0 +1,251 @@
+"""
+Analytic exposure metrics per substance and day (AUC, Cmax / Tmax, time
+above a threshold), materialized nightly into daily_exposure.
+
+Every normalized shape is a finite sum of terms (Bateman / cascade: pure
+exponentials, linear models with coincident rates: t^p e^(-r t), see
+SubstanceSpec.shape_terms), so the concentration of one substance is
+
+  C(t) = SUM_k A_k SUM_i c_i s^p_i e^(-r_i s),    s = t - onset_k > 0
+  A_k  = Cmax_user * dose_factor_k,               onset_k = intake_k + lag
+
+and its integral has a closed form per term:
+
+  INT_x^y s^p e^(-r s) ds = F(y) - F(x),   F(s) = -e^(-r s) SUM_(j<=p) p!/j! s^j / r^(p-j+1)
+
+Per day [00:00, 24:00):
+
+  auc_ng_h_ml    INT C dt (closed form, intakes from the lookback included)
+  cmax / tmax    largest of: the roots of the analytic C'(t) (maxima), the
+                 segment bounds (day start / end, onsets)
+  time_above_h   measure of {t : C(t) > threshold}, between the roots of
+                 C(t) - threshold
+
+Roots are bracketed by sign changes on an EXPOSURE_SCAN_STEP_H grid (plus
+every onset, where C' jumps) and refined with Brent's method to ROOT_XTOL_H
+(roots.find_crossings, the same finder as the forecast). A PK curve
+changes direction at most once per absorption time scale (>= ~0.4 h), so
+the grid cannot step over a pair of roots.
+
+threshold = EXPOSURE_THRESHOLD_FRACTION x Cmax_user, i.e. a fraction of
+the standard-dose peak. The curve engine's per-intake 0.01 ng/ml display
+cut-off is not applied; it moves the AUC by far less than its rounding.
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+import numpy as np
+
+from app.config import (
+    EXPOSURE_BACKFILL_DAYS,
+    EXPOSURE_RECOMPUTE_DAYS,
+    EXPOSURE_SCAN_STEP_H,
+    EXPOSURE_THRESHOLD_FRACTION,
+    USER_WEIGHT_KG,
+)
+from app.core.bio_engine import LOAD_SPECS, SUBSTANCES, SubstanceSpec, intake_lookback_h
+from app.core.database import (
+    get_latest_exposure_date,
+    get_latest_weight,
+    query_intakes,
+    upsert_daily_exposure,
+)
+from app.core.intake_series import IntakeLike, as_intake_series, to_epoch_us, us_to_hours
+from app.core.roots import find_crossings
+
+log = logging.getLogger("bio.exposure")
+
+# Substances with a daily exposure row: the superposed ng/ml loads + paracetamol
+EXPOSURE_SPECS: tuple[SubstanceSpec, ...] = (
+    tuple(spec for spec, _ in LOAD_SPECS) + (SUBSTANCES["paracetamol"],)
+)
+
+class ExposureCurve:
+    """Closed-form concentration C(t) of one substance; t in hours since an origin."""
+
+    __slots__ = ("onsets", "amps", "coeffs", "powers", "rates")
+
+    def __init__(self, spec: SubstanceSpec, intake_h: np.ndarray, doses: np.ndarray,
+                 weight_kg: float = USER_WEIGHT_KG):
+        terms = spec.shape_terms()
+        if terms is None:
+            raise ValueError(f"{spec.name}: shape has no closed form")
+        self.onsets = np.asarray(intake_h, dtype=float) + spec.lag_h
+        self.amps = spec.cmax(weight_kg) * np.asarray(doses, dtype=float) * spec.dose_scale / spec.ref_dose_mg
+        self.coeffs = np.array(terms[0], dtype=float)
+        self.powers = np.array(terms[1], dtype=int)
+        self.rates = np.array(terms[2], dtype=float)
+
+    def _since(self, t: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        s = np.asarray(t, dtype=float)[:, None] - self.onsets[None, :]
+        return s, np.maximum(s, 0.0)
+
+    def _shape(self, sp: np.ndarray) -> np.ndarray:
+        out = np.zeros(sp.shape)
+        for c, p, r in zip(self.coeffs, self.powers.tolist(), self.rates):
+            out += c * sp ** p * np.exp(-r * sp)
+        return out
+
+    def _kept(self, s: np.ndarray, shape: np.ndarray, cutoff: float) -> np.ndarray:
+        """(T, K) mask of the intake contributions > cutoff ng/ml (engine display cut-off)."""
+        return (s > 0) & (shape * self.amps[None, :] > cutoff)
+
+    def value(self, t: np.ndarray, cutoff: float = 0.0) -> np.ndarray:
+        """
+        C(t) in ng/ml on an array of hours. cutoff > 0 drops every intake
+        contribution <= cutoff, like the curve engine's per-intake cut-offs.
+        """
+        s, sp = self._since(t)
+        shape = self._shape(sp)
+        if cutoff > 0:
+            return np.where(self._kept(s, shape, cutoff), shape, 0.0) @ self.amps
+        return np.where(s > 0, shape, 0.0) @ self.amps
+
+    def derivative(self, t: np.ndarray, cutoff: float = 0.0) -> np.ndarray:
+        """C'(t) (right-sided at onsets); cutoff as in value()."""
+        s, sp = self._since(t)
+        out = np.zeros(s.shape)
+        for c, p, r in zip(self.coeffs, self.powers.tolist(), self.rates):
+            e = np.exp(-r * sp)
+            out -= c * r * sp ** p * e
+            if p:
+                out += c * p * sp ** (p - 1) * e
+        if cutoff > 0:
+            return np.where(self._kept(s, self._shape(sp), cutoff), out, 0.0) @ self.amps
+        return np.where(s >= 0, out, 0.0) @ self.amps
+
+    def integral(self, a: float, b: float) -> float:
+        """INT_a^b C(t) dt in ng*h/ml (closed form)."""
+        lo = np.maximum(a - self.onsets, 0.0)
+        hi = np.maximum(b - self.onsets, 0.0)
+        total = np.zeros(len(self.onsets))
+        for c, p, r in zip(self.coeffs, self.powers.tolist(), self.rates):
+            total += c * (_antiderivative(hi, p, r) - _antiderivative(lo, p, r))
+        return float(total @ self.amps)
+
+    # ── Roots ────────────────────────────────────────────────────────
+
+    def _grid(self, a: float, b: float) -> np.ndarray:
+        n = max(1, math.ceil((b - a) / EXPOSURE_SCAN_STEP_H))
+        inner = self.onsets[(self.onsets > a) & (self.onsets < b)]
+        return np.unique(np.concatenate([np.linspace(a, b, n + 1), inner]))
+
+    def peak(self, a: float, b: float) -> tuple[float, float]:
+        """(tmax, cmax) of C on [a, b]."""
+        grid = self._grid(a, b)
+        # Maxima: C' turns from > 0 to <= 0
+        roots = [t for t, direction in find_crossings(self.derivative, grid) if direction == "down"]
+        candidates = np.concatenate([grid, roots])
+        values = self.value(candidates)
+        j = int(np.argmax(values))
+        return float(candidates[j]), float(values[j])
+
+    def time_above(self, threshold: float, a: float, b: float) -> float:
+        """Hours of [a, b] with C(t) > threshold."""
+        grid = self._grid(a, b)
+
+        def excess(t: np.ndarray) -> np.ndarray:
+            return self.value(t) - threshold
+
+        crossings = [t for t, _ in find_crossings(excess, grid)]
+        points = np.unique(np.concatenate([grid, crossings]))
+        mid = 0.5 * (points[:-1] + points[1:])
+        return float(np.sum(np.diff(points)[excess(mid) > 0]))
+
+
+def _antiderivative(s: np.ndarray, p: int, r: float) -> np.ndarray:
+    """F(s) with F' = s^p e^(-r s) (module docstring)."""
+    poly = np.zeros_like(s)
+    for j in range(p + 1):
+        poly += math.factorial(p) / math.factorial(j) * s ** j / r ** (p - j + 1)
+    return -np.exp(-r * s) * poly
+
+
+# ── Daily metrics ────────────────────────────────────────────────────
+
+def exposure_days(
+    first: datetime,
+    last: datetime,
+    intakes: IntakeLike,
+    weight_kg: float = USER_WEIGHT_KG,
+    threshold_fraction: float = EXPOSURE_THRESHOLD_FRACTION,
+) -> Iterator[dict]:
+    """
+    One row per (day, substance) for every day in [first, last]. `intakes`
+    must include the lookback before `first` (intake_lookback_h).
+    """
+    series = as_intake_series(intakes)
+    origin = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    origin_us = to_epoch_us(origin)
+    n_days = (last.date() - first.date()).days + 1
+    for spec in EXPOSURE_SPECS:
+        tau_us, doses = series.substance(spec.code)
+        intake_h = us_to_hours(tau_us - origin_us)
+        curve = ExposureCurve(spec, intake_h, doses, weight_kg)
+        threshold = threshold_fraction * spec.cmax(weight_kg)
+        for d in range(n_days):
+            a, b = 24.0 * d, 24.0 * (d + 1)
+            in_day = (intake_h >= a) & (intake_h < b)
+            tmax, cmax = curve.peak(a, b)
+            yield {
+                "date": (origin + timedelta(days=d)).strftime("%Y-%m-%d"),
+                "substance": spec.name,
+                "intake_count": int(in_day.sum()),
+                "dose_mg": round(float(doses[in_day].sum() * spec.dose_scale), 1),
+                "auc_ng_h_ml": round(curve.integral(a, b), 1),
+                "cmax_ng_ml": round(cmax, 1),
+                "tmax": (origin + timedelta(hours=tmax)).isoformat(timespec="seconds")
+                if cmax > 0 else None,
+                "threshold_ng_ml": round(threshold, 1),
+                "time_above_h": round(curve.time_above(threshold, a, b), 3),
+                "weight_kg": weight_kg,
+            }
+
+
+def compute_exposure(first: datetime, last: datetime,
+                     weight_kg: float = USER_WEIGHT_KG) -> list[dict]:
+    """Daily exposure rows for [first, last] from the DB (one intake query incl. lookback)."""
+    day = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    lookback = timedelta(hours=math.ceil(intake_lookback_h(weight_kg)))
+    rows = query_intakes((day - lookback).isoformat(), last.strftime("%Y-%m-%dT23:59:59"))
+    return list(exposure_days(first, last, rows, weight_kg))
+
+
+# ── Nightly job ──────────────────────────────────────────────────────
+
+def _current_weight() -> float:
+    latest = get_latest_weight()
+    if latest and latest.get("weight_kg"):
+        return float(latest["weight_kg"])
+    return USER_WEIGHT_KG
+
+
+def run_exposure_job(now: Optional[datetime] = None, full: bool = False) -> int:
+    """
+    Materialize daily_exposure up to yesterday: the first run (or full=True)
+    backfills EXPOSURE_BACKFILL_DAYS, later runs refresh every day since the
+    last stored one plus the trailing EXPOSURE_RECOMPUTE_DAYS (late entries).
+    Returns the number of rows written.
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    last = today - timedelta(days=1)
+    latest = None if full else get_latest_exposure_date()
+    if latest is None:
+        first = today - timedelta(days=EXPOSURE_BACKFILL_DAYS)
+    else:
+        first = min(datetime.fromisoformat(latest) + timedelta(days=1),
+                    today - timedelta(days=EXPOSURE_RECOMPUTE_DAYS))
+    if first > last:
+        return 0
+    rows = compute_exposure(first, last, _current_weight())
+    computed_at = now.isoformat(timespec="seconds")
+    for row in rows:
+        row["computed_at"] = computed_at
+    upsert_daily_exposure(rows)
+    log.info("Daily exposure stored: %s .. %s (%d rows)",
+             first.date().isoformat(), last.date().isoformat(), len(rows))
+    return len(rows)
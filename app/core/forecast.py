@@ -0,0 +1,145 @@
+"""
+Threshold crossings of the superposed curves ("when does caffeine fall
+below the sleep limit", "when does Elvanse leave the peak-focus band").
+
+A target is one substance (ng/ml or relative level, closed form via
+exposure.ExposureCurve) or the composite Bio-Score
+
+  score(t) = clamp(circadian(t) + min(30, 30 E) + min(25, 25 M) + min(15, 15 K)
+                   + sleep_mod + hrv_penalty(max(E, M)), 0, 100)
+
+with E, M (IR + retard), K the relative levels. Both are continuous; the
+slope jumps only at the intake onsets (and, for the score, the circadian
+knots and the caps). Roots of f(t) = target(t) - threshold are
+
+  1. bracketed: f on the sorted onsets + circadian knots, merged with an
+     EXPOSURE_SCAN_STEP_H grid (one vectorized evaluation); every sign
+     change between neighbours is a bracket,
+  2. refined by Brent's method (roots.find_crossings, shared with the
+     exposure metrics) to ROOT_XTOL_H -- typically 6-10 scalar
+     evaluations per crossing instead of a full curve.
+
+Like the exposure metrics this ignores the per-intake display cut-offs
+(LEVEL_CUTOFF / NGML_CUTOFF) and assumes the target does not cross the
+threshold twice within one grid step.
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+from app.config import EXPOSURE_SCAN_STEP_H, USER_WEIGHT_KG
+from app.core.bio_engine import LOAD_SPECS, SUBSTANCES, hrv_penalty, sleep_quality_modifier
+from app.core.curve_engine import _CIRCADIAN_KNOTS_H, circadian_base_score_array
+from app.core.exposure import EXPOSURE_SPECS, ExposureCurve
+from app.core.intake_series import IntakeLike, US_PER_HOUR, as_intake_series, to_epoch_us, us_to_hours
+from app.core.roots import find_crossings
+
+FORECAST_TARGETS: tuple[str, ...] = ("score",) + tuple(spec.name for spec in EXPOSURE_SPECS)
+
+
+# ── Targets ──────────────────────────────────────────────────────────
+
+class _ScoreCurve:
+    """Vectorized composite Bio-Score (see module docstring); t in hours since midnight."""
+
+    __slots__ = ("levels", "sleep_mod", "hrv_ms", "resting_hr")
+
+    def __init__(self, curves: dict[str, ExposureCurve], weight_kg: float,
+                 sleep_duration_min: Optional[float], sleep_confidence: Optional[float],
+                 hrv_ms: Optional[float], resting_hr: Optional[float]):
+        self.levels = {name: (curve, SUBSTANCES[name].cmax(weight_kg))
+                       for name, curve in curves.items()}
+        self.sleep_mod = sleep_quality_modifier(sleep_duration_min, sleep_confidence)
+        self.hrv_ms = hrv_ms
+        self.resting_hr = resting_hr
+
+    def _level(self, name: str, t: np.ndarray) -> np.ndarray:
+        curve, cmax = self.levels[name]
+        return curve.value(t) / cmax
+
+    def value(self, t: np.ndarray) -> np.ndarray:
+        elv = self._level("elvanse", t)
+        med = self._level("medikinet_ir", t) + self._level("medikinet_retard", t)
+        caff = self._level("caffeine", t)
+        raw = (circadian_base_score_array(np.mod(t, 24.0))
+               + np.minimum(30.0, elv * 30.0) + np.minimum(25.0, med * 25.0)
+               + np.minimum(15.0, caff * 15.0) + self.sleep_mod)
+        if self.hrv_ms is not None or self.resting_hr is not None:
+            raw = raw + np.array([hrv_penalty(self.hrv_ms, self.resting_hr, float(s))
+                                  for s in np.maximum(elv, med)])
+        return np.clip(raw, 0.0, 100.0)
+
+
+def forecast_crossings(
+    target: str,
+    threshold: float,
+    start: datetime,
+    hours: float,
+    intakes: IntakeLike,
+    weight_kg: float = USER_WEIGHT_KG,
+    unit: str = "ng_ml",
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    hrv_ms: Optional[float] = None,
+    resting_hr: Optional[float] = None,
+) -> dict:
+    """
+    Crossings of `threshold` by `target` (FORECAST_TARGETS) in
+    [start, start + hours]. Substance thresholds are ng/ml, or relative
+    levels (1.0 = standard-dose peak) with unit="level"; the score uses points.
+    `intakes` must include the lookback before `start` (intake_lookback_h).
+    """
+    if target not in FORECAST_TARGETS:
+        raise ValueError(f"Unknown target: {target}")
+    series = as_intake_series(intakes)
+    origin = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    origin_us = to_epoch_us(origin)
+
+    def curve(name: str) -> ExposureCurve:
+        spec = SUBSTANCES[name]
+        tau_us, doses = series.substance(spec.code)
+        return ExposureCurve(spec, us_to_hours(tau_us - origin_us), doses, weight_kg)
+
+    a = (to_epoch_us(start) - origin_us) / US_PER_HOUR
+    b = a + hours
+    if target == "score":
+        curves = {spec.name: curve(spec.name) for spec, with_level in LOAD_SPECS if with_level}
+        fn = _ScoreCurve(curves, weight_kg, sleep_duration_min, sleep_confidence,
+                         hrv_ms, resting_hr).value
+        kinks = [knot + 24.0 * day for day in range(int(a // 24), int(b // 24) + 1)
+                 for knot in _CIRCADIAN_KNOTS_H]
+        onsets = np.concatenate([c.onsets for c in curves.values()] + [np.array(kinks)])
+        scale, unit = 1.0, "score"
+    else:
+        exposure = curve(target)
+        fn = exposure.value
+        onsets = exposure.onsets
+        scale = SUBSTANCES[target].cmax(weight_kg) if unit == "level" else 1.0
+    threshold_value = threshold * scale
+
+    n = max(1, math.ceil((b - a) / EXPOSURE_SCAN_STEP_H))
+    inner = onsets[(onsets > a) & (onsets < b)]
+    bounds = np.unique(np.concatenate([np.linspace(a, b, n + 1), inner]))
+
+    def excess(t: np.ndarray) -> np.ndarray:
+        return fn(t) - threshold_value
+
+    def at(h: float) -> str:
+        return (origin + timedelta(hours=h)).isoformat(timespec="seconds")
+
+    crossings = [{"time": at(t), "direction": direction}
+                 for t, direction in find_crossings(excess, bounds)]
+    value_now = float(fn(np.array([a]))[0])
+    return {
+        "target": target,
+        "unit": unit,
+        "threshold": threshold,
+        "start": at(a),
+        "end": at(b),
+        "value_at_start": round(value_now / scale, 3),
+        "above_at_start": value_now > threshold_value,
+        "crossings": crossings,
+    }
@@ -14,6 +14,7 @@ from app.core.database import (
     insert_weight, get_latest_weight,
     insert_water_event, get_todays_water_total,
 )
+from app.core.score_cache import score_memo
 
 log = logging.getLogger("bio.ha_importer")
 
@@ -114,6 +115,7 @@ async def poll_and_store():
         return
 
     row_id = insert_health_snapshot(snapshot, source="ha")
+    score_memo.invalidate()
     log.info(
         "Stored health snapshot #%d: hr=%s rhr=%s hrv=%s sleep=%s steps=%s",
         row_id,
@@ -141,6 +143,7 @@ async def poll_and_store():
             if not latest_weight or abs(latest_weight.get("weight_kg", 0) - weight_val) > 0.05:
                 source = "google_fit" if is_google_fit else "ha"
                 insert_weight(weight_val, source=source)
+                score_memo.invalidate()
                 log.info("Updated weight from %s: %.1f kg", source, weight_val)
 
     # --- Water sensor import from HA ---
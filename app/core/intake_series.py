@@ -0,0 +1,211 @@
+"""
+Compact, pre-parsed intake representation for the PK engines.
+
+query_intakes returns sqlite row dicts with ISO timestamps; the engines used
+to call datetime.fromisoformat on every row for every evaluated instant.
+IntakeSeries parses once per request and keeps struct-of-arrays columns:
+
+  epoch_us  int64    microseconds since 1970-01-01 (exact Heaviside / windows)
+  epoch_h   float64  hours since 1970-01-01
+  dose_mg   float64  dose with the substance default already applied
+  codes     int8     substance code (see SUBSTANCE_CODES)
+  ids       int64    intake_events.id (-1 if the row had none)
+
+Rows are stored grouped by substance code and sorted by time inside each
+group, so every per-substance view is a contiguous, time-ordered slice.
+Each slice also gets a prefix sum of its doses (cumulative-dose index):
+
+  P[0] = 0,  P[i] = D_0 + ... + D_(i-1)
+  dose in [t - W, t] = P[hi] - P[lo]
+      lo = searchsorted(tau, t - W, "left"),  hi = searchsorted(tau, t, "right")
+
+so any rolling-window dose total costs two binary searches, also for a
+whole grid of t at once.
+
+Naive timestamps are interpreted as wall-clock time (the DB stores
+datetime.now().isoformat()); aware timestamps are converted to UTC.
+"""
+
+import warnings
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from app.config import (
+    ELVANSE_DEFAULT_DOSE_MG,
+    MATE_CAFFEINE_MG,
+    MEDIKINET_DEFAULT_DOSE_MG,
+    MEDIKINET_RETARD_DEFAULT_DOSE_MG,
+    CO_DAFALGAN_DEFAULT_DOSE_MG,
+)
+
+# Integer codes for intake_events.substance (order = CHECK constraint order)
+SUBSTANCE_CODES: dict[str, int] = {
+    "elvanse": 0,
+    "mate": 1,
+    "medikinet": 2,
+    "medikinet_retard": 3,
+    "co_dafalgan": 4,
+    "other": 5,
+}
+SUBSTANCE_NAMES: tuple[str, ...] = tuple(SUBSTANCE_CODES)
+N_SUBSTANCES = len(SUBSTANCE_NAMES)
+
+# Standard dose per intake substance ("other" has none)
+DEFAULT_DOSE_MG: dict[str, float] = {
+    "elvanse": ELVANSE_DEFAULT_DOSE_MG,
+    "mate": MATE_CAFFEINE_MG,
+    "medikinet": MEDIKINET_DEFAULT_DOSE_MG,
+    "medikinet_retard": MEDIKINET_RETARD_DEFAULT_DOSE_MG,
+    "co_dafalgan": CO_DAFALGAN_DEFAULT_DOSE_MG,
+}
+
+# Applied when dose_mg is NULL/0 (same `dose or default` rule as the engine)
+_DEFAULT_DOSE_BY_CODE = np.array(
+    [DEFAULT_DOSE_MG.get(name, 0.0) for name in SUBSTANCE_NAMES], dtype=float,
+)
+
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+US_PER_HOUR = 3_600_000_000
+
+
+def to_epoch_us(dt: datetime) -> int:
+    """Datetime -> integer microseconds since 1970-01-01 (see module docstring)."""
+    if dt.tzinfo is None:
+        return (dt - _EPOCH_NAIVE) // _US
+    return (dt - _EPOCH_UTC) // _US
+
+
+def parse_epoch_us(timestamps: Sequence[str]) -> np.ndarray:
+    """
+    ISO timestamps -> int64 epoch microseconds, same result as to_epoch_us.
+    Naive timestamps are parsed in one datetime64 conversion; any
+    offset-aware string (NumPy warns on those) falls back to fromisoformat.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            return np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+    except (ValueError, DeprecationWarning):
+        return np.array([to_epoch_us(datetime.fromisoformat(ts)) for ts in timestamps],
+                        dtype=np.int64)
+
+
+def us_to_hours(delta_us):
+    """Microsecond offsets -> hours, rounded like timedelta.total_seconds() / 3600."""
+    return delta_us / 1e6 / 3600.0
+
+
+class IntakeSeries:
+    """Array-backed, pre-parsed intake list (see module docstring)."""
+
+    __slots__ = ("epoch_us", "epoch_h", "dose_mg", "codes", "ids", "_bounds", "_prefix")
+
+    def __init__(self, epoch_us: np.ndarray, dose_mg: np.ndarray,
+                 codes: np.ndarray, ids: Optional[np.ndarray] = None):
+        n = len(epoch_us)
+        if ids is None:
+            ids = np.full(n, -1, dtype=np.int64)
+        # Group by substance, time-ordered within each group
+        order = np.lexsort((epoch_us, codes))
+        self.epoch_us = np.ascontiguousarray(epoch_us[order], dtype=np.int64)
+        self.epoch_h = self.epoch_us / 1e6 / 3600.0
+        self.dose_mg = np.ascontiguousarray(dose_mg[order], dtype=float)
+        self.codes = np.ascontiguousarray(codes[order], dtype=np.int8)
+        self.ids = np.ascontiguousarray(ids[order], dtype=np.int64)
+        self._bounds = np.searchsorted(self.codes, np.arange(N_SUBSTANCES + 1))
+        # Per-substance prefix sums (own base per slice, no cross-substance residue)
+        self._prefix = tuple(
+            np.concatenate(([0.0], np.cumsum(self.dose_mg[lo:hi])))
+            for lo, hi in zip(self._bounds[:-1], self._bounds[1:])
+        )
+
+    # ── Construction ─────────────────────────────────────────────────
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> "IntakeSeries":
+        """Build from query_intakes() rows. Parses each timestamp exactly once."""
+        epoch, dose, codes, ids = [], [], [], []
+        for row in rows:
+            code = SUBSTANCE_CODES.get(row.get("substance"))
+            if code is None:
+                continue
+            epoch.append(to_epoch_us(datetime.fromisoformat(row["timestamp"])))
+            dose.append(row.get("dose_mg") or 0.0)
+            codes.append(code)
+            ids.append(row.get("id") if row.get("id") is not None else -1)
+        codes_arr = np.array(codes, dtype=np.int8)
+        dose_arr = np.array(dose, dtype=float)
+        missing = dose_arr == 0
+        dose_arr[missing] = _DEFAULT_DOSE_BY_CODE[codes_arr[missing]]
+        return cls(
+            np.array(epoch, dtype=np.int64), dose_arr, codes_arr,
+            np.array(ids, dtype=np.int64),
+        )
+
+    @classmethod
+    def empty(cls) -> "IntakeSeries":
+        return cls(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int8))
+
+    # ── Access ───────────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self.epoch_us)
+
+    def __repr__(self) -> str:
+        counts = {n: self.count(n) for n in SUBSTANCE_NAMES if self.count(n)}
+        return f"IntakeSeries({len(self)} intakes, {counts})"
+
+    def _slice(self, substance: Union[str, int]) -> slice:
+        code = SUBSTANCE_CODES[substance] if isinstance(substance, str) else substance
+        return slice(int(self._bounds[code]), int(self._bounds[code + 1]))
+
+    def substance(self, substance: Union[str, int]) -> tuple[np.ndarray, np.ndarray]:
+        """(epoch_us, dose_mg) of one substance, time-ordered (views, no copy)."""
+        sl = self._slice(substance)
+        return self.epoch_us[sl], self.dose_mg[sl]
+
+    def substance_ids(self, substance: Union[str, int]) -> np.ndarray:
+        """Row ids aligned with substance() (-1 where the row had none)."""
+        return self.ids[self._slice(substance)]
+
+    def count(self, substance: Union[str, int]) -> int:
+        sl = self._slice(substance)
+        return sl.stop - sl.start
+
+    def has(self, substance: Union[str, int]) -> bool:
+        return self.count(substance) > 0
+
+    def window_dose(self, substance: Union[str, int], t_us, window_us: int):
+        """
+        (count, dose_mg) of the intakes with t - window <= timestamp <= t,
+        from the cumulative-dose index. t_us may be a scalar or an array
+        of epoch microseconds (results broadcast accordingly).
+        """
+        code = SUBSTANCE_CODES[substance] if isinstance(substance, str) else substance
+        tau, _ = self.substance(code)
+        t_us = np.asarray(t_us, dtype=np.int64)
+        lo = np.searchsorted(tau, t_us - window_us, side="left")
+        hi = np.searchsorted(tau, t_us, side="right")
+        prefix = self._prefix[code]
+        return hi - lo, prefix[hi] - prefix[lo]
+
+    def window(self, start: datetime, end: datetime) -> "IntakeSeries":
+        """Sub-series with start <= timestamp <= end."""
+        lo, hi = to_epoch_us(start), to_epoch_us(end)
+        mask = (self.epoch_us >= lo) & (self.epoch_us <= hi)
+        return IntakeSeries(self.epoch_us[mask], self.dose_mg[mask],
+                            self.codes[mask], self.ids[mask])
+
+
+IntakeLike = Union[IntakeSeries, list[dict]]
+
+
+def as_intake_series(intakes: IntakeLike) -> IntakeSeries:
+    """Adapter: accept either a ready IntakeSeries or query_intakes() rows."""
+    if isinstance(intakes, IntakeSeries):
+        return intakes
+    return IntakeSeries.from_rows(intakes)
@@ -0,0 +1,402 @@
+"""
+Personal PK parameter fit from subjective focus logs.
+
+For every substance with a relative level (Elvanse, Medikinet IR / retard,
+caffeine) the personal absorption rate ka, elimination rate ke and an
+absorption lag are estimated from the focus ratings of the last
+PK_FIT_DAYS days:
+
+  focus_i ~ a + b_s * L_s(t_i; theta_s) + SUM_{u != s} b_u * L_u(t_i)
+  L_s(t)  = SUM_k df_k * raw(t - tau_k - lag) / raw(tmax)          theta = (ln ka, ln ke, lag)
+
+raw is the Bateman / cascade amount with the candidate rates. The peak is
+normalized analytically: tmax = ln(ka/ke) / (ka - ke) for Bateman, and the
+Newton solver for the cascade (linear compartment models: the engine's
+numerical peak, ka / ke = first / last flow). For Elvanse, "ka" is the hydrolysis rate
+(ELVANSE_KA); the GI absorption rate stays fixed. a and all b enter
+linearly and are solved by least squares for every theta (variable
+projection), so only theta is searched nonlinearly. Co-administered
+substances are fitted block-wise: each substance is fitted with the other
+substances' current levels as covariates. This runs for _SWEEPS sweeps, so
+e.g. the caffeine fit does not absorb the Elvanse effect.
+
+The fit minimises a penalised least-squares cost (MAP with a log-normal
+prior at the population values, same CVs as the uncertainty bands):
+
+  cost = SUM_i r_i^2 / s^2 + SUM_j ((theta_j - theta0_j) / sigma_j)^2
+
+s^2 is the residual variance of the population model. The solver is
+Levenberg-Marquardt with a forward-difference Jacobian. Each iteration
+evaluates the P+1 parameter sets as one (M, N, K) broadcast.
+
+A fit is accepted (status "ok") only with >= PK_FIT_MIN_PAIRS exposed logs
+and a positive gain b. Otherwise the population parameters stay in use.
+Results are stored per run in pk_fit_params with a version stamp. The
+nightly job skips the refit when neither the engine version nor the input
+data changed.
+"""
+
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+from app.config import (
+    PK_FIT_DAYS,
+    PK_FIT_MAX_LAG_H,
+    PK_FIT_MIN_PAIRS,
+    PK_MC_CV_KA,
+    PK_MC_CV_KE,
+    USER_WEIGHT_KG,
+)
+from app.core.bio_engine import (
+    LEVEL_CUTOFF,
+    LOAD_SPECS,
+    SubstanceSpec,
+    _cascade_raw,
+    _cascade_tmax,
+    intake_lookback_h,
+)
+from app.core.compartment import bateman_raw_batch, cascade_raw_batch
+from app.core.database import (
+    get_latest_pk_fits,
+    insert_pk_fits,
+    query_intakes,
+    query_subjective_logs,
+)
+from app.core.intake_series import IntakeSeries, to_epoch_us, us_to_hours
+
+log = logging.getLogger("bio.pk_fit")
+
+# Bump when the model or objective changes: stored fits of an older
+# version are ignored and the next job run refits.
+PK_FIT_VERSION = 1
+
+# Index of (ka, ke) in spec.rates (linear models: first / last flow, see _rate_index)
+_FIT_RATE_INDEX = {"bateman": (0, 1), "cascade": (1, 2)}
+# Forward-difference steps for (ln ka, ln ke, lag)
+_FD_STEP = np.array([1e-4, 1e-4, 1e-3])
+# Minimum ka / ke ratio (keeps the Bateman branch identifiable: the
+# normalized shape is symmetric in ka <-> ke)
+_MIN_RATE_RATIO = 1.05
+_MAX_ITER = 50
+_SWEEPS = 2
+
+_PERSONAL_LOCK = threading.Lock()
+_PERSONAL_SPECS: Optional[tuple[tuple[SubstanceSpec, bool], ...]] = None
+
+
+def _lognormal_sigma(cv: float) -> float:
+    return math.sqrt(math.log(1.0 + cv * cv))
+
+
+def _rate_index(spec: SubstanceSpec) -> tuple[int, int]:
+    """(ka, ke) positions in spec.rates; a linear model absorbs by its first and eliminates by its last flow."""
+    return _FIT_RATE_INDEX.get(spec.model, (0, len(spec.rates) - 1))
+
+
+# ── Vectorized objective ─────────────────────────────────────────────
+
+class _Problem:
+    """Pre-computed (N logs x K intakes) data of one substance fit."""
+
+    __slots__ = ("spec", "hours", "dose_factors", "focus", "covariates",
+                 "x0", "prior_sigma")
+
+    def __init__(self, spec: SubstanceSpec, hours: np.ndarray,
+                 dose_factors: np.ndarray, focus: np.ndarray):
+        self.spec = spec
+        self.hours = hours
+        self.dose_factors = dose_factors
+        self.focus = focus
+        self.covariates = np.zeros((len(focus), 0))  # (N, C) other substances' levels
+        i_ka, i_ke = _rate_index(spec)
+        self.x0 = np.array([math.log(spec.rates[i_ka]), math.log(spec.rates[i_ke]), 0.0])
+        self.prior_sigma = np.array([
+            _lognormal_sigma(PK_MC_CV_KA), _lognormal_sigma(PK_MC_CV_KE),
+            PK_FIT_MAX_LAG_H / 2.0,
+        ])
+
+    def rates(self, x: np.ndarray) -> np.ndarray:
+        """(M, P) full rate vectors for parameter rows x (M, 3)."""
+        rates = np.tile(np.array(self.spec.rates, dtype=float), (len(x), 1))
+        i_ka, i_ke = _rate_index(self.spec)
+        rates[:, i_ka] = np.exp(x[:, 0])
+        rates[:, i_ke] = np.exp(x[:, 1])
+        return rates
+
+    def levels(self, x: np.ndarray) -> np.ndarray:
+        """(M, N) superposed relative level at every log time, one row per theta."""
+        rates = self.rates(x)
+        t = self.hours[None, :, :] - x[:, 2, None, None]
+        r = rates[:, :, None, None]
+        if self.spec.model == "linear":
+            model = self.spec.compartments
+            raw = model.raw_batch(rates, t)
+            peak = np.array([model.with_rates(row).peak for row in rates.tolist()])
+        elif self.spec.model == "cascade":
+            raw = cascade_raw_batch(t, r[:, 0], r[:, 1], r[:, 2])
+            peak = np.array([_cascade_raw(_cascade_tmax(*row), *row) for row in rates.tolist()])
+        else:
+            raw = bateman_raw_batch(t, r[:, 0], r[:, 1])
+            ka, ke = rates[:, 0], rates[:, 1]
+            tmax = np.log(ka / ke) / (ka - ke)
+            peak = (ka / (ka - ke)) * (np.exp(-ke * tmax) - np.exp(-ka * tmax))
+        total = raw @ self.dose_factors
+        return total / np.where(peak > 0, peak, np.inf)[:, None]
+
+    def feasible(self, x: np.ndarray) -> bool:
+        rates = self.rates(x[None, :])[0]
+        i_ka, i_ke = _rate_index(self.spec)
+        if rates[i_ka] < _MIN_RATE_RATIO * rates[i_ke]:
+            return False
+        if self.spec.model == "cascade" and abs(rates[0] - rates[1]) < 1e-3:
+            return False
+        return 0.0 <= x[2] <= PK_FIT_MAX_LAG_H
+
+
+def _linear_fit(levels: np.ndarray, focus: np.ndarray,
+                covariates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Least squares focus ~ a + b*L + covariates @ c, one system per row of
+    levels (M, N). Returns (coefficients (M, 2 + C) = [a, b, c...], residuals (M, N)).
+    """
+    m, n = levels.shape
+    design = np.concatenate([
+        np.ones((m, n, 1)),
+        levels[:, :, None],
+        np.broadcast_to(covariates, (m, n, covariates.shape[1])),
+    ], axis=2)
+    gram = design.transpose(0, 2, 1) @ design
+    # Tiny ridge keeps all-zero columns (no exposure yet) solvable
+    gram += 1e-9 * np.eye(gram.shape[1])
+    coef = np.linalg.solve(gram, (design.transpose(0, 2, 1) @ focus)[:, :, None])[:, :, 0]
+    return coef, focus[None, :] - (design @ coef[:, :, None])[:, :, 0]
+
+
+def _levenberg_marquardt(problem: _Problem, noise_var: float,
+                         start: np.ndarray) -> tuple[np.ndarray, int]:
+    """Minimise the penalised cost (module docstring) from `start`. Returns (theta, iterations)."""
+    scale = 1.0 / math.sqrt(noise_var)
+
+    def residuals(x_rows: np.ndarray) -> np.ndarray:
+        _, res = _linear_fit(problem.levels(x_rows), problem.focus, problem.covariates)
+        prior = (x_rows - problem.x0) / problem.prior_sigma
+        return np.concatenate([res * scale, prior], axis=1)
+
+    x = start.copy()
+    r = residuals(x[None, :])[0]
+    cost = float(r @ r)
+    lam = 1e-2
+    it = 0
+    for it in range(1, _MAX_ITER + 1):
+        # Base point + one forward-difference point per parameter in one batch
+        batch = np.vstack([x, x + np.diag(_FD_STEP)])
+        rb = residuals(batch)
+        jac = ((rb[1:] - rb[0]) / _FD_STEP[:, None]).T
+        jtj = jac.T @ jac
+        grad = jac.T @ rb[0]
+
+        improved = False
+        while lam < 1e8:
+            step = np.linalg.solve(jtj + lam * np.diag(np.diag(jtj) + 1e-9), -grad)
+            x_new = x + step
+            x_new[2] = min(max(x_new[2], 0.0), PK_FIT_MAX_LAG_H)
+            if problem.feasible(x_new):
+                r_new = residuals(x_new[None, :])[0]
+                cost_new = float(r_new @ r_new)
+                if cost_new < cost:
+                    improved = True
+                    break
+            lam *= 10.0
+        if not improved:
+            break
+        converged = cost - cost_new <= 1e-10 * max(cost, 1.0) or np.max(np.abs(x_new - x)) < 1e-8
+        x, cost = x_new, cost_new
+        lam = max(lam / 10.0, 1e-9)
+        if converged:
+            break
+    return x, it
+
+
+# ── Fit driver ───────────────────────────────────────────────────────
+
+def _empty_row(spec: SubstanceSpec) -> dict:
+    i_ka, i_ke = _rate_index(spec)
+    return {
+        "substance": spec.name, "status": "insufficient_data",
+        "ka": spec.rates[i_ka], "ke": spec.rates[i_ke], "lag_h": 0.0,
+        "pop_ka": spec.rates[i_ka], "pop_ke": spec.rates[i_ke],
+        "baseline": None, "gain": None, "r2": None, "r2_pop": None,
+        "n_pairs": 0, "iterations": 0,
+    }
+
+
+def _fit_all(problems: dict[str, _Problem], focus: np.ndarray) -> dict[str, dict]:
+    """Block-coordinate fit of all substances with enough exposed logs."""
+    names = list(problems)
+    x = {name: p.x0.copy() for name, p in problems.items()}
+    levels = {name: p.levels(p.x0[None, :])[0] for name, p in problems.items()}
+    iterations = dict.fromkeys(names, 0)
+
+    def others(name: str) -> np.ndarray:
+        cols = [levels[o] for o in names if o != name]
+        return np.stack(cols, axis=1) if cols else np.zeros((len(focus), 0))
+
+    # Population model: the noise scale s^2 and the r2_pop reference
+    total_ss = float(((focus - focus.mean()) ** 2).sum())
+    _, res_pop = _linear_fit(levels[names[0]][None, :], focus, others(names[0]))
+    rss_pop = float(res_pop[0] @ res_pop[0])
+    noise_var = max(rss_pop / max(len(focus) - 1 - len(names), 1), 1e-6)
+
+    for _ in range(_SWEEPS):
+        for name in names:
+            p = problems[name]
+            p.covariates = others(name)
+            x[name], it = _levenberg_marquardt(p, noise_var, x[name])
+            iterations[name] += it
+            levels[name] = p.levels(x[name][None, :])[0]
+
+    rows = {}
+    for name in names:
+        p = problems[name]
+        coef, res = _linear_fit(levels[name][None, :], focus, others(name))
+        rss = float(res[0] @ res[0])
+        rates = p.rates(x[name][None, :])[0]
+        i_ka, i_ke = _rate_index(p.spec)
+        row = _empty_row(p.spec)
+        row.update({
+            "status": "ok" if coef[0, 1] > 0 else "rejected",
+            "ka": round(float(rates[i_ka]), 5),
+            "ke": round(float(rates[i_ke]), 5),
+            "lag_h": round(float(x[name][2]), 3),
+            "baseline": round(float(coef[0, 0]), 3),
+            "gain": round(float(coef[0, 1]), 3),
+            "r2": round(1.0 - rss / total_ss, 4) if total_ss > 0 else None,
+            "r2_pop": round(1.0 - rss_pop / total_ss, 4) if total_ss > 0 else None,
+            "n_pairs": int((p.levels(p.x0[None, :])[0] > LEVEL_CUTOFF).sum()),
+            "iterations": iterations[name],
+        })
+        rows[name] = row
+    return rows
+
+
+def _load_inputs(now: datetime, weight_kg: float) -> tuple[list[dict], list[dict], str]:
+    start = now - timedelta(days=PK_FIT_DAYS)
+    logs = [r for r in query_subjective_logs(start.isoformat(), now.isoformat())
+            if r.get("focus") is not None]
+    lookback = start - timedelta(hours=math.ceil(intake_lookback_h(weight_kg)))
+    intakes = query_intakes(lookback.isoformat(), now.isoformat())
+    stamp = "|".join([
+        start.strftime("%Y-%m-%d"),
+        f"logs={len(logs)}@{max((r['id'] for r in logs), default=0)}",
+        f"intakes={len(intakes)}@{max((r['id'] for r in intakes), default=0)}",
+    ])
+    return logs, intakes, stamp
+
+
+def fit_personal_pk(now: Optional[datetime] = None,
+                    weight_kg: float = USER_WEIGHT_KG) -> tuple[list[dict], str]:
+    """Fit every level substance on the last PK_FIT_DAYS days. Returns (rows, data_stamp)."""
+    now = now or datetime.now()
+    logs, intakes, stamp = _load_inputs(now, weight_kg)
+    log_us = np.array([to_epoch_us(datetime.fromisoformat(r["timestamp"])) for r in logs],
+                      dtype=np.int64)
+    focus = np.array([float(r["focus"]) for r in logs])
+    series = IntakeSeries.from_rows(intakes)
+
+    rows = {spec.name: _empty_row(spec) for spec, with_level in LOAD_SPECS if with_level}
+    problems = {}
+    for spec, with_level in LOAD_SPECS:
+        tau_us, dose = series.substance(spec.code)
+        if not with_level or not len(tau_us) or len(focus) < PK_FIT_MIN_PAIRS:
+            continue
+        problem = _Problem(
+            spec,
+            us_to_hours(log_us[:, None] - tau_us[None, :]),
+            dose * spec.dose_scale / spec.ref_dose_mg,
+            focus,
+        )
+        n_pairs = int((problem.levels(problem.x0[None, :])[0] > LEVEL_CUTOFF).sum())
+        rows[spec.name]["n_pairs"] = n_pairs
+        if n_pairs >= PK_FIT_MIN_PAIRS:
+            problems[spec.name] = problem
+    if problems:
+        rows.update(_fit_all(problems, focus))
+    return list(rows.values()), stamp
+
+
+def run_fit_job(force: bool = False) -> dict:
+    """
+    Background job: refit and store a new run unless the latest stored run
+    has the same version and data stamp (force=True always refits).
+    """
+    now = datetime.now()
+    latest = get_latest_pk_fits()
+    if not force and latest and latest[0]["version"] == PK_FIT_VERSION:
+        _, _, stamp = _load_inputs(now, USER_WEIGHT_KG)
+        if latest[0]["data_stamp"] == stamp:
+            log.info("PK fit skipped (inputs unchanged since %s)", latest[0]["fitted_at"])
+            return fit_summary(latest)
+
+    rows, stamp = fit_personal_pk(now)
+    fitted_at = now.isoformat(timespec="seconds")
+    for row in rows:
+        row.update(fitted_at=fitted_at, version=PK_FIT_VERSION, data_stamp=stamp)
+    insert_pk_fits(rows)
+    reload_personal_specs()
+    log.info("PK fit stored: %s", ", ".join(f"{r['substance']}={r['status']}" for r in rows))
+    return fit_summary(rows)
+
+
+# ── Stored fits ──────────────────────────────────────────────────────
+
+def fit_summary(rows: Optional[list[dict]] = None) -> Optional[dict]:
+    """Latest stored run as API dict (None if never fitted). Never refits."""
+    rows = get_latest_pk_fits() if rows is None else rows
+    if not rows:
+        return None
+    fields = ("status", "ka", "ke", "lag_h", "pop_ka", "pop_ke", "baseline",
+              "gain", "r2", "r2_pop", "n_pairs", "iterations")
+    return {
+        "fitted_at": rows[0]["fitted_at"],
+        "version": rows[0]["version"],
+        "current": rows[0]["version"] == PK_FIT_VERSION,
+        "data_stamp": rows[0]["data_stamp"],
+        "substances": {r["substance"]: {f: r.get(f) for f in fields} for r in rows},
+    }
+
+
+def _build_personal_specs() -> tuple[tuple[SubstanceSpec, bool], ...]:
+    fits = {r["substance"]: r for r in get_latest_pk_fits()
+            if r["version"] == PK_FIT_VERSION and r["status"] == "ok"}
+    specs = []
+    for spec, with_level in LOAD_SPECS:
+        fit = fits.get(spec.name)
+        if fit is not None:
+            rates = list(spec.rates)
+            i_ka, i_ke = _rate_index(spec)
+            rates[i_ka], rates[i_ke] = fit["ka"], fit["ke"]
+            spec = SubstanceSpec(spec.name, spec.intake, spec.model, tuple(rates),
+                                 spec.ref_dose_mg, spec.dose_scale, lag_h=fit["lag_h"] or 0.0,
+                                 compartments=spec.compartments)
+        specs.append((spec, with_level))
+    return tuple(specs)
+
+
+def personal_load_specs() -> tuple[tuple[SubstanceSpec, bool], ...]:
+    """LOAD_SPECS with accepted personal fits swapped in (loaded once, reloaded by the job)."""
+    global _PERSONAL_SPECS
+    with _PERSONAL_LOCK:
+        if _PERSONAL_SPECS is None:
+            _PERSONAL_SPECS = _build_personal_specs()
+        return _PERSONAL_SPECS
+
+
+def reload_personal_specs() -> None:
+    global _PERSONAL_SPECS
+    with _PERSONAL_LOCK:
+        _PERSONAL_SPECS = _build_personal_specs()
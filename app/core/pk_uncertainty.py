@@ -0,0 +1,155 @@
+"""
+Monte Carlo population-variability bands for concentration curves.
+
+The deterministic engine uses one parameter set per substance. Between
+subjects, ka, ke and Vd vary by roughly 20-40%. This module samples N
+parameter sets, each log-normal with its median at the config value:
+
+  theta_n = theta_0 * exp(sigma * z_n),   sigma = sqrt(ln(1 + CV^2)),   z_n ~ N(0, 1)
+
+and evaluates all of them on the time grid as one (N, T, K) broadcast
+(N samples x T grid points x K intakes):
+
+  C_n(t) = Cmax_user * (Vd_0 / Vd_n) * SUM_k df_k * raw_n(t - tau_k) / raw_0(tmax_0)
+
+raw_n is the un-normalized Bateman, cascade or linear-compartment amount
+with the sampled rates (linear models: one batched eigendecomposition per
+chunk, compartment.CompartmentModel.raw_batch). It is divided by the reference peak, not the sample's own peak,
+so faster absorption or slower elimination raises the peak height the
+way it would in a real subject. At the median parameters C_n equals the
+deterministic curve. The per-intake ng/ml cut-off is applied as in the
+engine.
+
+The result is the p5 / p50 / p95 of C_n(t) over n for each grid point.
+Large N is split into chunks and evaluated on a process pool
+(PK_MC_WORKERS) so N = 5000 stays interactive.
+"""
+
+import math
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from app.config import (
+    PK_MC_CV_KA,
+    PK_MC_CV_KE,
+    PK_MC_CV_VD,
+    PK_MC_POOL_MIN_SAMPLES,
+    PK_MC_WORKERS,
+    USER_WEIGHT_KG,
+)
+from app.core.bio_engine import LOAD_SPECS, NGML_CUTOFF, SubstanceSpec
+from app.core.compartment import CompartmentModel, bateman_raw_batch, cascade_raw_batch
+from app.core.intake_series import IntakeLike, as_intake_series, to_epoch_us, us_to_hours
+from app.core.process_pool import get_pool
+
+# Output band -> specs summed into it (same grouping as the curve points)
+BAND_GROUPS = {
+    "elvanse_ng_ml": ("elvanse",),
+    "medikinet_ng_ml": ("medikinet_ir", "medikinet_retard"),
+    "caffeine_ng_ml": ("caffeine",),
+    "codein_ng_ml": ("codein",),
+}
+PERCENTILES = (5, 50, 95)
+
+# Upper bound for one (n, T, K) temporary, in elements (~16 MB of float64)
+_CHUNK_ELEMENTS = 2_000_000
+
+
+def _lognormal_sigma(cv: float) -> float:
+    return math.sqrt(math.log(1.0 + cv * cv))
+
+
+def _evaluate_chunk(jobs: list[tuple]) -> dict[str, np.ndarray]:
+    """
+    Worker: concentration samples (n, T) per spec name.
+
+    Each job is (name, model, hours (T, K), dose_factors (K,),
+    rates (n, P), vd_scale (n,), amplitude). amplitude = Cmax_user / raw_0(tmax_0).
+    model is "bateman", "cascade" or the CompartmentModel of a linear spec.
+    Top-level and NumPy-only so it pickles into the process pool.
+    """
+    out = {}
+    for name, model, hours, dose_factors, rates, vd_scale, amplitude in jobs:
+        n = rates.shape[0]
+        t_len, k_len = hours.shape
+        total = np.zeros((n, t_len))
+        if k_len:
+            step = max(1, _CHUNK_ELEMENTS // max(1, t_len * k_len))
+            t = hours[None, :, :]
+            for lo in range(0, n, step):
+                r = rates[lo:lo + step, :, None, None]
+                if isinstance(model, CompartmentModel):
+                    raw = model.raw_batch(rates[lo:lo + step], t)
+                elif model == "cascade":
+                    raw = cascade_raw_batch(t, r[:, 0], r[:, 1], r[:, 2])
+                else:
+                    raw = bateman_raw_batch(t, r[:, 0], r[:, 1])
+                scale = (amplitude * vd_scale[lo:lo + step])[:, None, None]
+                contrib = raw * scale * dose_factors[None, None, :]
+                contrib = np.where(contrib > NGML_CUTOFF, contrib, 0.0)
+                total[lo:lo + step] = contrib.sum(axis=2)
+        out[name] = total
+    return out
+
+
+# ── Sampling + dispatch ──────────────────────────────────────────────
+
+def _sample_rates(spec: SubstanceSpec, n: int, rng: np.random.Generator) -> np.ndarray:
+    """(n, P) log-normal rate constants; the last rate is the elimination rate."""
+    base = np.array(spec.rates, dtype=float)
+    sigma = np.full(len(base), _lognormal_sigma(PK_MC_CV_KA))
+    sigma[-1] = _lognormal_sigma(PK_MC_CV_KE)
+    return base[None, :] * np.exp(sigma[None, :] * rng.standard_normal((n, len(base))))
+
+
+def concentration_bands(
+    times: list[datetime],
+    intakes: IntakeLike,
+    n_samples: int,
+    weight_kg: float = USER_WEIGHT_KG,
+    seed: Optional[int] = 0,
+) -> dict[str, dict[str, list[float]]]:
+    """
+    p5 / p50 / p95 concentration bands (ng/ml) on the grid, keyed like the
+    curve point fields (elvanse_ng_ml, medikinet_ng_ml, ...).
+    A fixed seed (default 0) keeps the bands stable between refreshes.
+    """
+    series = as_intake_series(intakes)
+    grid_us = np.array([to_epoch_us(t) for t in times], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    sigma_vd = _lognormal_sigma(PK_MC_CV_VD)
+
+    jobs = []
+    for spec, _ in LOAD_SPECS:
+        tau_us, dose = series.substance(spec.code)
+        hours = us_to_hours(grid_us[:, None] - tau_us[None, :]) - spec.lag_h
+        rates = _sample_rates(spec, n_samples, rng)
+        vd_scale = np.exp(-sigma_vd * rng.standard_normal(n_samples))  # Vd_0 / Vd_n
+        amplitude = spec.cmax(weight_kg) / spec.peak if spec.peak > 0 else 0.0
+        dose_factors = dose * spec.dose_scale / spec.ref_dose_mg
+        model = spec.compartments if spec.model == "linear" else spec.model
+        jobs.append((spec.name, model, hours, dose_factors, rates, vd_scale, amplitude))
+
+    n_workers = min(PK_MC_WORKERS, max(1, n_samples // max(1, PK_MC_POOL_MIN_SAMPLES)))
+    if n_samples < PK_MC_POOL_MIN_SAMPLES or n_workers < 2:
+        samples = _evaluate_chunk(jobs)
+    else:
+        bounds = np.linspace(0, n_samples, n_workers + 1).astype(int)
+        chunks = [
+            [(name, model, hours, df, rates[lo:hi], vd[lo:hi], amp)
+             for name, model, hours, df, rates, vd, amp in jobs]
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        parts = list(get_pool().map(_evaluate_chunk, chunks))
+        samples = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+    bands = {}
+    for key, names in BAND_GROUPS.items():
+        total = sum(samples[name] for name in names)
+        pct = np.percentile(total, PERCENTILES, axis=0)
+        bands[key] = {
+            f"p{p}": np.round(row, 1).tolist() for p, row in zip(PERCENTILES, pct)
+        }
+    return bands
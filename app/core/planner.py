@@ -0,0 +1,396 @@
+"""
+Dose-timing optimizer: intake times and doses that maximize the mean
+Bio-Score over a target window.
+
+A schedule picks one option per candidate substance: either an intake
+(time tau, dose D) from the candidate grid or "skip" (optional
+substances). Superposition is linear with per-intake cut-offs, so every
+option's contribution to each load array is computed once on the
+evaluation grid:
+
+  L_key(schedule)  = base_key + SUM_s contrib_s,key[option_s]      (T,)
+
+base_key holds the already logged intakes (incl. elimination lookback).
+A block of S schedules is scored by gathering and adding option rows,
+which gives (S, T) arrays, followed by the compute_bio_score composite:
+
+  score = clip(circadian + min(30, 30*L_elv) + min(25, 25*L_mph)
+               + min(15, 15*L_caff) + sleep_mod + hrv_pen, 0, 100)
+  objective = mean(score over window_start..window_end)
+
+Constraints, evaluated on every grid point from the earliest candidate
+time up to sleep time:
+
+  - no DDI warning that the logged intakes alone would not raise at
+    that point (vectorized mirror of evaluate_ddi_rules)
+  - caffeine ng/ml at sleep time <= the residual limit (if the logged
+    intakes alone exceed it, the request is answered "infeasible" with a
+    reason; the limit is never relaxed)
+
+The option space is the product of the options of all substances,
+capped at PLAN_MAX_OPTION_SPACE (the API rejects larger requests up front).
+Schedules are addressed by a mixed-radix rank, so blocks can be
+enumerated on workers without materialising the product. Up to
+PLAN_MAX_CANDIDATES the search is exhaustive. Beyond that a seeded
+random sample is scored and the best schedules are refined by coordinate
+descent. From PLAN_POOL_MIN_CANDIDATES schedules on, the blocks fan out
+over the shared process pool. The best candidates are finally re-checked
+with the exact curve engine (curve_points: score, DDI warnings) before
+one is returned.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+from app.config import (
+    PK_MC_WORKERS,
+    PLAN_MAX_CANDIDATES,
+    PLAN_MAX_OPTION_SPACE,
+    PLAN_POOL_MIN_CANDIDATES,
+    USER_WEIGHT_KG,
+)
+from app.core.bio_engine import (
+    LEVEL_CUTOFF,
+    LOAD_SPECS,
+    NGML_CUTOFF,
+    sleep_quality_modifier,
+)
+from app.core.curve_engine import (
+    circadian_base_score_array,
+    compute_curve_arrays,
+    curve_points,
+    ddi_flag_arrays,
+    normalized_shape_array,
+)
+from app.core.intake_series import (
+    SUBSTANCE_CODES,
+    US_PER_HOUR,
+    IntakeSeries,
+    to_epoch_us,
+    us_to_hours,
+)
+from app.core.process_pool import get_pool
+
+# Intake substances the optimizer may schedule
+PLAN_SUBSTANCES = ("elvanse", "medikinet", "medikinet_retard", "mate")
+
+# Load arrays a scheduled intake can change
+_PLAN_KEYS = (
+    "elvanse_level", "medikinet_ir_level", "medikinet_retard_level", "caffeine_level",
+    "elvanse_ng_ml", "medikinet_ir_ng_ml", "medikinet_retard_ng_ml", "caffeine_ng_ml",
+)
+_BLOCK = 4096        # schedules per (S, T) batch
+_TOP_K = 32          # feasible schedules kept per block / re-checked exactly
+_REFINE_STARTS = 4   # coordinate-descent starts when sampling
+
+
+class PlanOption:
+    """One choice for a candidate substance: intake at `time` with `dose_mg`, or skip."""
+
+    __slots__ = ("substance", "time", "dose_mg")
+
+    def __init__(self, substance: str, time: Optional[datetime], dose_mg: float):
+        self.substance = substance
+        self.time = time
+        self.dose_mg = dose_mg
+
+    def as_row(self) -> dict:
+        return {"substance": self.substance, "timestamp": self.time.isoformat(),
+                "dose_mg": self.dose_mg}
+
+
+def candidate_options(substance: str, doses: list[float], earliest: datetime,
+                      latest: datetime, step_minutes: int,
+                      optional: bool = True) -> list[PlanOption]:
+    """All (time, dose) options on the candidate grid, plus skip if optional."""
+    options = [PlanOption(substance, None, 0.0)] if optional else []
+    t = earliest
+    while t <= latest:
+        options.extend(PlanOption(substance, t, float(d)) for d in doses)
+        t += timedelta(minutes=step_minutes)
+    return options
+
+
+# ── Vectorized scoring (top-level: runs in pool workers) ─────────────
+
+def _digits(ranks: np.ndarray, radices: np.ndarray) -> np.ndarray:
+    """Mixed-radix decode: ranks (S,) -> option index per substance (S, n_sub)."""
+    out = np.empty((len(ranks), len(radices)), dtype=np.int64)
+    rest = ranks.astype(np.int64)
+    for i, radix in enumerate(radices):
+        out[:, i] = rest % radix
+        rest = rest // radix
+    return out
+
+
+def _hrv_penalty_array(hrv_ms: Optional[float], resting_hr: Optional[float],
+                       stim: np.ndarray) -> np.ndarray:
+    """Vectorized hrv_penalty for fixed vitals."""
+    if hrv_ms is None:
+        return np.zeros_like(stim)
+    penalty = np.select(
+        [(hrv_ms < 20) & (stim > 0.5), (hrv_ms < 30) & (stim > 0.5),
+         (hrv_ms < 40) & (stim > 0.3), (hrv_ms < 50) & (stim > 0.5)],
+        [-15.0, -10.0, -5.0, -3.0], 0.0,
+    )
+    if resting_hr is not None:
+        if resting_hr > 100:
+            penalty = penalty - 8.0
+        elif resting_hr > 90:
+            penalty = penalty - 5.0 * (stim > 0.3)
+    return np.maximum(-15.0, penalty)
+
+
+def _ddi_flags(a: dict[str, np.ndarray], fixed: dict[str, np.ndarray],
+               weight_kg: float) -> np.ndarray:
+    """DDI rule flags (rule, ..., T); codein / paracetamol come from the logged intakes."""
+    return np.stack(np.broadcast_arrays(*ddi_flag_arrays({**a, **fixed}, weight_kg).values()))
+
+
+def _evaluate(payload: dict, digits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(objective (S,), feasible (S,)) for option indices (S, n_sub)."""
+    a = {}
+    for key in _PLAN_KEYS:
+        total = np.broadcast_to(payload["base"][key], (len(digits), payload["n_times"])).copy()
+        for i, contrib in enumerate(payload["contrib"]):
+            rows = contrib.get(key)
+            if rows is not None:
+                total += rows[digits[:, i]]
+        a[key] = total
+
+    elv = a["elvanse_level"]
+    med = a["medikinet_ir_level"] + a["medikinet_retard_level"]
+    caff = a["caffeine_level"]
+    stim = np.maximum(elv, med)
+    raw = (payload["circadian"] + np.minimum(30.0, elv * 30.0) + np.minimum(25.0, med * 25.0)
+           + np.minimum(15.0, caff * 15.0) + payload["sleep_mod"]
+           + _hrv_penalty_array(payload["hrv_ms"], payload["resting_hr"], stim))
+    score = np.clip(raw, 0.0, 100.0)
+    objective = score[:, payload["score_mask"]].mean(axis=1)
+
+    flags = _ddi_flags(a, payload["fixed"], payload["weight_kg"])
+    new_warning = (flags & ~payload["ddi_base"][:, None, :]).any(axis=(0, 2))
+    caffeine_ok = a["caffeine_ng_ml"][:, -1] <= payload["caffeine_limit"]
+    return objective, ~new_warning & caffeine_ok
+
+
+def _score_block(payload: dict, ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Best _TOP_K feasible (ranks, objectives) of a rank block."""
+    best_r = np.zeros(0, dtype=np.int64)
+    best_s = np.zeros(0)
+    for lo in range(0, len(ranks), _BLOCK):
+        chunk = ranks[lo:lo + _BLOCK]
+        objective, feasible = _evaluate(payload, _digits(chunk, payload["radices"]))
+        best_r = np.concatenate([best_r, chunk[feasible]])
+        best_s = np.concatenate([best_s, objective[feasible]])
+        if len(best_r) > _TOP_K:
+            keep = np.argsort(-best_s, kind="stable")[:_TOP_K]
+            best_r, best_s = best_r[keep], best_s[keep]
+    return best_r, best_s
+
+
+def _refine(payload: dict, digits: np.ndarray) -> tuple[np.ndarray, float]:
+    """Coordinate descent: re-pick one substance's option at a time while it improves."""
+    digits = digits.copy()
+    objective, feasible = _evaluate(payload, digits[None, :])
+    best = float(objective[0]) if feasible[0] else -math.inf
+    improved = True
+    while improved:
+        improved = False
+        for i, radix in enumerate(payload["radices"]):
+            trial = np.repeat(digits[None, :], radix, axis=0)
+            trial[:, i] = np.arange(radix)
+            objective, feasible = _evaluate(payload, trial)
+            objective = np.where(feasible, objective, -math.inf)
+            j = int(np.argmax(objective))
+            if objective[j] > best + 1e-9:
+                best, digits = float(objective[j]), trial[j]
+                improved = True
+    return digits, best
+
+
+# ── Driver ───────────────────────────────────────────────────────────
+
+def _option_arrays(options: list[PlanOption], grid_us: np.ndarray,
+                   weight_kg: float) -> dict[str, np.ndarray]:
+    """Per-option contribution rows (n_options, T), same cut-offs as compute_curve_arrays."""
+    code = SUBSTANCE_CODES[options[0].substance]
+    taus = np.array([to_epoch_us(o.time) if o.time else 0 for o in options], dtype=np.int64)
+    doses = np.array([o.dose_mg for o in options])
+    active = np.array([o.time is not None for o in options])
+    d_us = grid_us[None, :] - taus[:, None]
+
+    out = {}
+    for spec, with_level in LOAD_SPECS:
+        if spec.code != code:
+            continue
+        # Time since onset = intake + absorption lag, as in compute_curve_arrays
+        onset_us = d_us - round(spec.lag_h * US_PER_HOUR)
+        on = (onset_us >= 0) & active[:, None]
+        shape = normalized_shape_array(spec, us_to_hours(onset_us))
+        f = (doses * spec.dose_scale / spec.ref_dose_mg)[:, None]
+        level = shape * f
+        conc = level * spec.cmax(weight_kg)
+        if with_level:
+            out[f"{spec.name}_level"] = np.where(on & (level > LEVEL_CUTOFF), level, 0.0)
+        out[f"{spec.name}_ng_ml"] = np.where(on & (conc > NGML_CUTOFF), conc, 0.0)
+    return out
+
+
+def _plan_grid(window_start: datetime, window_end: datetime, sleep_at: datetime,
+               earliest: datetime, interval_minutes: int) -> list[datetime]:
+    """Grid aligned to window_start, from before the earliest option up to sleep time."""
+    step = timedelta(minutes=interval_minutes)
+    t = window_start
+    while t > earliest:
+        t -= step
+    times = []
+    while t < sleep_at:
+        times.append(t)
+        t += step
+    times.append(sleep_at)
+    return times
+
+
+def _warning_types(points: list[dict]) -> list[set]:
+    return [{w["type"] for w in p["warnings"]} for p in points]
+
+
+def optimize_plan(
+    window_start: datetime,
+    window_end: datetime,
+    sleep_at: datetime,
+    candidates: list[list[PlanOption]],
+    base_intakes: list[dict],
+    caffeine_limit_ng_ml: float,
+    sleep_duration_min: Optional[float] = None,
+    sleep_confidence: Optional[float] = None,
+    hrv_ms: Optional[float] = None,
+    resting_hr: Optional[float] = None,
+    weight_kg: float = USER_WEIGHT_KG,
+    interval_minutes: int = 15,
+    seed: int = 0,
+) -> dict:
+    """
+    Best feasible schedule (see module docstring). `candidates` holds the
+    option list of each substance (candidate_options); `base_intakes` are
+    the logged intake rows that stay fixed.
+    """
+    t_start = time.perf_counter()
+    total = math.prod(len(opts) for opts in candidates)
+    if total > PLAN_MAX_OPTION_SPACE:
+        raise ValueError(f"Option space too large: {total} schedules (max {PLAN_MAX_OPTION_SPACE})")
+    earliest = min([o.time for opts in candidates for o in opts if o.time] + [window_start])
+    times = _plan_grid(window_start, window_end, sleep_at, earliest, interval_minutes)
+    grid_us = np.array([to_epoch_us(t) for t in times], dtype=np.int64)
+    hours = np.array([t.hour + t.minute / 60.0 for t in times])
+    score_mask = np.array([window_start <= t <= window_end for t in times])
+
+    base_rows = list(base_intakes)
+    base = compute_curve_arrays(times, IntakeSeries.from_rows(base_rows), weight_kg)
+    fixed = {key: base[key] for key in ("codein_ng_ml", "paracetamol_24h_mg")}
+    payload = {
+        "radices": np.array([len(opts) for opts in candidates], dtype=np.int64),
+        "n_times": len(times),
+        "base": {key: base[key] for key in _PLAN_KEYS},
+        "contrib": [_option_arrays(opts, grid_us, weight_kg) for opts in candidates],
+        "circadian": circadian_base_score_array(hours),
+        "sleep_mod": sleep_quality_modifier(sleep_duration_min, sleep_confidence),
+        "hrv_ms": hrv_ms,
+        "resting_hr": resting_hr,
+        "fixed": fixed,
+        "ddi_base": _ddi_flags(base, fixed, weight_kg),
+        "weight_kg": weight_kg,
+        "caffeine_limit": caffeine_limit_ng_ml,
+        "score_mask": score_mask,
+    }
+    vitals = (sleep_duration_min, sleep_confidence, hrv_ms, resting_hr, weight_kg)
+    window_idx = np.flatnonzero(score_mask)
+
+    # The logged intakes alone already exceed the caffeine limit: no schedule can meet it
+    base_caffeine = float(base["caffeine_ng_ml"][-1])
+    if base_caffeine > caffeine_limit_ng_ml:
+        base_points = curve_points(times, base, *vitals)
+        return {
+            "status": "infeasible",
+            "reason": (f"Logged intakes leave {base_caffeine:.0f} ng/ml caffeine at sleep time "
+                       f"(limit {caffeine_limit_ng_ml:.0f})"),
+            "schedule": [],
+            "baseline_mean_score": round(float(np.mean([base_points[i]["score"] for i in window_idx])), 2),
+            "caffeine_at_sleep_ng_ml": round(base_caffeine, 1),
+            "candidates_total": total,
+            "candidates_scored": 0,
+            "exhaustive": False,
+            "workers": 0,
+            "elapsed_ms": round((time.perf_counter() - t_start) * 1000.0, 1),
+        }
+
+    # Candidate ranks: exhaustive or seeded sample
+    exhaustive = total <= PLAN_MAX_CANDIDATES
+    if exhaustive:
+        ranks = np.arange(total, dtype=np.int64)
+    else:
+        ranks = np.random.default_rng(seed).choice(total, PLAN_MAX_CANDIDATES, replace=False)
+
+    n_workers = min(PK_MC_WORKERS, max(1, len(ranks) // max(1, PLAN_POOL_MIN_CANDIDATES)))
+    if len(ranks) < PLAN_POOL_MIN_CANDIDATES or n_workers < 2:
+        best_r, best_s = _score_block(payload, ranks)
+    else:
+        blocks = np.array_split(ranks, n_workers)
+        parts = list(get_pool().map(_score_block, [payload] * len(blocks), blocks))
+        best_r = np.concatenate([r for r, _ in parts])
+        best_s = np.concatenate([s for _, s in parts])
+
+    order = np.argsort(-best_s, kind="stable")
+    ranked = [tuple(d) for d in _digits(best_r[order], payload["radices"]).tolist()]
+    if not exhaustive:
+        refined = [_refine(payload, np.array(d)) for d in ranked[:_REFINE_STARTS]]
+        ranked = [tuple(d.tolist()) for d, s in sorted(refined, key=lambda x: -x[1])
+                  if s > -math.inf] + ranked
+
+    # Exact re-check with the curve engine
+    base_points = curve_points(times, base, *vitals)
+    base_types = _warning_types(base_points)
+    checked = set()
+    result = None
+    for digits in ranked[:_TOP_K + _REFINE_STARTS]:
+        if digits in checked:
+            continue
+        checked.add(digits)
+        chosen = [candidates[i][j] for i, j in enumerate(digits)]
+        plan_rows = [o.as_row() for o in chosen if o.time is not None]
+        arrays = compute_curve_arrays(times, IntakeSeries.from_rows(base_rows + plan_rows), weight_kg)
+        points = curve_points(times, arrays, *vitals)
+        if any(types - before for types, before in zip(_warning_types(points), base_types)):
+            continue
+        if arrays["caffeine_ng_ml"][-1] > payload["caffeine_limit"] + 1e-9:
+            continue
+        result = {
+            "schedule": [
+                {"substance": o.substance, "time": o.time.isoformat(timespec="minutes"),
+                 "dose_mg": o.dose_mg}
+                for o in sorted((o for o in chosen if o.time is not None), key=lambda o: o.time)
+            ],
+            "mean_score": round(float(np.mean([points[i]["score"] for i in window_idx])), 2),
+            "caffeine_at_sleep_ng_ml": round(float(arrays["caffeine_ng_ml"][-1]), 1),
+            "window_scores": [
+                {"timestamp": points[i]["timestamp"], "score": points[i]["score"]}
+                for i in window_idx
+            ],
+        }
+        break
+
+    return {
+        "status": "ok" if result else "infeasible",
+        **(result or {"schedule": []}),
+        "baseline_mean_score": round(float(np.mean([base_points[i]["score"] for i in window_idx])), 2),
+        "candidates_total": total,
+        "candidates_scored": int(len(ranks)),
+        "exhaustive": exhaustive,
+        "workers": n_workers if len(ranks) >= PLAN_POOL_MIN_CANDIDATES else 1,
+        "elapsed_ms": round((time.perf_counter() - t_start) * 1000.0, 1),
+    }
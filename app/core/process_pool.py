@@ -0,0 +1,31 @@
+"""
+Shared worker-process pool for CPU-heavy NumPy fan-out (Monte Carlo
+bands, dose-plan search). Created lazily, sized by PK_MC_WORKERS, and
+shut down with the API.
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.config import PK_MC_WORKERS
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=PK_MC_WORKERS)
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    """Stop the worker processes (called on API shutdown)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
@@ -0,0 +1,276 @@
+"""
+In-process caches for Bio-Score results (API process only).
+
+DayCurveCache -- per-day curve load arrays, delta-updated on intake changes.
+ScoreMemo     -- LRU of single-point Bio-Score results.
+
+Superposition is linear, and every per-intake cut-off (level > 0.005,
+ng/ml > 0.01) applies to that intake's own contribution. A day's load
+arrays are therefore an exact sum of independent per-intake vectors:
+
+  L_day(t) = SUM_k c_k(t)      insert: L += c_new      delete: L -= c_old
+
+A new or deleted intake costs one single-intake evaluation on the grid
+instead of re-superposing the whole day. A repeated curve request only
+reuses the arrays and runs the per-point finalisation (score, phase, DDI);
+the DDI timeline and the phase timeline are derived from the same arrays
+(the phase segments are kept with the entry until the next delta).
+The finalised points are cached as well while the vitals inputs
+(sleep, as-of joined HRV / resting HR) stay the same.
+
+Subtraction can leave float residue. A non-zero sum is always >= one
+cut-off (0.005), so anything below 1e-9 is snapped back to 0. An entry is
+also rebuilt from the DB after CURVE_CACHE_MAX_DELTAS deltas.
+
+ScoreMemo keys a compute_bio_score result by everything it depends on:
+
+  (minute bucket, intake fingerprint, weight, health snapshot id, ...)
+
+The fingerprint hashes (id, timestamp, dose) of the intakes in the
+lookback window, so an entry can never outlive its inputs; the memo is
+additionally cleared on every intake, weight or health write.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, Iterable, Optional
+
+import numpy as np
+
+from app.config import CURVE_CACHE_DAYS, CURVE_CACHE_MAX_DELTAS, SCORE_MEMO_SIZE, USER_WEIGHT_KG
+from app.core.curve_engine import (
+    compute_curve_arrays,
+    curve_points,
+    day_grid,
+    day_window,
+    ddi_intervals,
+    phase_segments,
+    vitals_asof,
+    vitals_series,
+)
+from app.core.database import query_intakes
+from app.core.intake_series import IntakeSeries
+
+_SNAP_ZERO = 1e-9
+
+
+class _DayEntry:
+    __slots__ = ("times", "arrays", "start", "end", "weight_kg", "deltas",
+                 "vitals", "points", "phases")
+
+    def __init__(self, times: list[datetime], arrays: dict[str, np.ndarray],
+                 start: str, end: str, weight_kg: float):
+        self.times = times
+        self.arrays = arrays
+        self.start = start
+        self.end = end
+        self.weight_kg = weight_kg
+        self.deltas = 0
+        self.vitals: Optional[tuple] = None
+        self.points: Optional[list[dict]] = None
+        self.phases: Optional[list[dict]] = None
+
+
+class DayCurveCache:
+    """LRU of day curves keyed by (day, interval, weight); see module docstring."""
+
+    def __init__(self, max_entries: int = CURVE_CACHE_DAYS,
+                 max_deltas: int = CURVE_CACHE_MAX_DELTAS):
+        self.max_entries = max_entries
+        self.max_deltas = max_deltas
+        self._entries: OrderedDict[tuple, _DayEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.deltas = 0
+
+    # ── Lookup ───────────────────────────────────────────────────────
+
+    def points(
+        self,
+        date: datetime,
+        interval_minutes: int = 15,
+        weight_kg: float = USER_WEIGHT_KG,
+        sleep_duration_min: Optional[float] = None,
+        sleep_confidence: Optional[float] = None,
+        hrv_ms: Optional[float] = None,
+        resting_hr: Optional[float] = None,
+        snapshots: Optional[list[dict]] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> list[dict]:
+        """
+        Same result as curve_engine.generate_day_curve, served from the cache.
+        With `snapshots`, HRV / resting HR are as-of joined onto the grid.
+        `fields` selects point fields: projected from the cached full points
+        if they are current, otherwise finalised lazily (not cached).
+        """
+        with self._lock:
+            entry = self._entry(date, interval_minutes, weight_kg)
+            if snapshots is not None:
+                joined = vitals_asof(entry.times, vitals_series(snapshots))
+                hrv_ms, resting_hr = tuple(joined["hrv"]), tuple(joined["resting_hr"])
+            vitals = (sleep_duration_min, sleep_confidence, hrv_ms, resting_hr)
+            if fields is not None:
+                fields = frozenset(fields)
+                if entry.points is None or entry.vitals != vitals:
+                    return curve_points(entry.times, entry.arrays, *vitals, weight_kg,
+                                        fields=fields)
+                return [{k: v for k, v in p.items() if k in fields} for p in entry.points]
+            if entry.points is None or entry.vitals != vitals:
+                entry.points = curve_points(entry.times, entry.arrays, *vitals, weight_kg)
+                entry.vitals = vitals
+            return list(entry.points)
+
+    def ddi_timeline(
+        self,
+        date: datetime,
+        interval_minutes: int = 15,
+        weight_kg: float = USER_WEIGHT_KG,
+    ) -> list[dict]:
+        """DDI warning intervals of the day (curve_engine.ddi_intervals) on the cached arrays."""
+        with self._lock:
+            entry = self._entry(date, interval_minutes, weight_kg)
+            return ddi_intervals(entry.times, entry.arrays, weight_kg)
+
+    def phases(
+        self,
+        date: datetime,
+        interval_minutes: int = 15,
+        weight_kg: float = USER_WEIGHT_KG,
+    ) -> list[dict]:
+        """
+        Phase timeline of the day (curve_engine.phase_segments), kept with the
+        entry. The exact level crossings need the intakes, re-read with the
+        entry's bounds after a delta.
+        """
+        with self._lock:
+            entry = self._entry(date, interval_minutes, weight_kg)
+            if entry.phases is None:
+                intakes = IntakeSeries.from_rows(query_intakes(entry.start, entry.end))
+                entry.phases = phase_segments(entry.times, entry.arrays, intakes, entry.weight_kg)
+            return [dict(seg) for seg in entry.phases]
+
+    def _entry(self, date: datetime, interval_minutes: int, weight_kg: float) -> _DayEntry:
+        """Cached entry for the day, (re)built if missing or too many deltas. Caller holds the lock."""
+        key = (date.strftime("%Y-%m-%d"), interval_minutes, weight_kg)
+        entry = self._entries.get(key)
+        if entry is None or entry.deltas > self.max_deltas:
+            self.misses += 1
+            entry = self._build(date, interval_minutes, weight_kg)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def _build(date: datetime, interval_minutes: int, weight_kg: float) -> _DayEntry:
+        start, end = day_window(date, weight_kg)
+        times = day_grid(date, interval_minutes)
+        intakes = IntakeSeries.from_rows(query_intakes(start, end))
+        return _DayEntry(times, compute_curve_arrays(times, intakes, weight_kg),
+                         start, end, weight_kg)
+
+    # ── Delta updates ────────────────────────────────────────────────
+
+    def add_intake(self, row: Optional[dict]) -> None:
+        """Add a freshly inserted intake_events row to every cached day it falls into."""
+        self._apply(row, 1.0)
+
+    def remove_intake(self, row: Optional[dict]) -> None:
+        """Subtract a deleted intake_events row (pass the row as read before DELETE)."""
+        self._apply(row, -1.0)
+
+    def _apply(self, row: Optional[dict], sign: float) -> None:
+        if not row:
+            return
+        single = IntakeSeries.from_rows([row])
+        if not len(single):  # substance without PK model ("other")
+            return
+        ts = row["timestamp"]
+        with self._lock:
+            for entry in self._entries.values():
+                # Same string bounds (day + lookback) as the query that built the entry
+                if not (entry.start <= ts <= entry.end):
+                    continue
+                contrib = compute_curve_arrays(entry.times, single, entry.weight_kg)
+                for name, vec in contrib.items():
+                    arr = entry.arrays[name]
+                    arr += sign * vec
+                    if sign < 0:
+                        arr[arr < _SNAP_ZERO] = 0.0
+                entry.deltas += 1
+                entry.points = None
+                entry.phases = None
+                self.deltas += 1
+
+    # ── Maintenance ──────────────────────────────────────────────────
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "deltas": self.deltas,
+        }
+
+
+def intake_fingerprint(rows: list[dict]) -> int:
+    """Hash of (id, timestamp, dose) over intake_events rows (ScoreMemo key part)."""
+    return hash(tuple((r.get("id"), r.get("timestamp"), r.get("dose_mg")) for r in rows))
+
+
+class ScoreMemo:
+    """LRU of compute_bio_score results keyed by their inputs; see module docstring."""
+
+    def __init__(self, max_entries: int = SCORE_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], dict]) -> dict:
+        """Memoized result for key; compute() runs outside the lock on a miss."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return copy.deepcopy(result)
+            self.misses += 1
+        result = compute()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = copy.deepcopy(result)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self) -> None:
+        """Drop every entry (intake, weight or health write)."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Shared instances for the API routes
+day_curves = DayCurveCache()
+score_memo = ScoreMemo()
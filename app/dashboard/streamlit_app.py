@@ -14,6 +14,11 @@ import plotly.graph_objects as go
 import streamlit as st
 import os
 
+try:
+    import pyarrow as pa
+except ImportError:  # optional: Arrow IPC for the history views
+    pa = None
+
 # --- Config ---
 API_BASE = os.getenv("BIO_API_URL", "http://localhost:8000")
 API_KEY = os.getenv("BIO_API_KEY", "")
@@ -40,6 +45,21 @@ def api_post(path: str, data: dict) -> dict:
         return {}
 
 
+def api_get_frame(path: str, params: dict | None = None) -> pd.DataFrame:
+    """GET a table endpoint as DataFrame: Arrow IPC when pyarrow is installed, JSON rows otherwise."""
+    if pa is None:
+        data = api_get(path, params)
+        return pd.DataFrame(data) if isinstance(data, list) else pd.DataFrame()
+    try:
+        headers = {**HEADERS, "accept": "application/vnd.apache.arrow.stream"}
+        r = httpx.get(f"{API_BASE}{path}", params=params, headers=headers, timeout=10)
+        r.raise_for_status()
+        return pa.ipc.open_stream(r.content).read_pandas()
+    except Exception as e:
+        st.error(f"API Error: {e}")
+        return pd.DataFrame()
+
+
 def api_delete(path: str) -> dict:
     try:
         r = httpx.delete(f"{API_BASE}{path}", headers=HEADERS, timeout=10)
@@ -772,11 +792,10 @@ elif current_page == "kurven":
     date = st.date_input("Datum", value=datetime.now().date(), key="tl_date")
     date_str = date.isoformat()
 
-    curve_data = api_get("/api/bio-score/curve", {"date": date_str, "interval": 15})
+    curve_data = api_get("/api/bio-score/curve", {"date": date_str, "interval": 15, "format": "columnar"})
 
-    if isinstance(curve_data, dict) and "points" in curve_data:
-        points = curve_data["points"]
-        df = pd.DataFrame(points)
+    if isinstance(curve_data, dict) and "columns" in curve_data:
+        df = pd.DataFrame(curve_data["columns"])
 
         if not df.empty:
             df["time"] = pd.to_datetime(df["timestamp"])
@@ -826,6 +845,26 @@ elif current_page == "kurven":
             if is_today:
                 _vmark(fig, datetime.now(), "#F44336", "solid", 2, "Jetzt")
 
+            # DDI risk windows
+            ddi = api_get("/api/ddi-check", {"timeline": "true", "date": date_str, "interval": 15})
+            if isinstance(ddi, dict) and "timeline" in ddi:
+                for w in ddi["timeline"]["intervals"]:
+                    color = "rgba(244,67,54,0.12)" if w["severity"] == "critical" else "rgba(255,193,7,0.12)"
+                    fig.add_vrect(
+                        x0=w["start"], x1=w["end"],
+                        fillcolor=color, line_width=0, layer="below",
+                        annotation_text=w["title"], annotation_position="top left",
+                        annotation_font=dict(size=9),
+                    )
+                upcoming = ddi["timeline"]["upcoming"]
+                if is_today and upcoming:
+                    now_iso = datetime.now().isoformat()
+                    st.warning(" · ".join(
+                        f"{w['title']} bis {w['end'][11:16]}" if w["start"] <= now_iso
+                        else f"{w['title']} ab {w['start'][11:16]}"
+                        for w in upcoming
+                    ))
+
             # Intake markers
             day_intakes = api_get("/api/intake", {"start": f"{date_str}T00:00:00", "end": f"{date_str}T23:59:59"})
             if isinstance(day_intakes, list):
@@ -856,6 +895,32 @@ elif current_page == "kurven":
             )
             mobile_chart(fig, height=420)
 
+            # -- Phasen-Timeline (Intervalle vom Server) --
+            phases = api_get("/api/bio-score/phases", {"date": date_str})
+            if isinstance(phases, dict) and phases.get("segments"):
+                phase_colors = {
+                    "sleep": "#37474F", "waking": "#78909C", "baseline": "#9E9E9E",
+                    "midday-dip": "#8D6E63", "wind-down": "#5C6BC0",
+                    "low-residual": "#90CAF9", "declining": "#42A5F5",
+                    "active-focus": "#1E88E5", "peak-focus": "#0D47A1",
+                }
+                fig_ph = go.Figure()
+                for seg in phases["segments"]:
+                    start_ts, end_ts = pd.to_datetime(seg["start"]), pd.to_datetime(seg["end"])
+                    fig_ph.add_trace(go.Bar(
+                        x=[(end_ts - start_ts).total_seconds() * 1000], y=["Phase"],
+                        base=[start_ts], orientation="h",
+                        marker_color=phase_colors.get(seg["phase"], "#9E9E9E"),
+                        name=seg["phase"], showlegend=False,
+                        hovertext=f"{seg['phase']}: {seg['start'][11:16]}–{seg['end'][11:16]}",
+                        hoverinfo="text",
+                    ))
+                fig_ph.update_layout(barmode="overlay", xaxis=dict(type="date"),
+                                     yaxis=dict(showticklabels=False))
+                mobile_chart(fig_ph, height=120)
+                if phases.get("current"):
+                    st.caption(f"Aktuelle Phase: {phases['current']}")
+
             # -- Substanz-Level + ZNS-Last --
             st.subheader("Substanz-Level & ZNS-Belastung")
             st.caption(
@@ -903,6 +968,47 @@ elif current_page == "kurven":
         else:
             st.info("Keine Daten")
 
+    # -- Tages-Exposition (AUC) --
+    st.divider()
+    st.subheader("Tages-Exposition (AUC)")
+    st.caption(
+        "Fläche unter der Konzentrationskurve pro Tag (ng·h/ml), "
+        "nächtlich berechnet. Letzte 30 Tage."
+    )
+    exposure = api_get("/api/exposure/daily")
+    if exposure:
+        df_exp = pd.DataFrame(exposure)
+        df_exp = df_exp[df_exp["auc_ng_h_ml"] > 0]
+        exp_colors = {
+            "elvanse": "#2196F3", "medikinet_ir": "#AB47BC",
+            "medikinet_retard": "#7E57C2", "caffeine": "#FF9800",
+            "codein": "#26A69A", "paracetamol": "#78909C",
+        }
+        exp_subs = [s for s in exp_colors if s in set(df_exp["substance"])]
+        if exp_subs:
+            sel_sub = st.selectbox("Substanz", exp_subs, key="exp_sub")
+            df_sub = df_exp[df_exp["substance"] == sel_sub]
+            fig_exp = go.Figure()
+            fig_exp.add_trace(go.Bar(
+                x=df_sub["date"], y=df_sub["auc_ng_h_ml"],
+                name="AUC", marker_color=exp_colors[sel_sub],
+            ))
+            fig_exp.add_trace(go.Scatter(
+                x=df_sub["date"], y=df_sub["time_above_h"],
+                mode="lines+markers", name="Std. über Schwelle",
+                line=dict(color="#FFC107", width=2), yaxis="y2",
+            ))
+            fig_exp.update_layout(
+                xaxis_title="Datum", yaxis_title="AUC (ng·h/ml)",
+                yaxis2=dict(title="Stunden", overlaying="y", side="right",
+                            range=[0, 24], fixedrange=True),
+            )
+            mobile_chart(fig_exp, height=320)
+        else:
+            st.info("Keine Einnahmen im Zeitraum")
+    else:
+        st.info("Noch keine Expositionsdaten (nächtlicher Job)")
+
     # PK-Erklärung (aktualisiert für 3-Stage Cascade)
     st.divider()
     st.subheader("So funktioniert das Modell")
@@ -996,9 +1102,8 @@ elif current_page == "vitals":
     st.divider()
     date = st.date_input("Tag", value=datetime.now().date(), key="v_date")
     ds = date.isoformat()
-    health = api_get("/api/health", {"start": f"{ds}T00:00:00", "end": f"{ds}T23:59:59"})
-    if isinstance(health, list) and health:
-        hdf = pd.DataFrame(health)
+    hdf = api_get_frame("/api/health", {"start": f"{ds}T00:00:00", "end": f"{ds}T23:59:59"})
+    if not hdf.empty:
         hdf["time"] = pd.to_datetime(hdf["timestamp"])
         has_source = "source" in hdf.columns
 
@@ -1187,25 +1292,12 @@ elif current_page == "korrelation":
         c1, c2 = st.columns(2)
         with c1:
             st.subheader("Elvanse vs. Fokus")
-            pairs = []
-            ei_list = [i for i in intakes_corr if i.get("substance") == "elvanse"]
-            for lg in logs_corr:
-                lt = datetime.fromisoformat(lg["timestamp"])
-                foc = lg.get("focus")
-                if foc is None:
-                    continue
-                best = None
-                for ei in ei_list:
-                    et = datetime.fromisoformat(ei["timestamp"])
-                    off = (lt - et).total_seconds() / 3600
-                    if 0 <= off <= 16:
-                        if best is None or off < best:
-                            best = off
-                if best is not None:
-                    pairs.append({"offset_h": best, "focus": foc})
-
-            if pairs:
-                pairs_df = pd.DataFrame(pairs)
+            # Server-side as-of join (latest preceding Elvanse intake, <= 16h)
+            pairs_cols = api_get("/api/model/pairs", {"start": start, "end": end})
+            if isinstance(pairs_cols, dict) and pairs_cols.get("count"):
+                pairs_df = pd.DataFrame({
+                    "offset_h": pairs_cols["offset_h"], "focus": pairs_cols["focus"],
+                })
                 fig_c = go.Figure()
                 fig_c.add_trace(go.Scatter(
                     x=pairs_df["offset_h"], y=pairs_df["focus"],
@@ -11,9 +11,13 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.config import HA_POLL_INTERVAL_SEC, HA_TOKEN
+from app.config import EXPOSURE_JOB_HOUR, HA_POLL_INTERVAL_SEC, HA_TOKEN, PK_FIT_HOUR
+from app.core.bio_engine import lut_mode, warm_shape_tables
 from app.core.database import init_db
+from app.core.exposure import run_exposure_job
 from app.core.ha_importer import poll_and_store
+from app.core.pk_fit import run_fit_job
+from app.core.process_pool import shutdown_pool
 from app.api.routes import router
 
 logging.basicConfig(
@@ -33,7 +37,34 @@ async def lifespan(app: FastAPI):
     init_db()
     log.info("Bio-Dashboard API starting")
 
-    # Start HA polling scheduler
+    # Pre-build PK lookup tables (PK_LUT_MODE=linear|cubic)
+    for name, err in warm_shape_tables().items():
+        log.info(
+            "PK LUT %s (%s): max error %.2e (bound %.2e)",
+            name, lut_mode(), err["max_error"], err["error_bound"],
+        )
+
+    # Nightly personal PK fit (skips itself when the inputs are unchanged)
+    scheduler.add_job(
+        run_fit_job,
+        "cron",
+        hour=PK_FIT_HOUR,
+        minute=30,
+        id="pk_fit",
+        replace_existing=True,
+    )
+
+    # Nightly daily exposure metrics (backfills on the first run)
+    scheduler.add_job(
+        run_exposure_job,
+        "cron",
+        hour=EXPOSURE_JOB_HOUR,
+        minute=45,
+        id="daily_exposure",
+        replace_existing=True,
+    )
+
+    # HA polling
     ha_configured = HA_TOKEN and "PASTE" not in HA_TOKEN and len(HA_TOKEN) > 20
     if ha_configured:
         scheduler.add_job(
@@ -43,7 +74,6 @@ async def lifespan(app: FastAPI):
             id="ha_poll",
             replace_existing=True,
         )
-        scheduler.start()
         log.info("HA poller scheduled every %d seconds", HA_POLL_INTERVAL_SEC)
 
         # Run one initial poll
@@ -51,11 +81,16 @@ async def lifespan(app: FastAPI):
     else:
         log.info("HA not configured -- running standalone (no health import)")
 
+    scheduler.start()
+    log.info("PK fit scheduled daily at %02d:30", PK_FIT_HOUR)
+    log.info("Daily exposure scheduled daily at %02d:45", EXPOSURE_JOB_HOUR)
+
     yield
 
     # Shutdown
     if scheduler.running:
         scheduler.shutdown(wait=False)
+    shutdown_pool()
     log.info("Bio-Dashboard API stopped")
 
 
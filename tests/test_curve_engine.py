@@ -0,0 +1,107 @@
+"""Vectorized curve engine against the scalar SubstanceSpec paths."""
+
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core import curve_engine
+from app.core.bio_engine import LOAD_SPECS, SUBSTANCES, SubstanceSpec, compute_substance_loads
+from app.core.curve_engine import (
+    curve_points,
+    day_grid,
+    ddi_intervals,
+    normalized_shape_array,
+    phase_segments,
+)
+from app.core.intake_series import IntakeSeries
+
+SPECS = list(SUBSTANCES.values()) + [
+    # Coincident rates: switched to the compartment engine
+    SubstanceSpec("elvanse", "elvanse", "cascade", (1.0, 1.0, 0.1), 40.0),
+    SubstanceSpec("caffeine", "mate", "bateman", (0.5, 0.5), 76.0),
+    # Personal-fit style rates
+    SubstanceSpec("elvanse", "elvanse", "cascade", (2.1, 0.9, 0.12), 40.0, lag_h=0.6),
+]
+TIMES = np.linspace(-1.0, 48.0, 1961)
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda s: f"{s.name}-{s.model}-{s.rates}")
+def test_normalized_shape_array_matches_scalar(spec):
+    expected = np.array([spec.normalized(t) for t in TIMES])
+    np.testing.assert_allclose(normalized_shape_array(spec, TIMES), expected, rtol=0, atol=1e-12)
+    # (T, K) grids as used by compute_curve_arrays
+    grid = normalized_shape_array(spec, TIMES.reshape(53, 37))
+    np.testing.assert_allclose(grid.ravel(), expected, rtol=0, atol=1e-12)
+
+
+def _lagged(lag_h: float) -> tuple:
+    return tuple(
+        (SubstanceSpec(spec.name, spec.intake, spec.model, spec.rates, spec.ref_dose_mg,
+                       spec.dose_scale, lag_h=lag_h, compartments=spec.compartments), with_level)
+        for spec, with_level in LOAD_SPECS
+    )
+
+
+@pytest.mark.parametrize("lag_h", [0.0, 0.45, 1.3])
+def test_compute_curve_arrays_matches_scalar_loads(monkeypatch, lag_h):
+    specs = _lagged(lag_h)
+    monkeypatch.setattr(curve_engine, "LOAD_SPECS", specs)
+    day = datetime(2026, 3, 1)
+    rows = [
+        {"id": 1, "substance": "elvanse", "dose_mg": 40, "timestamp": "2026-02-28T21:10:00"},
+        {"id": 2, "substance": "elvanse", "dose_mg": None, "timestamp": "2026-03-01T07:05:00"},
+        {"id": 3, "substance": "medikinet", "dose_mg": 10, "timestamp": "2026-03-01T13:00:00"},
+        {"id": 4, "substance": "medikinet_retard", "dose_mg": 30, "timestamp": "2026-03-01T08:20:00"},
+        {"id": 5, "substance": "mate", "dose_mg": None, "timestamp": "2026-03-01T10:00:00"},
+        {"id": 6, "substance": "co_dafalgan", "dose_mg": 500, "timestamp": "2026-03-01T12:15:00"},
+    ]
+    series = IntakeSeries.from_rows(rows)
+    times = day_grid(day, 5)
+    arrays = curve_engine.compute_curve_arrays(times, series)
+    for i, t in enumerate(times):
+        loads = compute_substance_loads(series, t, load_specs=specs)
+        for key, value in loads.items():
+            assert arrays[key][i] == pytest.approx(value, abs=1e-9), (key, t)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_phase_segments_match_point_phases(seed):
+    # Small lookback doses hit the per-intake LEVEL_CUTOFF during the day
+    rng = random.Random(seed)
+    day = datetime(2026, 3, 1)
+    rows = [
+        {"id": i, "substance": rng.choice(["elvanse", "medikinet", "medikinet_retard"]),
+         "dose_mg": rng.choice([None, 5, 10, 20, 40]),
+         "timestamp": (day + timedelta(hours=rng.uniform(-48.0, 24.0))).isoformat()}
+        for i in range(rng.randint(2, 12))
+    ]
+    series = IntakeSeries.from_rows(rows)
+    times = day_grid(day, 5)
+    arrays = curve_engine.compute_curve_arrays(times, series)
+    points = curve_points(times, arrays)
+    segments = phase_segments(times, arrays, series)
+    bounds = [(datetime.fromisoformat(s["start"]), datetime.fromisoformat(s["end"]), s["phase"])
+              for s in segments]
+    edge = timedelta(seconds=4)
+    for t, point in zip(times, points):
+        lo, hi, phase = next(b for b in bounds if b[0] <= t < b[1])
+        if t - lo > edge and hi - t > edge:
+            assert phase == point["phase"], t
+
+
+def test_ddi_intervals_end_exclusive():
+    times = day_grid(datetime(2026, 3, 1), 60)
+    zeros = np.zeros(len(times))
+    codein = zeros.copy()
+    codein[[2, 3, 4, 23]] = 5.0
+    arrays = {key: zeros for key in ("medikinet_ir_ng_ml", "medikinet_retard_ng_ml",
+                                     "caffeine_ng_ml", "paracetamol_24h_mg")}
+    arrays["elvanse_ng_ml"] = np.full(len(times), SUBSTANCES["elvanse"].cmax(80.0))
+    arrays["codein_ng_ml"] = codein
+    blockade = [(w["start"], w["end"]) for w in ddi_intervals(times, arrays, 80.0)
+                if w["type"] == "cyp2d6_blockade"]
+    # Ends on the grid point after the last firing one, also at the day end
+    assert blockade == [("2026-03-01T02:00:00", "2026-03-01T05:00:00"),
+                        ("2026-03-01T23:00:00", "2026-03-02T00:00:00")]
@@ -0,0 +1,75 @@
+"""Cumulative-dose index (IntakeSeries.window_dose) against a plain sum."""
+
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.intake_series import (
+    DEFAULT_DOSE_MG,
+    SUBSTANCE_NAMES,
+    US_PER_HOUR,
+    IntakeSeries,
+    to_epoch_us,
+)
+
+BASE = datetime(2026, 3, 1)
+
+
+def _rows(seed: int = 5, n: int = 300) -> list[dict]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        # Whole minutes, so many intakes land exactly on a window edge
+        ts = BASE + timedelta(minutes=rng.randrange(0, 7 * 24 * 60))
+        rows.append({
+            "id": i,
+            "substance": rng.choice(SUBSTANCE_NAMES),
+            "dose_mg": rng.choice([None, 0, 10, 20.5, 40]),
+            "timestamp": ts.isoformat(),
+        })
+    return rows
+
+
+def _plain_sum(rows: list[dict], substance: str, end: datetime, window_h: float) -> tuple[int, float]:
+    start = end - timedelta(hours=window_h)
+    doses = [r["dose_mg"] or DEFAULT_DOSE_MG.get(substance, 0.0) for r in rows
+             if r["substance"] == substance
+             and start <= datetime.fromisoformat(r["timestamp"]) <= end]
+    return len(doses), sum(doses)
+
+
+@pytest.mark.parametrize("window_h", [0.5, 1.0, 24.0, 72.0])
+@pytest.mark.parametrize("substance", [s for s in SUBSTANCE_NAMES if s != "other"])
+def test_window_dose_matches_plain_sum(substance, window_h):
+    rows = _rows()
+    series = IntakeSeries.from_rows(rows)
+    window_us = round(window_h * US_PER_HOUR)
+    # Ends on intake times (right edge) and one window after them (left edge)
+    ends = [datetime.fromisoformat(r["timestamp"]) for r in rows[:40]]
+    ends += [t + timedelta(hours=window_h) for t in ends] + [BASE + timedelta(days=8)]
+    for end in ends:
+        count, total = series.window_dose(substance, to_epoch_us(end), window_us)
+        exp_count, exp_total = _plain_sum(rows, substance, end, window_h)
+        assert int(count) == exp_count
+        assert float(total) == pytest.approx(exp_total, abs=1e-9)
+
+    # Vectorized over a grid: same as the scalar lookups
+    grid = np.array([to_epoch_us(t) for t in ends], dtype=np.int64)
+    counts, totals = series.window_dose(substance, grid, window_us)
+    for end, count, total in zip(ends, counts.tolist(), totals.tolist()):
+        assert (count, pytest.approx(total, abs=1e-9)) == _plain_sum(rows, substance, end, window_h)
+
+
+def test_window_edges_are_inclusive():
+    rows = [
+        {"id": 1, "substance": "mate", "dose_mg": 10, "timestamp": "2026-03-01T08:00:00"},
+        {"id": 2, "substance": "mate", "dose_mg": 20, "timestamp": "2026-03-01T09:00:00"},
+        {"id": 3, "substance": "mate", "dose_mg": 40, "timestamp": "2026-03-01T10:00:00"},
+    ]
+    series = IntakeSeries.from_rows(rows)
+    end = to_epoch_us(datetime(2026, 3, 1, 10))
+    assert series.window_dose("mate", end, 2 * US_PER_HOUR) == (3, 70.0)
+    assert series.window_dose("mate", end - 1, 2 * US_PER_HOUR) == (2, 30.0)
+    assert series.window_dose("mate", end, 2 * US_PER_HOUR - 1) == (2, 60.0)
@@ -0,0 +1,62 @@
+"""LUT shapes (PK_LUT_MODE=linear|cubic) against the analytic shapes."""
+
+import numpy as np
+import pytest
+
+from app.core import bio_engine
+from app.core.bio_engine import SUBSTANCES, SubstanceSpec, set_lut_mode
+from app.core.compartment import CompartmentModel
+
+# Distinct rates, so the linear spec has an exponential-sum form (and a table)
+_LINEAR_RATES = (1.8, 0.9, 0.15)
+SPECS = list(SUBSTANCES.values()) + [
+    SubstanceSpec("elvanse", "elvanse", "linear", _LINEAR_RATES, 40.0,
+                  compartments=CompartmentModel.chain(_LINEAR_RATES)),
+]
+TIMES = np.concatenate([np.linspace(0.0, 24.0, 2401), np.linspace(24.0, 120.0, 97)])
+
+
+@pytest.fixture(autouse=True)
+def restore_lut_mode():
+    mode = bio_engine.lut_mode()
+    yield
+    set_lut_mode(mode)
+
+
+@pytest.mark.parametrize("mode", ["linear", "cubic"])
+@pytest.mark.parametrize("spec", SPECS, ids=lambda s: f"{s.name}-{s.model}")
+def test_table_matches_analytic(spec, mode):
+    set_lut_mode(mode)
+    table = spec.table()
+    assert table is not None and table.mode == mode
+    expected = np.array([spec.normalized(t) for t in TIMES])
+    tol = table.error_bound + 1e-9
+    assert table.max_error <= tol
+    np.testing.assert_allclose(table.evaluate(TIMES), expected, rtol=0, atol=tol)
+    np.testing.assert_allclose([table(t) for t in TIMES], expected, rtol=0, atol=tol)
+    factor = spec.dose_factor(spec.ref_dose_mg)
+    np.testing.assert_allclose([spec.level(t, spec.ref_dose_mg) for t in TIMES],
+                               expected * factor, rtol=0, atol=tol * factor)
+
+
+def test_cubic_is_tighter_than_linear():
+    set_lut_mode("linear")
+    bounds = {spec.name: spec.table().error_bound for spec in SUBSTANCES.values()}
+    set_lut_mode("cubic")
+    for spec in SUBSTANCES.values():
+        assert spec.table().error_bound <= bounds[spec.name]
+
+
+def test_failed_self_check_falls_back_to_analytic(monkeypatch):
+    set_lut_mode("cubic")
+
+    def reject(*args, **kwargs):
+        raise ValueError("LUT error exceeds bound")
+
+    monkeypatch.setattr(bio_engine, "ShapeTable", reject)
+    spec = SUBSTANCES["elvanse"]
+    assert spec.table() is None
+    assert spec.shape_fn() == spec.normalized
+    assert bio_engine.warm_shape_tables() == {}
+    k_abs, k_hyd, k_e = spec.rates
+    assert bio_engine._cascade_normalized(3.0, k_abs, k_hyd, k_e) == pytest.approx(spec.normalized(3.0))
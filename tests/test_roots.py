@@ -0,0 +1,50 @@
+"""Shared root finder: exposure metrics and forecast crossings agree."""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.bio_engine import SUBSTANCES
+from app.core.exposure import ExposureCurve
+from app.core.forecast import forecast_crossings
+from app.core.intake_series import IntakeSeries, to_epoch_us, us_to_hours
+from app.core.roots import ROOT_XTOL_H, brent, find_crossings
+
+DAY = datetime(2026, 3, 1)
+ROWS = [
+    {"id": 1, "substance": "mate", "dose_mg": None, "timestamp": "2026-03-01T08:10:00"},
+    {"id": 2, "substance": "mate", "dose_mg": 150, "timestamp": "2026-03-01T13:40:00"},
+    {"id": 3, "substance": "elvanse", "dose_mg": 40, "timestamp": "2026-03-01T07:00:00"},
+]
+
+
+def test_brent_and_find_crossings():
+    assert brent(np.cos, 0.0, 3.0, 1.0, float(np.cos(3.0))) == pytest.approx(np.pi / 2, abs=ROOT_XTOL_H)
+    bounds = np.linspace(0.5, 10.0, 39)
+    crossings = find_crossings(np.sin, bounds)
+    assert [d for _, d in crossings] == ["down", "up", "down"]
+    np.testing.assert_allclose([t for t, _ in crossings], [np.pi, 2 * np.pi, 3 * np.pi],
+                               atol=ROOT_XTOL_H)
+
+
+@pytest.mark.parametrize("name", ["caffeine", "elvanse"])
+def test_time_above_matches_forecast_crossings(name):
+    spec = SUBSTANCES[name]
+    series = IntakeSeries.from_rows(ROWS)
+    tau_us, doses = series.substance(spec.code)
+    curve = ExposureCurve(spec, us_to_hours(tau_us - to_epoch_us(DAY)), doses)
+    threshold = 0.3 * spec.cmax(96.0)
+
+    result = forecast_crossings(name, threshold, DAY, 24.0, ROWS, weight_kg=96.0)
+    times = [(datetime.fromisoformat(c["time"]) - DAY).total_seconds() / 3600.0
+             for c in result["crossings"]]
+    edges = ([0.0] if result["above_at_start"] else []) + times
+    if len(edges) % 2:
+        edges.append(24.0)
+    from_crossings = sum(hi - lo for lo, hi in zip(edges[::2], edges[1::2]))
+    # Crossing times are reported to the second
+    assert curve.time_above(threshold, 0.0, 24.0) == pytest.approx(from_crossings, abs=2 / 3600)
+
+    tmax, _ = curve.peak(0.0, 24.0)
+    assert float(curve.derivative(np.array([tmax + timedelta(seconds=1).total_seconds() / 3600]))[0]) <= 0